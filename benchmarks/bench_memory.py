@@ -0,0 +1,83 @@
+"""
+Memory benchmark: parsed listings as dicts (copied by the tracker and the
+writer) versus compact ListingRecord objects passed along as is.
+
+Usage:
+    python benchmarks/bench_memory.py [--listings 10000]
+"""
+
+import argparse
+import datetime
+import json
+import sys
+import tracemalloc
+from unittest.mock import patch
+
+import xxhash
+from common import load_sample_hits, make_page
+
+from fundatracker import funda
+
+
+def dict_flow(page, search_query):
+    """Previous flow: parser dict, tracker copy and writer copy per listing."""
+    parsed = [r.to_dict() for r in funda.parse_funda_results(page, False)]
+    tracked = [{**x, "search_query": search_query} for x in parsed]
+    return (
+        [
+            {
+                "id": xxhash.xxh64(
+                    "~~".join([str(x) for x in result.values()])
+                ).hexdigest(),
+                **result,
+                "_processing_time": str(datetime.datetime.now()),
+                "_run_id": funda.run_id,
+            }
+            for result in tracked
+        ],
+        parsed,
+        tracked,
+    )
+
+
+def record_flow(page, search_query):
+    """Current flow: one record per listing, updated in place."""
+    records = funda.parse_funda_results(page, False)
+    for record in records:
+        record.search_query = search_query
+    return [funda.prepare_row(record) for record in records]
+
+
+def measure(flow, page):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    rows = flow(page, "1000~5~now-1d")
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return {"retained_bytes": current - baseline, "peak_bytes": peak - baseline}
+
+
+def run(listings):
+    page = make_page(load_sample_hits(), listings)
+    with patch.object(funda, "get_neighbourhood_insights", return_value={}):
+        results = {
+            "dict": measure(dict_flow, page),
+            "record": measure(record_flow, page),
+        }
+    for result in results.values():
+        result["retained_bytes_per_listing"] = result["retained_bytes"] // listings
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=10000)
+    args = parser.parse_args()
+
+    results = run(args.listings)
+    print(json.dumps({"listings": args.listings, **results}, indent=2))
+    reduction = (
+        1 - results["record"]["retained_bytes"] / results["dict"]["retained_bytes"]
+    )
+    print(f"Retained memory reduced by {reduction:.0%}", file=sys.stderr)
@@ -0,0 +1,125 @@
+"""
+Parser microbenchmark: listings parsed per second by the compiled, table-driven
+extractor versus the previous hand-written field lookups.
+
+Usage:
+    python benchmarks/bench_parse.py [--listings 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from common import load_sample_hits, make_page
+
+from fundatracker import funda
+
+
+def legacy_extract(listing):
+    """Field lookups as written out by hand in parse_funda_results before."""
+    listing_details = listing["_source"]
+    return funda.ListingRecord(
+        listing_id=listing["_id"],
+        agent_id=listing_details.get("agent", [{}])[0].get("id", ""),
+        agent_url=listing_details.get("agent", [{}])[0].get("relative_url", ""),
+        agent_name=listing_details.get("agent", [{}])[0].get("name", ""),
+        agent_association=listing_details.get("agent", [{}])[0].get("association", ""),
+        address_country=listing_details["address"]["country"],
+        address_province=listing_details["address"].get("province", ""),
+        address_city=listing_details["address"].get("city", ""),
+        address_neighbourhood=listing_details["address"].get("neighbourhood", ""),
+        address_municipality=listing_details["address"].get("municipality", ""),
+        address_house_number=listing_details["address"].get("house_number", ""),
+        address_house_number_suffix=listing_details["address"].get(
+            "house_number_suffix", ""
+        ),
+        address_postal_code=listing_details["address"]["postal_code"],
+        address_street_name=listing_details["address"].get("street_name", ""),
+        number_of_bedrooms=listing_details.get("number_of_bedrooms", None),
+        number_of_rooms=listing_details.get("number_of_rooms", None),
+        object_type=listing_details.get("object_type", None),
+        energy_label=listing_details.get("energy_label", None),
+        floor_area=listing_details.get("floor_area", [None])[0],
+        plot_area=listing_details.get("plot_area", [None])[0],
+        publish_date=listing_details["publish_date"],
+        url_path=listing_details["object_detail_page_relative_url"],
+        status=listing_details.get("status", ""),
+        price=listing_details["price"].get("selling_price", [None])[0],
+        price_type=listing_details["price"].get("selling_price_type", ""),
+        price_condition=listing_details["price"].get("selling_price_condition", ""),
+        placement_type=listing_details.get("placement_type", ""),
+        availability=listing_details.get("availability", ""),
+        amenities=",".join(listing_details.get("amenities", [])),
+        construction_date_range=f"{listing_details.get('construction_date_range', {}).get('gte', '')}~{listing_details.get('construction_date_range', {}).get('lte', '')}",
+        construction_period=listing_details.get("construction_period", ""),
+        construction_type=listing_details.get("construction_type", ""),
+        offering_type=listing_details.get("offering_type", ""),
+        project=listing_details.get("project", {}).get("id", ""),
+        sale_date_range=f"{listing_details.get('sale_date_range', {}).get('gte', '')}~{listing_details.get('sale_date_range', {}).get('lte', '')}",
+        selected_area=listing_details.get("selected_area", ""),
+        description=listing_details.get("description", {}).get("dutch", ""),
+        description_tags=listing_details.get("description", {}).get("tags", ""),
+        zoning=listing_details.get("zoning", ""),
+        surrounding=",".join(listing_details.get("surrounding", [])),
+        exterior_space_garden_size=listing_details.get(
+            "exterior_space_garden_size", ""
+        ),
+        exterior_space_type=listing_details.get("exterior_space_type", ""),
+        exterior_space_garden_orientation=listing_details.get(
+            "exterior_space_garden_orientation", ""
+        ),
+        garage_capacity=listing_details.get("garage_capacity", ""),
+        garage_type=listing_details.get("garage_type", ""),
+        content_hash=funda.get_content_hash(listing_details),
+    )
+
+
+def time_extractors(extractors, hits, repeat):
+    """
+    Best time of each extractor, alternating between them on every repeat.
+
+    Timing one after the other makes the ratio depend on what else the machine
+    was doing in each block, alternating exposes both to the same conditions.
+    """
+    best = {name: float("inf") for name in extractors}
+    for _ in range(repeat):
+        for name, extract in extractors.items():
+            started = time.perf_counter()
+            for hit in hits:
+                extract(hit)
+            best[name] = min(best[name], time.perf_counter() - started)
+    return {
+        name: {
+            "seconds": round(seconds, 4),
+            "listings_per_sec": round(len(hits) / seconds),
+        }
+        for name, seconds in best.items()
+    }
+
+
+def run(listings, repeat):
+    hits = funda.get_hits(make_page(load_sample_hits(), listings))
+
+    # Both extractors must produce identical records before timing them
+    for hit in hits[:200]:
+        assert legacy_extract(hit) == funda.extract_listing(hit), hit["_id"]
+
+    timings = time_extractors(
+        {"legacy": legacy_extract, "compiled": funda.extract_listing}, hits, repeat
+    )
+    return {"listings": listings, **timings}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.listings, args.repeat)
+    print(json.dumps(results, indent=2))
+    speedup = (
+        results["compiled"]["listings_per_sec"] / results["legacy"]["listings_per_sec"]
+    )
+    print(f"Compiled extractor is {speedup:.2f}x the legacy one", file=sys.stderr)
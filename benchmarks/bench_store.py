@@ -0,0 +1,158 @@
+"""
+Store benchmark: id hashing in prepare_row and database write throughput of
+store_results, row by row and batched.
+
+Writes go to a local Postgres when a DSN is given (a scratch table is created
+and dropped again), otherwise to an in-memory SQLite stand-in.
+
+Usage:
+    python benchmarks/bench_store.py [--listings 5000] [--dsn postgresql://...]
+"""
+
+import argparse
+import contextlib
+import json
+import sqlite3
+import time
+import uuid
+from unittest.mock import patch
+
+from common import best_of, make_pages
+
+from fundatracker import funda, utils
+
+# Postgres stores lists (e.g. offering_type) in VARCHAR columns as array literals
+sqlite3.register_adapter(list, lambda values: "{" + ",".join(map(str, values)) + "}")
+
+
+class SQLiteCursor:
+    """Translate the psycopg placeholders used by store_results to SQLite."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace("%s", "?"), params)
+
+    def executemany(self, query, params_seq):
+        return self._cursor.executemany(query.replace("%s", "?"), params_seq)
+
+
+class SQLiteConnection:
+    """Embedded stand-in for a psycopg connection in autocommit mode."""
+
+    def __init__(self):
+        self._conn = sqlite3.connect(":memory:", isolation_level=None)
+
+    def cursor(self):
+        return SQLiteCursor(self._conn.cursor())
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+
+def parse_pages(pages):
+    with (
+        patch.object(funda, "get_neighbourhood_insights", return_value={}),
+        patch.object(
+            funda,
+            "get_listing_insights",
+            return_value={"nrOfViews": 100, "nrOfSaves": 10},
+        ),
+    ):
+        return [funda.parse_funda_results(page) for page in pages]
+
+
+def bench_hash(records, repeat):
+    best = best_of(lambda: [funda.prepare_row(r) for r in records], repeat)
+    return {"seconds": round(best, 4), "rows_per_sec": round(len(records) / best)}
+
+
+def bench_write(connect, parsed_pages, batch, repeat):
+    """Write all pages to a fresh table `repeat` times and keep the fastest run."""
+    best = None
+    for _ in range(repeat):
+        conn, table, cleanup = connect()
+        try:
+            started = time.perf_counter()
+            counts = {"inserted": 0, "skipped": 0, "failed": 0}
+            for records in parsed_pages:
+                page_counts = funda.store_results(records, table, conn, batch)
+                for key, value in page_counts.items():
+                    counts[key] += value
+            seconds = time.perf_counter() - started
+        finally:
+            cleanup()
+        if best is None or seconds < best[0]:
+            best = (seconds, counts)
+
+    seconds, counts = best
+    rows = sum(len(records) for records in parsed_pages)
+    return {
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds),
+        **counts,
+    }
+
+
+def sqlite_connect():
+    conn = SQLiteConnection()
+    schema = funda.get_funda_schema()
+    conn.cursor().execute(
+        f"CREATE TABLE funda ({', '.join(f'{k} {v}' for k, v in schema.items())})"
+    )
+    return conn, "funda", conn.close
+
+
+def postgres_connect(dsn):
+    import psycopg
+
+    def connect():
+        conn = psycopg.connect(dsn, autocommit=True)
+        table = f"funda_bench_{uuid.uuid4().hex[:8]}"
+        utils.db_setup(table, funda.get_funda_schema(), conn)
+
+        def cleanup():
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.close()
+
+        return conn, table, cleanup
+
+    return connect
+
+
+def run(listings, repeat=3, dsn=None):
+    parsed_pages = parse_pages(make_pages(listings))
+    records = [record for records in parsed_pages for record in records]
+    connect = postgres_connect(dsn) if dsn else sqlite_connect
+
+    return {
+        "backend": "postgres" if dsn else "sqlite",
+        "hash": bench_hash(records, repeat),
+        "write_rows": bench_write(connect, parsed_pages, False, repeat),
+        "write_batch": bench_write(connect, parsed_pages, True, repeat),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dsn", type=str, default=None)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.listings, args.repeat, args.dsn), indent=2))
@@ -0,0 +1,57 @@
+"""Shared helpers to build synthetic result pages for the benchmarks."""
+
+import copy
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+SAMPLES_DIR = os.path.join(ROOT_DIR, "samples")
+
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+sys.path.insert(0, ROOT_DIR)
+
+
+def load_sample_hits():
+    """Load the hits of the old and new format samples and the test fixtures."""
+    from tests.fixtures import SAMPLE_RESPONSE
+
+    hits = []
+    for name in ["full-hit-result-new.json", "full-hit-result-old.json"]:
+        with open(os.path.join(SAMPLES_DIR, name)) as f:
+            sample = json.load(f)
+        results = (
+            sample["responses"][0] if "responses" in sample else sample["search_result"]
+        )
+        hits += results["hits"]["hits"]
+    return hits + SAMPLE_RESPONSE["responses"][0]["hits"]["hits"]
+
+
+def make_page(hits, n, offset=0):
+    """Build a response with n listings, cycling through the sample hits."""
+    listings = []
+    for i in range(offset, offset + n):
+        hit = copy.deepcopy(hits[i % len(hits)])
+        hit["_id"] = str(i)
+        listings.append(hit)
+    return {"responses": [{"hits": {"total": {"value": n}, "hits": listings}}]}
+
+
+def make_pages(listings, page_size=100):
+    """Build enough pages of `page_size` listings to hold `listings` listings."""
+    hits = load_sample_hits()
+    return [
+        make_page(hits, min(page_size, listings - offset), offset)
+        for offset in range(0, listings, page_size)
+    ]
+
+
+def best_of(func, repeat):
+    """Run func `repeat` times and return the fastest wall clock time."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
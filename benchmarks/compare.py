@@ -0,0 +1,58 @@
+"""
+Compare two benchmark result files written by `benchmarks/run.py`.
+
+Throughput metrics (`*_per_sec`) are higher-is-better, time and memory
+metrics lower-is-better. Exits with status 1 when any metric regressed by
+more than the threshold.
+
+Usage:
+    python benchmarks/compare.py baseline.json current.json [--threshold 0.1]
+"""
+
+import argparse
+import json
+import sys
+
+# Only these metrics are compared, the others depend on the run size
+METRICS = ("listings_per_sec", "rows_per_sec", "retained_bytes_per_listing")
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    for bench, metrics in current["results"].items():
+        for metric in METRICS:
+            if metric not in metrics or metric not in baseline["results"].get(
+                bench, {}
+            ):
+                continue
+
+            before = baseline["results"][bench][metric]
+            after = metrics[metric]
+            change = (after - before) / before if before else 0.0
+            # Throughput should go up, memory should go down
+            regression = -change if metric.endswith("_per_sec") else change
+
+            status = "REGRESSION" if regression > threshold else "ok"
+            print(f"{bench}.{metric}: {before} -> {after} ({change:+.1%}) {status}")
+            if status != "ok":
+                regressions.append(f"{bench}.{metric}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"Comparing {baseline.get('commit')} with {current.get('commit')}")
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,343 @@
+"""
+Local stand-in for the Funda search and insights hosts, to run `tracker` end to
+end without touching Funda.
+
+Modes:
+    synthetic  Generate `_msearch` pages for a universe of `--listings` listings
+               (filtered on availability, zoning and type like the real search)
+               and insights for every listing and neighbourhood.
+    record     Forward every request to the real hosts and store the responses
+               in `--recordings`.
+    replay     Serve the responses stored in `--recordings`, falling back to
+               synthetic responses for requests that weren't recorded.
+
+Latency (`--latency_ms`, `--jitter_ms`) and errors (`--error_rate`,
+`--error_status`, `--retry_after`) are injected in synthetic and replay mode.
+
+Usage:
+    python benchmarks/fake_funda.py --mode synthetic --listings 50000 --port 8080
+    FUNDA_SEARCH_URL=http://localhost:8080 FUNDA_INSIGHTS_URL=http://localhost:8080 \\
+        python -m fundatracker --postal_code 1000 --km_radius 5
+"""
+
+import argparse
+import collections
+import copy
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import xxhash
+from common import load_sample_hits
+
+from fundatracker import funda
+from fundatracker.client import FundaClient
+
+NEIGHBOURHOODS = ["Centrum", "Oost", "West", "Noord", "Zuid", "Nieuw-West"]
+
+
+def get_request_key(method, path, body):
+    """Key of a recorded response, the same request always gets the same key."""
+    return xxhash.xxh64(f"{method} {path}\n{body}").hexdigest()
+
+
+class Recordings:
+    """Recorded responses, one JSON file per distinct request."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, method, path, body):
+        try:
+            with open(self._path(get_request_key(method, path, body))) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, method, path, body, status, response_body):
+        key = get_request_key(method, path, body)
+        recording = {
+            "method": method,
+            "path": path,
+            "body": body,
+            "status": status,
+            "response": response_body,
+        }
+        tmp_path = f"{self._path(key)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(recording, f)
+        os.replace(tmp_path, self._path(key))
+
+
+class FakeFunda:
+    """
+    Request handling shared by all server threads.
+
+    Listing `i` of the synthetic universe gets its availability, zoning and
+    type from its index, so sliced searches return disjoint subsets that add
+    up to the unsliced search, and listings are numbered from 1 so ids are
+    stable between runs.
+    """
+
+    def __init__(
+        self,
+        mode="synthetic",
+        recordings=None,
+        listings=1000,
+        page_size=15,
+        latency_ms=0.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        error_status=503,
+        retry_after=None,
+        seed=None,
+    ):
+        if mode in ("record", "replay") and recordings is None:
+            raise ValueError(f"Mode {mode} needs a recordings directory")
+
+        self.mode = mode
+        self.recordings = recordings
+        self.listings = listings
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.stats = collections.Counter()
+        self._random = random.Random(seed)
+        self._matches = {}
+        self._lock = threading.Lock()
+        self._templates = load_sample_hits()
+        self._upstream = {}
+        if mode == "record":
+            self._upstream = {
+                "search": FundaClient(
+                    funda.DEFAULT_SEARCH_URL, headers=funda.search_client.headers
+                ),
+                "insights": FundaClient(
+                    funda.DEFAULT_INSIGHTS_URL, headers=funda.insights_client.headers
+                ),
+            }
+
+    def handle(self, method, path, body):
+        """
+        Answer a single request.
+
+        Returns:
+            tuple: Status code, headers dict and response body
+        """
+        endpoint = "search" if path.startswith(funda.SEARCH_PATH) else "insights"
+        with self._lock:
+            self.stats[f"{endpoint}_requests"] += 1
+            delay_ms = max(self._random.gauss(self.latency_ms, self.jitter_ms), 0)
+            fail = self._random.random() < self.error_rate
+
+        if self.mode == "record":
+            return self._record(endpoint, method, path, body)
+
+        time.sleep(delay_ms / 1000)
+        if fail:
+            with self._lock:
+                self.stats["injected_errors"] += 1
+            headers = {}
+            if self.retry_after is not None:
+                headers["Retry-After"] = str(self.retry_after)
+            return self.error_status, headers, "Injected error"
+
+        if self.mode == "replay":
+            recording = self.recordings.load(method, path, body)
+            if recording is not None:
+                with self._lock:
+                    self.stats["replayed"] += 1
+                return recording["status"], {}, recording["response"]
+
+        if endpoint == "search":
+            return 200, {}, json.dumps(self.search(body))
+        return self.insights(path)
+
+    def _record(self, endpoint, method, path, body):
+        res = self._upstream[endpoint].request(method, path, data=body or None)
+        self.recordings.save(method, path, body, res.status_code, res.text)
+        with self._lock:
+            self.stats["recorded"] += 1
+        return res.status_code, {}, res.text
+
+    def listing_filters(self, i):
+        return {
+            "availability": funda.AVAILABILITY[i % len(funda.AVAILABILITY)],
+            "zoning": funda.ZONING[(i // 3) % len(funda.ZONING)],
+            "type": funda.LISTING_TYPES[(i // 6) % len(funda.LISTING_TYPES)],
+        }
+
+    def make_hit(self, i):
+        hit = copy.deepcopy(self._templates[i % len(self._templates)])
+        hit["_id"] = str(i + 1)
+        source = hit["_source"]
+        filters = self.listing_filters(i)
+        source["availability"] = filters["availability"]
+        source["zoning"] = filters["zoning"]
+        source["type"] = filters["type"]
+        source.setdefault("address", {})["neighbourhood"] = NEIGHBOURHOODS[
+            i % len(NEIGHBOURHOODS)
+        ]
+        if isinstance(source.get("price"), dict):
+            source["price"]["selling_price"] = [200000 + (i % 500) * 1000]
+        return hit
+
+    def search(self, body):
+        """Answer an `_msearch` body with one response per search."""
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        return {
+            "responses": [
+                self.search_page(query_line.get("params", {}))
+                for query_line in lines[1::2]
+            ]
+        }
+
+    def get_matches(self, availability, zoning, listing_type):
+        """Indexes of the listings matching the filters, cached per filter."""
+        key = (availability, zoning, listing_type)
+        if key not in self._matches:
+            wanted = {
+                "availability": availability,
+                "zoning": zoning,
+                "type": listing_type,
+            }
+            self._matches[key] = [
+                i
+                for i in range(self.listings)
+                if all(
+                    value in wanted[name]
+                    for name, value in self.listing_filters(i).items()
+                )
+            ]
+        return self._matches[key]
+
+    def search_page(self, params):
+        start_index = params.get("page", {}).get("from", 0)
+        if start_index + self.page_size > funda.ES_MAX_RESULT_WINDOW:
+            return {
+                "error": {
+                    "type": "illegal_argument_exception",
+                    "reason": "Result window is too large, from + size must be "
+                    f"less than or equal to: [{funda.ES_MAX_RESULT_WINDOW}]",
+                },
+                "status": 400,
+            }
+
+        matches = self.get_matches(
+            tuple(params.get("availability") or funda.AVAILABILITY),
+            tuple(params.get("zoning") or funda.ZONING),
+            tuple(params.get("type") or funda.LISTING_TYPES),
+        )
+        page = matches[start_index : start_index + self.page_size]
+        return {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(matches), "relation": "eq"},
+                "max_score": None,
+                "hits": [self.make_hit(i) for i in page],
+            },
+            "status": 200,
+        }
+
+    def insights(self, path):
+        if path.startswith("/v1/objectinsights/"):
+            listing_id = int(path.rsplit("/", 1)[-1] or 0)
+            insights = {
+                "nrOfViews": 100 + listing_id % 900,
+                "nrOfSaves": listing_id % 50,
+            }
+        elif path.startswith("/v2/LocalInsights/preview/"):
+            insights = {
+                "inhabitants": 10000,
+                "averageAskingPricePerM2": 5500,
+                "familiesWithChildren": 25,
+            }
+        else:
+            return 404, {}, "Not found"
+        return 200, {}, json.dumps(insights)
+
+
+def make_server(fake, host="127.0.0.1", port=8080):
+    """Create a threaded HTTP server for `fake`, port 0 picks a free port."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode() if length else ""
+            status, headers, response_body = fake.handle(self.command, self.path, body)
+
+            payload = response_body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = _respond
+        do_POST = _respond
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} {format % args}")
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--mode", choices=["synthetic", "record", "replay"], default="synthetic"
+    )
+    parser.add_argument("--recordings", type=str, default=None)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--listings", type=int, default=1000)
+    parser.add_argument("--page_size", type=int, default=15)
+    parser.add_argument("--latency_ms", type=float, default=0.0)
+    parser.add_argument("--jitter_ms", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--error_status", type=int, default=503)
+    parser.add_argument("--retry_after", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    fake = FakeFunda(
+        mode=args.mode,
+        recordings=Recordings(args.recordings) if args.recordings else None,
+        listings=args.listings,
+        page_size=args.page_size,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = make_server(fake, args.host, args.port)
+    url = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Serving fake Funda ({args.mode}) on {url}")
+    print(f"export FUNDA_SEARCH_URL={url} FUNDA_INSIGHTS_URL={url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(fake.stats)))
+
+
+if __name__ == "__main__":
+    main()
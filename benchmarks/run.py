@@ -0,0 +1,77 @@
+"""
+Run the offline benchmark suite and write the results as JSON, so runs can be
+compared between commits with `benchmarks/compare.py`.
+
+Usage:
+    python benchmarks/run.py [--listings 5000] [--output bench.json] [--dsn ...]
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+import bench_memory
+import bench_parse
+import bench_store
+from common import ROOT_DIR, best_of, make_pages
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_parse_pages(listings, repeat):
+    """Time parse_funda_results on pages of 100 listings with insights stubbed."""
+    pages = make_pages(listings)
+    best = best_of(lambda: bench_store.parse_pages(pages), repeat)
+    return {"seconds": round(best, 4), "listings_per_sec": round(listings / best)}
+
+
+def run(listings, repeat, dsn=None):
+    store = bench_store.run(listings, repeat, dsn)
+    memory = bench_memory.run(listings)
+    return {
+        "parse_pages": bench_parse_pages(listings, repeat),
+        "extract": bench_parse.run(listings, repeat)["compiled"],
+        "hash": store["hash"],
+        f"write_rows_{store['backend']}": store["write_rows"],
+        f"write_batch_{store['backend']}": store["write_batch"],
+        "memory": memory["record"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dsn", type=str, default=None)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    report = {
+        "commit": get_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "listings": args.listings,
+        "results": run(args.listings, args.repeat, args.dsn),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Wrote benchmark results to {args.output}", file=sys.stderr)
+    else:
+        print(output)
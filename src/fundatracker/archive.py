@@ -0,0 +1,166 @@
+import datetime
+import glob
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import funda
+
+try:
+    import zstandard
+except ImportError:  # Optional, install with `fundatracker[archive]`
+    zstandard = None
+
+ARCHIVE_SUFFIX = ".ndjson.zst"
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError(
+            "Archiving responses requires zstandard, install fundatracker[archive]"
+        )
+
+
+class ResponseArchive:
+    """
+    Store raw search responses, so they can be parsed again without crawling.
+
+    Every page is written to its own zstd compressed NDJSON file, partitioned
+    like the Parquet output, e.g.
+    `{directory}/run_date=2025-01-31/search_query=1011~5~now-30d/run_id=.../
+    page-000001.ndjson.zst`. Each line holds the page's metadata and the
+    response as returned by `get_results`.
+    """
+
+    def __init__(self, directory, run_date=None, level=3):
+        _require_zstandard()
+        self.directory = directory
+        self.run_date = run_date or datetime.date.today()
+        self.level = level
+        self.pages_written = 0
+
+    def run_dir(self, search_query):
+        return os.path.join(
+            self.directory,
+            f"run_date={self.run_date.isoformat()}",
+            f"search_query={search_query}",
+            f"run_id={funda.get_run_id()}",
+        )
+
+    def write(self, search_query, start_index, res, slice_key="*"):
+        directory = self.run_dir(search_query)
+        os.makedirs(directory, exist_ok=True)
+        self.pages_written += 1
+        path = os.path.join(directory, f"page-{self.pages_written:06d}{ARCHIVE_SUFFIX}")
+
+        line = {
+            "run_id": funda.get_run_id(),
+            "search_query": search_query,
+            "slice_key": slice_key,
+            "start_index": start_index,
+            "fetched_at": str(datetime.datetime.now()),
+            "response": res,
+        }
+        data = (json.dumps(line) + "\n").encode()
+        compressed = zstandard.ZstdCompressor(level=self.level).compress(data)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return path
+
+    def archive_pages(self, pages, search_query):
+        """Archive every (slice key, start index, response) page it passes on."""
+        for slice_key, start_index, res in pages:
+            self.write(search_query, start_index, res, slice_key=slice_key)
+            yield slice_key, start_index, res
+
+
+def read_archive_file(path):
+    """Read the archived pages (metadata and response dicts) of a file."""
+    _require_zstandard()
+    with open(path, "rb") as f:
+        with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            data = reader.read()
+    return [json.loads(line) for line in data.decode().splitlines() if line]
+
+
+def find_archive_files(directory, run_date=None, search_query=None):
+    """List archived files, optionally for a single run date and/or search."""
+    pattern = os.path.join(
+        directory,
+        f"run_date={run_date or '*'}",
+        f"search_query={glob.escape(search_query) if search_query else '*'}",
+        "run_id=*",
+        f"*{ARCHIVE_SUFFIX}",
+    )
+    return sorted(glob.glob(pattern))
+
+
+def reparse_archive_file(path):
+    """
+    Parse the archived pages of a file, runs in a worker process.
+
+    Insights aren't fetched, so reparsing never makes a request.
+
+    Returns:
+        list: Parsed listings with their original search query
+    """
+    parsed_results = []
+    for page in read_archive_file(path):
+        results = funda.parse_funda_results(
+            page["response"],
+            use_listing_insights=False,
+            use_neighbourhood_insights=False,
+        )
+        for listing in results:
+            listing.search_query = page["search_query"]
+        parsed_results += results
+    return parsed_results
+
+
+def reprocess(paths, sink, processes=None):
+    """
+    Parse archived responses again and write them through `sink`.
+
+    Files are parsed in parallel on a process pool, by default one process
+    per core, and written in their original order by this process.
+
+    Args:
+        paths: Archive files, e.g. from `find_archive_files`
+        sink: Sink to write the parsed listings to
+        processes: Number of worker processes
+
+    Returns:
+        dict: Number of files, listings and rows inserted/skipped/failed
+    """
+    totals = {"files": 0, "listings": 0, "inserted": 0, "skipped": 0, "failed": 0}
+    if not paths:
+        logging.info("No archived responses to reprocess.")
+        return totals
+
+    processes = processes or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (processes * 4))
+    logging.info(f"Reprocessing {len(paths)} archived pages on {processes} processes")
+
+    # Spawn workers, forking a process with running threads can deadlock them
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        results = executor.map(reparse_archive_file, paths, chunksize=chunksize)
+        for path, parsed_results in zip(paths, results, strict=True):
+            counts = sink.write(parsed_results)
+            totals["files"] += 1
+            totals["listings"] += len(parsed_results)
+            for result, count in counts.items():
+                totals[result] += count
+            logging.debug(f"Reprocessed {path}: {counts}")
+
+    logging.info(
+        f"Reprocessed {totals['listings']} listings from {totals['files']} pages: "
+        f"{totals['inserted']} new rows, {totals['skipped']} existing rows, "
+        f"{totals['failed']} failed."
+    )
+    return totals
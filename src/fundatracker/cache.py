@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Time to live in seconds per endpoint. Neighbourhood statistics are only
+# updated monthly, listing views and saves change throughout the day.
+DEFAULT_TTLS = {
+    "listing_insights": 6 * 60 * 60,
+    "neighbourhood_insights": 30 * 24 * 60 * 60,
+}
+
+
+class InsightsCache:
+    """
+    Two-tier cache for insight responses.
+
+    A bounded in-memory LRU sits in front of an optional SQLite file, so
+    cached responses survive between runs (e.g. the Dockerfile loop that
+    starts a new process for every postal code). Entries expire per
+    namespace according to `ttls`. Every `purge_every` writes expired
+    entries are dropped from disk and it is trimmed to `max_disk_entries`,
+    so the file stays bounded in long running processes.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        max_entries=10000,
+        max_disk_entries=500_000,
+        ttls=None,
+        purge_every=1000,
+    ):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.purge_every = purge_every
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+
+        if path:
+            self.open(path)
+
+    def open(self, path):
+        """Attach (and create if needed) the on-disk SQLite tier."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            if self._db:
+                self._db.close()
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS insights_cache(
+                    namespace TEXT,
+                    key TEXT,
+                    value TEXT,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            self._db.commit()
+
+        self.purge_expired()
+        logging.debug(f"Opened insights cache at {path}")
+
+    def close(self):
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+    def get(self, namespace, key):
+        """Return the cached value, or None when missing or expired."""
+        cache_key = (namespace, str(key))
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(cache_key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[cache_key]
+                self.stats["expirations"] += 1
+
+            if self._db:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM insights_cache WHERE namespace = ? AND key = ?",
+                    cache_key,
+                ).fetchone()
+                if row and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(cache_key, row[1], value)
+                    self.stats["disk_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, namespace, key, value):
+        cache_key = (namespace, str(key))
+        expires_at = time.time() + self.ttls.get(namespace, 0)
+
+        with self._lock:
+            self._remember(cache_key, expires_at, value)
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO insights_cache VALUES (?, ?, ?, ?)",
+                    (*cache_key, json.dumps(value), expires_at),
+                )
+                self._db.commit()
+                self._writes += 1
+                if self._writes % self.purge_every == 0:
+                    self._purge()
+
+    def clear(self, namespace=None):
+        """Remove all entries, or only those of a single namespace, from both tiers."""
+        with self._lock:
+            if namespace is None:
+                self._memory.clear()
+            else:
+                for cache_key in [k for k in self._memory if k[0] == namespace]:
+                    del self._memory[cache_key]
+
+            if self._db:
+                if namespace is None:
+                    self._db.execute("DELETE FROM insights_cache")
+                else:
+                    self._db.execute(
+                        "DELETE FROM insights_cache WHERE namespace = ?", (namespace,)
+                    )
+                self._db.commit()
+
+    def purge_expired(self):
+        """Drop expired entries from disk and trim it to `max_disk_entries`."""
+        with self._lock:
+            if self._db:
+                self._purge()
+
+    def _purge(self):
+        # Caller must hold the lock
+        cursor = self._db.execute(
+            "DELETE FROM insights_cache WHERE expires_at <= ?", (time.time(),)
+        )
+        self.stats["expirations"] += cursor.rowcount
+
+        if self.max_disk_entries:
+            cursor = self._db.execute(
+                """
+                DELETE FROM insights_cache WHERE rowid IN (
+                    SELECT rowid FROM insights_cache
+                    ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_disk_entries,),
+            )
+            self.stats["evictions"] += cursor.rowcount
+
+        self._db.commit()
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return hits / lookups if lookups else 0.0
+
+    def _remember(self, cache_key, expires_at, value):
+        # Caller must hold the lock
+        self._memory[cache_key] = (expires_at, value)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
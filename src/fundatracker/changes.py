@@ -0,0 +1,284 @@
+import datetime
+import json
+import sys
+import threading
+
+from . import funda
+
+# Fields of a listing whose changes are reported as events
+STATE_FIELDS = ("price", "status", "availability")
+
+LISTING_STATE_COLUMNS = {
+    "listing_id": "VARCHAR(100)",
+    "price": "INTEGER",
+    "status": "VARCHAR(100)",
+    "availability": "VARCHAR(100)",
+    "content_hash": "VARCHAR(100)",
+    "updated_at": "TIMESTAMP",
+}
+
+LISTING_EVENTS_COLUMNS = {
+    "listing_id": "VARCHAR(100)",
+    "event": "VARCHAR(20)",
+    "changes": "VARCHAR(100)",
+    "price": "INTEGER",
+    "previous_price": "INTEGER",
+    "status": "VARCHAR(100)",
+    "previous_status": "VARCHAR(100)",
+    "availability": "VARCHAR(100)",
+    "previous_availability": "VARCHAR(100)",
+    "url_path": "VARCHAR(500)",
+    "search_query": "VARCHAR(500)",
+    "observed_at": "TIMESTAMP",
+    "_run_id": "VARCHAR(100)",
+}
+
+
+def setup_listing_state_table(conn, table="funda_listing_state"):
+    """Create the table with the current state of every listing."""
+    conn.cursor().execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table}(
+            listing_id VARCHAR(100) PRIMARY KEY,
+            price INTEGER,
+            status VARCHAR(100),
+            availability VARCHAR(100),
+            content_hash VARCHAR(100),
+            updated_at TIMESTAMP
+        )
+        """
+    )
+
+
+def setup_listing_events_table(conn, table="funda_listing_events"):
+    """Create the table with the change events of listings."""
+    columns = ", ".join(f"{k} {v}" for k, v in LISTING_EVENTS_COLUMNS.items())
+    conn.cursor().execute(
+        f"CREATE TABLE IF NOT EXISTS {table}(id BIGSERIAL PRIMARY KEY, {columns})"
+    )
+    conn.cursor().execute(
+        f"CREATE INDEX IF NOT EXISTS {table}_observed_at_idx ON {table}(observed_at)"
+    )
+    conn.cursor().execute(
+        f"CREATE INDEX IF NOT EXISTS {table}_listing_id_idx ON {table}(listing_id)"
+    )
+
+
+def load_listing_state(conn, table, listing_ids):
+    """
+    Load the current state of listings in one query.
+
+    Returns:
+        dict: Listing id mapped to its `price`, `status`, `availability`,
+            `content_hash` and `updated_at`
+    """
+    if not listing_ids:
+        return {}
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT {", ".join(LISTING_STATE_COLUMNS)}
+        FROM {table}
+        WHERE listing_id = ANY(%s)
+        """,
+        (list(listing_ids),),
+    )
+    return {
+        row[0]: dict(zip(list(LISTING_STATE_COLUMNS)[1:], row[1:], strict=True))
+        for row in cursor.fetchall()
+    }
+
+
+def get_listing_state_query(table):
+    # An older state (e.g. of a slower worker) never replaces a newer one
+    return f"""
+        INSERT INTO {table}({", ".join(LISTING_STATE_COLUMNS)})
+        VALUES ({", ".join(["%s"] * len(LISTING_STATE_COLUMNS))})
+        ON CONFLICT (listing_id) DO UPDATE SET
+            price = EXCLUDED.price,
+            status = EXCLUDED.status,
+            availability = EXCLUDED.availability,
+            content_hash = EXCLUDED.content_hash,
+            updated_at = EXCLUDED.updated_at
+        WHERE {table}.updated_at IS NULL OR {table}.updated_at <= EXCLUDED.updated_at
+    """
+
+
+def get_listing_events_query(table):
+    return f"""
+        INSERT INTO {table}({", ".join(LISTING_EVENTS_COLUMNS)})
+        VALUES ({", ".join(["%s"] * len(LISTING_EVENTS_COLUMNS))})
+    """
+
+
+def store_listing_state(states, table, conn):
+    """
+    Store the new state of changed listings.
+
+    Args:
+        states: Tuples in `LISTING_STATE_COLUMNS` order
+        table: Table with the current state of every listing
+        conn: Database connection
+
+    Returns:
+        int: Number of listings stored
+    """
+    if not states:
+        return 0
+
+    conn.cursor().executemany(get_listing_state_query(table), states)
+    return len(states)
+
+
+def store_listing_events(events, table, conn):
+    """Store change events, tuples in `LISTING_EVENTS_COLUMNS` order."""
+    if not events:
+        return 0
+
+    conn.cursor().executemany(get_listing_events_query(table), events)
+    return len(events)
+
+
+class ListingChanges:
+    """
+    Turn stored pages into price, status and availability change events.
+
+    The current state of every listing (its `STATE_FIELDS` and content hash)
+    is kept next to the listings, through `Sink.load_listing_state` and
+    `Sink.write_listing_state`. Every stored page is compared with the state
+    of its listings: a listing without a state is `listed`, one whose fields
+    differ is `changed`. Events are written with `Sink.write_listing_events`
+    and appended to an NDJSON file at `events_path` (`-` for stdout).
+
+    States written by this process are also kept in memory until the sink
+    has stored them, so writes still queued by a background sink are taken
+    into account. Processes storing the same listing at the same time may
+    both report its change.
+    """
+
+    def __init__(self, events_path=None):
+        self.events_path = events_path
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get_changes(self, records, stored, now=None):
+        """
+        Compare parsed listings with their stored state.
+
+        Args:
+            records: Parsed listing records of a page
+            stored: Listing id mapped to its state, like `load_listing_state`
+            now: Time of the observation
+
+        Returns:
+            tuple: New states and events, as tuples in `LISTING_STATE_COLUMNS`
+                and `LISTING_EVENTS_COLUMNS` order
+        """
+        now = now or datetime.datetime.now()
+        stored = dict(stored)
+        states = []
+        events = []
+        for record in records:
+            listing_id = record["listing_id"]
+            current = {field: record[field] for field in STATE_FIELDS}
+            previous = stored.get(listing_id)
+            changes = []
+            if previous is not None:
+                changes = [
+                    field for field in STATE_FIELDS if previous[field] != current[field]
+                ]
+                if not changes and previous["content_hash"] == record["content_hash"]:
+                    continue
+
+            state = {
+                **current,
+                "content_hash": record["content_hash"],
+                "updated_at": now,
+            }
+            # Later records of the same listing compare with this one
+            stored[listing_id] = state
+            states.append((listing_id, *state.values()))
+            if previous is not None and not changes:
+                continue
+
+            previous = previous or {}
+            events.append(
+                (
+                    listing_id,
+                    "changed" if changes else "listed",
+                    ",".join(changes) or None,
+                    current["price"],
+                    previous.get("price"),
+                    current["status"],
+                    previous.get("status"),
+                    current["availability"],
+                    previous.get("availability"),
+                    record["url_path"],
+                    record["search_query"],
+                    now,
+                    funda.get_run_id(),
+                )
+            )
+        return states, events
+
+    def record(self, records, sink, now=None):
+        """
+        Find and store the change events of a stored page.
+
+        Returns:
+            list: Events, as tuples in `LISTING_EVENTS_COLUMNS` order
+        """
+        listing_ids = list({record["listing_id"] for record in records})
+        if not listing_ids:
+            return []
+
+        with self._lock:
+            stored = sink.load_listing_state(listing_ids)
+            for listing_id in listing_ids:
+                state = self._states.get(listing_id)
+                known = stored.get(listing_id)
+                if state is not None and (
+                    known is None or known["updated_at"] <= state["updated_at"]
+                ):
+                    stored[listing_id] = state
+
+            states, events = self.get_changes(records, stored, now)
+            for listing_id, *values in states:
+                self._states[listing_id] = dict(
+                    zip(list(LISTING_STATE_COLUMNS)[1:], values, strict=True)
+                )
+            sink.write_listing_state(states)
+            sink.write_listing_events(events)
+            self.write_stream(events)
+        # Outside the lock, sinks writing synchronously call it right away
+        sink.after_stored(lambda: self._forget(states))
+        return events
+
+    def _forget(self, states):
+        """Drop stored states from memory, unless a newer one replaced them."""
+        with self._lock:
+            for listing_id, *values in states:
+                state = self._states.get(listing_id)
+                if state is not None and state["updated_at"] == values[-1]:
+                    del self._states[listing_id]
+
+    def write_stream(self, events):
+        """Append events to the NDJSON file, one JSON object per line."""
+        if not self.events_path or not events:
+            return
+
+        lines = "".join(
+            json.dumps(
+                dict(zip(LISTING_EVENTS_COLUMNS, event, strict=True)),
+                default=datetime.datetime.isoformat,
+            )
+            + "\n"
+            for event in events
+        )
+        if self.events_path == "-":
+            sys.stdout.write(lines)
+            sys.stdout.flush()
+            return
+        with open(self.events_path, "a") as f:
+            f.write(lines)
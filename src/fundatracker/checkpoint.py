@@ -0,0 +1,128 @@
+import datetime
+import json
+import os
+import threading
+
+
+class FileCheckpointStore:
+    """
+    Checkpoints in a local JSON file.
+
+    The file is rewritten (to a temporary file that then replaces it) after
+    every stored page, so a crash never leaves a partially written file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, checkpoints):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoints, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self, search_query):
+        """
+        Load the checkpoints of a search.
+
+        Returns:
+            dict: Slice key mapped to the run id, results processed and results
+                total of the last stored page of that slice
+        """
+        with self._lock:
+            return self._read().get(search_query, {})
+
+    def save(self, search_query, slice_key, results_processed, results_total, run_id):
+        with self._lock:
+            checkpoints = self._read()
+            checkpoints.setdefault(search_query, {})[slice_key] = {
+                "run_id": run_id,
+                "results_processed": results_processed,
+                "results_total": results_total,
+                "updated_at": str(datetime.datetime.now()),
+            }
+            self._write(checkpoints)
+
+    def clear(self, search_query):
+        with self._lock:
+            checkpoints = self._read()
+            if checkpoints.pop(search_query, None) is not None:
+                self._write(checkpoints)
+
+
+class PostgresCheckpointStore:
+    """Checkpoints in a Postgres table, shared by every machine using the DB."""
+
+    def __init__(self, connection, table="funda_checkpoints"):
+        self.connection = connection
+        self.table = table
+
+    def setup(self):
+        self.connection.cursor().execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table}(
+                search_query VARCHAR(300),
+                slice_key VARCHAR(200),
+                run_id VARCHAR(100),
+                results_processed INTEGER,
+                results_total INTEGER,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (search_query, slice_key)
+            )
+            """
+        )
+
+    def load(self, search_query):
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            SELECT slice_key, run_id, results_processed, results_total
+            FROM {self.table}
+            WHERE search_query = %s
+            """,
+            (search_query,),
+        )
+        return {
+            slice_key: {
+                "run_id": run_id,
+                "results_processed": results_processed,
+                "results_total": results_total,
+            }
+            for slice_key, run_id, results_processed, results_total in (
+                cursor.fetchall()
+            )
+        }
+
+    def save(self, search_query, slice_key, results_processed, results_total, run_id):
+        self.connection.cursor().execute(
+            f"""
+            INSERT INTO {self.table}(
+                search_query, slice_key, run_id, results_processed,
+                results_total, updated_at
+            )
+            VALUES (%s, %s, %s, %s, %s, now())
+            ON CONFLICT (search_query, slice_key) DO UPDATE SET
+                run_id = EXCLUDED.run_id,
+                results_processed = EXCLUDED.results_processed,
+                results_total = EXCLUDED.results_total,
+                updated_at = EXCLUDED.updated_at
+            """,
+            (search_query, slice_key, run_id, results_processed, results_total),
+        )
+
+    def clear(self, search_query):
+        self.connection.cursor().execute(
+            f"DELETE FROM {self.table} WHERE search_query = %s", (search_query,)
+        )
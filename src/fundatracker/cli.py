@@ -1,35 +1,663 @@
 import argparse
+import contextlib
+import json
+import logging
 import os
+import signal
+import sys
+import threading
 
-from . import utils
-from .funda import get_funda_schema, tracker
+from . import partitions, utils
+from .changes import (
+    ListingChanges,
+    setup_listing_events_table,
+    setup_listing_state_table,
+)
+from .checkpoint import FileCheckpointStore, PostgresCheckpointStore
+from .dedupe import get_seen_index
+from .freshness import InsightsRefreshPolicy
+from .funda import (
+    SPLIT_DIMENSIONS,
+    get_funda_schema,
+    insights_cache,
+    insights_client,
+    metrics,
+    plan_query_slices,
+    search_client,
+    setup_listing_insights_table,
+    setup_search_listings_table,
+    start_run,
+    tracker,
+)
+from .sinks import AsyncPostgresSink, ParquetSink, PostgresSink
 
 CONNECTION = None
 
 
-def cli():
+def get_connection_params():
+    return {
+        "db_name": "funda",
+        "db_user": os.environ.get("USER"),
+        "db_password": os.environ.get("PASSWORD"),
+        "db_host": os.environ.get("HOST"),
+    }
+
+
+def connect():
     print("🔌 Connecting to database...")
     global CONNECTION
-    CONNECTION = utils.get_database_connection(
-        db_name="funda",
-        db_user=os.environ.get("USER"),
-        db_password=os.environ.get("PASSWORD"),
-        db_host=os.environ.get("HOST"),
+    CONNECTION = utils.get_database_connection(**get_connection_params())
+    return CONNECTION
+
+
+def add_sink_arguments(parser):
+    parser.add_argument("--sink", choices=["postgres", "parquet"], default="postgres")
+    parser.add_argument(
+        "--output_dir", type=str, default=os.environ.get("OUTPUT_DIR", "data")
+    )
+    parser.add_argument(
+        "--history_days",
+        type=int,
+        default=90,
+        help="Days of earlier Parquet output read back, e.g. for known hashes",
+    )
+    parser.add_argument("--batch_writes", action="store_true")
+    parser.add_argument(
+        "--async_writes",
+        action="store_true",
+        help="Write to Postgres in the background while crawling continues",
+    )
+    parser.add_argument("--write_queue_pages", type=int, default=16)
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="Store listings in a table partitioned by month",
+    )
+    parser.add_argument(
+        "--retention_months",
+        type=int,
+        default=None,
+        help="Drop partitions older than this many months",
     )
 
-    utils.db_setup("funda", get_funda_schema(), CONNECTION)
 
+def maintain_partitions(args):
+    """Create the coming month's partition and drop expired ones."""
+    if args.sink != "postgres" or not args.partitioned:
+        return
+    partitions.ensure_partitions(CONNECTION, "funda")
+    if args.retention_months:
+        partitions.drop_old_partitions(CONNECTION, "funda", args.retention_months)
+
+
+def open_sink(args):
+    if args.sink == "parquet":
+        return ParquetSink(args.output_dir, history_days=args.history_days)
+
+    connect()
+    if args.partitioned:
+        partitions.setup_partitioned_table("funda", get_funda_schema(), CONNECTION)
+        maintain_partitions(args)
+    else:
+        utils.db_setup("funda", get_funda_schema(), CONNECTION)
+    setup_search_listings_table(CONNECTION)
+    setup_listing_insights_table(CONNECTION)
+    setup_listing_state_table(CONNECTION)
+    setup_listing_events_table(CONNECTION)
+    if args.async_writes:
+        return AsyncPostgresSink(
+            utils.get_conninfo(**get_connection_params()),
+            "funda",
+            max_queue_pages=args.write_queue_pages,
+            partitioned=args.partitioned,
+        )
+    return PostgresSink(
+        CONNECTION, "funda", batch=args.batch_writes, partitioned=args.partitioned
+    )
+
+
+@contextlib.contextmanager
+def open_run_sink(args):
+    """
+    Open a sink for a single run, closed when the run is done.
+
+    Runs of `serve` can run at the same time, so every run writes over a
+    connection (or background writer) of its own. Tables are set up once by
+    `open_sink`.
+    """
+    connection = None
+    if args.sink == "parquet":
+        sink = ParquetSink(args.output_dir, history_days=args.history_days)
+    elif args.async_writes:
+        sink = AsyncPostgresSink(
+            utils.get_conninfo(**get_connection_params()),
+            "funda",
+            max_queue_pages=args.write_queue_pages,
+            partitioned=args.partitioned,
+        )
+    else:
+        connection = utils.new_database_connection(**get_connection_params())
+        sink = PostgresSink(
+            connection, "funda", batch=args.batch_writes, partitioned=args.partitioned
+        )
+    try:
+        with sink:
+            yield sink
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+def add_tracker_arguments(parser):
+    """Options of a tracker run, shared by the tracker and the worker."""
+    parser.add_argument("--publication_date", type=str, default="now-30d")
+    parser.add_argument("--insights_concurrency", type=int, default=1)
+    parser.add_argument("--pages_per_request", type=int, default=1)
+    parser.add_argument("--no_split_queries", action="store_true")
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--delta", action="store_true")
+    parser.add_argument("--cache_path", type=str, default=os.environ.get("CACHE_PATH"))
+    parser.add_argument(
+        "--metrics_textfile", type=str, default=os.environ.get("METRICS_TEXTFILE")
+    )
+    parser.add_argument("--metrics_json", type=str, default=None)
+    parser.add_argument(
+        "--archive_dir", type=str, default=os.environ.get("ARCHIVE_DIR")
+    )
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument(
+        "--insights_refresh",
+        action="store_true",
+        help="Only fetch listing insights older than their maximum age",
+    )
+    parser.add_argument("--insights_max_age", type=str, default="6h")
+    parser.add_argument("--insights_new_max_age", type=str, default="1h")
+    parser.add_argument("--insights_inactive_max_age", type=str, default="7d")
+    parser.add_argument(
+        "--checkpoint_path", type=str, default=os.environ.get("CHECKPOINT_PATH")
+    )
+    parser.add_argument(
+        "--change_events",
+        action="store_true",
+        help="Record price, status and availability changes of listings",
+    )
+    parser.add_argument(
+        "--events_path",
+        type=str,
+        default=os.environ.get("EVENTS_PATH"),
+        help="Also append change events to this NDJSON file, - for stdout",
+    )
+    add_sink_arguments(parser)
+
+
+def get_tracker_kwargs(args):
+    """Open the sink, archive, checkpoints and cache of a tracker run."""
+    sink = open_sink(args)
+    archive = None
+    if args.archive_dir:
+        from .archive import ResponseArchive
+
+        archive = ResponseArchive(args.archive_dir)
+
+    if args.checkpoint_path:
+        checkpoints = FileCheckpointStore(args.checkpoint_path)
+    elif CONNECTION is not None:
+        checkpoints = PostgresCheckpointStore(CONNECTION)
+        checkpoints.setup()
+    else:
+        checkpoints = FileCheckpointStore(
+            os.path.join(args.output_dir, "checkpoints.json")
+        )
+
+    if args.cache_path:
+        insights_cache.open(args.cache_path)
+
+    refresh_policy = None
+    if args.insights_refresh:
+        refresh_policy = InsightsRefreshPolicy(
+            max_age=args.insights_max_age,
+            new_max_age=args.insights_new_max_age,
+            inactive_max_age=args.insights_inactive_max_age,
+        )
+
+    changes = None
+    if args.change_events or args.events_path:
+        changes = ListingChanges(events_path=args.events_path)
+
+    return {
+        "connection": CONNECTION,
+        "insights_concurrency": args.insights_concurrency,
+        "batch_writes": args.batch_writes,
+        "pages_per_request": args.pages_per_request,
+        "split_queries": not args.no_split_queries,
+        "pipelined": args.pipelined,
+        "delta": args.delta,
+        "metrics_textfile": args.metrics_textfile,
+        "metrics_json": args.metrics_json,
+        "sink": sink,
+        "archive": archive,
+        "checkpoints": checkpoints,
+        "resume": args.resume,
+        "refresh_policy": refresh_policy,
+        "changes": changes,
+    }
+
+
+def get_stop_event():
+    """Event that is set on SIGTERM (e.g. `docker stop`) or Ctrl+C."""
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        print(f"🛑 Received {signal.Signals(signum).name}, stopping...")
+        stop_event.set()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, stop)
+    return stop_event
+
+
+def print_stats():
+    print(f"🗃️ Insights cache: {insights_cache.stats}")
+    for name, client in [("Search", search_client), ("Insights", insights_client)]:
+        limiter = client.rate_limiter
+        print(f"🚦 {name} requests: {limiter.stats}, final rate {limiter.rate:.2f}/s")
+
+
+def track(argv):
     parser = argparse.ArgumentParser()
 
-    parser.add_argument("--postal_code", type=int, required=True)
+    parser.add_argument("--postal_code", type=int, nargs="+", required=True)
     parser.add_argument("--km_radius", type=int, required=True)
-    parser.add_argument("--publication_date", type=str, default="now-30d")
+    parser.add_argument(
+        "--seen_index",
+        choices=["set", "bloom", "none"],
+        default="set",
+        help="Skip listings found by an earlier postal code of the run",
+    )
+    parser.add_argument("--bloom_capacity", type=int, default=1_000_000)
+    add_tracker_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     print(f"🏃 Running with args: {args.__dict__}")
 
-    tracker(
-        args.postal_code, args.km_radius, args.publication_date, connection=CONNECTION
+    tracker_kwargs = get_tracker_kwargs(args)
+    seen = get_seen_index(args.seen_index, capacity=args.bloom_capacity)
+    failed = []
+    truncated = {}
+    with tracker_kwargs["sink"]:
+        for postal_code in args.postal_code:
+            try:
+                truncated_slices = tracker(
+                    postal_code,
+                    args.km_radius,
+                    args.publication_date,
+                    seen=seen,
+                    **tracker_kwargs,
+                )
+                if truncated_slices:
+                    truncated[postal_code] = truncated_slices
+            except Exception as e:
+                # Like separate runs, one failed search doesn't stop the others
+                logging.error(f"Search for postal code {postal_code} failed: {e}")
+                failed.append(postal_code)
+    if seen is not None:
+        print(f"👀 Listings seen: {len(seen)}")
+    print_stats()
+    if truncated:
+        print(f"✂️ Results past the 10,000 result window, not fetched: {truncated}")
+    if failed:
+        sys.exit(f"❌ Failed postal codes: {failed}")
+    print("🏁 Finished")
+
+
+def reprocess(argv):
+    from .archive import find_archive_files
+    from .archive import reprocess as reprocess_archive
+
+    parser = argparse.ArgumentParser(
+        prog="fundatracker reprocess",
+        description="Parse archived search responses again and write them to a sink",
+    )
+    parser.add_argument(
+        "--archive_dir",
+        type=str,
+        default=os.environ.get("ARCHIVE_DIR"),
+        required=os.environ.get("ARCHIVE_DIR") is None,
+    )
+    parser.add_argument("--run_date", type=str, default=None)
+    parser.add_argument("--search_query", type=str, default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    add_sink_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    print(f"🏃 Reprocessing with args: {args.__dict__}")
+
+    paths = find_archive_files(
+        args.archive_dir, run_date=args.run_date, search_query=args.search_query
+    )
+    with open_sink(args) as sink:
+        totals = reprocess_archive(paths, sink, processes=args.processes)
+    print(f"♻️ Reprocessed: {totals}")
+    print("🏁 Finished")
+
+
+def plan(argv):
+    from . import planner
+
+    parser = argparse.ArgumentParser(
+        prog="fundatracker plan",
+        description="Plan (postal code, radius) searches covering a region",
+    )
+    parser.add_argument(
+        "--areas",
+        type=str,
+        default=os.environ.get("POSTAL_AREAS_PATH"),
+        required=os.environ.get("POSTAL_AREAS_PATH") is None,
+        help="CSV with the postal_code, lat, lon (and province, listings) of areas",
+    )
+    parser.add_argument("--postal_codes", type=int, nargs="*", default=[])
+    parser.add_argument("--province", type=str, default=None)
+    parser.add_argument("--radii", type=int, nargs="+", default=planner.RADII)
+    parser.add_argument("--listings_per_area", type=int, default=25)
+    parser.add_argument(
+        "--listing_counts_from_db",
+        action="store_true",
+        help="Estimate listings per area from the listings stored in the last 30 days",
+    )
+    parser.add_argument("--results_per_page", type=int, default=15)
+    parser.add_argument("--pages_per_request", type=int, default=1)
+    parser.add_argument(
+        "--search_overhead",
+        type=int,
+        default=5,
+        help="Cost of an extra search in requests, higher gives fewer searches",
+    )
+    parser.add_argument("--publication_date", type=str, default="now-30d")
+    parser.add_argument(
+        "--jobs_file", type=str, default=None, help="Write the plan as serve jobs"
+    )
+    parser.add_argument("--every", type=str, default="1d")
+    parser.add_argument("--jitter", type=str, default="15m")
+    parser.add_argument(
+        "--enqueue", action="store_true", help="Queue the plan for the workers"
+    )
+
+    args = parser.parse_args(argv)
+    if not args.postal_codes and not args.province:
+        parser.error("Give --postal_codes and/or --province to cover")
+
+    areas = planner.load_postal_areas(args.areas)
+    if args.listing_counts_from_db:
+        counts = planner.load_listing_counts(connect())
+        for area in areas:
+            area.listings = counts.get(area.postal_code, area.listings)
+    targets = planner.select_targets(areas, args.postal_codes, args.province)
+
+    estimates = {
+        "listings_per_area": args.listings_per_area,
+        "results_per_page": args.results_per_page,
+        "pages_per_request": args.pages_per_request,
+    }
+    searches = planner.plan_searches(
+        areas,
+        targets,
+        radii=args.radii,
+        search_overhead=args.search_overhead,
+        **estimates,
+    )
+    cost = planner.estimate_cost(
+        searches, targets, search_rate=search_client.rate_limiter.rate, **estimates
+    )
+
+    print(f"🗺️ {len(searches)} searches cover {len(targets)} postal codes:")
+    for search in searches:
+        print(
+            f"  {search.postal_code} ~{search.km_radius}km: "
+            f"{len(search.covers)} areas, ~{search.estimated_results} results"
+        )
+    print(f"💰 Estimated cost: {cost}")
+
+    if args.jobs_file:
+        jobs = [
+            {
+                "postal_code": search.postal_code,
+                "km_radius": search.km_radius,
+                "publication_date": args.publication_date,
+                "every": args.every,
+                "jitter": args.jitter,
+            }
+            for search in searches
+        ]
+        with open(args.jobs_file, "w") as f:
+            json.dump({"jobs": jobs}, f, indent=2)
+        print(f"📝 Wrote {len(jobs)} jobs to {args.jobs_file}")
+
+    if args.enqueue:
+        from .workqueue import WorkQueue
+
+        queue = WorkQueue(connect())
+        queue.setup()
+        for search in searches:
+            queue.enqueue(search.postal_code, search.km_radius, args.publication_date)
+        print(f"📥 Queued {len(searches)} tasks, by status: {queue.counts()}")
+
+
+def enqueue(argv):
+    from .workqueue import WorkQueue
+
+    parser = argparse.ArgumentParser(
+        prog="fundatracker enqueue",
+        description="Add searches to the work queue for `fundatracker worker`",
+    )
+    parser.add_argument(
+        "--postal_codes",
+        type=int,
+        nargs="+",
+        default=[int(code) for code in os.environ.get("POSTAL_CODES", "").split()],
+    )
+    parser.add_argument("--km_radius", type=int, required=True)
+    parser.add_argument("--publication_date", type=str, default="now-30d")
+    parser.add_argument(
+        "--split_slices",
+        action="store_true",
+        help="Queue searches over the result window as one task per slice",
+    )
+    parser.add_argument("--max_attempts", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if not args.postal_codes:
+        parser.error("No postal codes given, use --postal_codes or POSTAL_CODES")
+
+    queue = WorkQueue(connect())
+    queue.setup()
+    for postal_code in args.postal_codes:
+        query = {
+            "postal_code4": postal_code,
+            "km_radius": args.km_radius,
+            "publication_date": args.publication_date,
+        }
+        slices = [(query, None)]
+        if args.split_slices:
+            slices = plan_query_slices(query)
+
+        for slice_query, _ in slices:
+            filters = {
+                dimension: slice_query[dimension]
+                for dimension, _ in SPLIT_DIMENSIONS
+                if slice_query.get(dimension)
+            }
+            queue.enqueue(
+                postal_code,
+                args.km_radius,
+                args.publication_date,
+                filters=filters,
+                max_attempts=args.max_attempts,
+            )
+        print(f"📥 Queued {len(slices)} tasks for postal code {postal_code}")
+    print(f"📋 Tasks by status: {queue.counts()}")
+
+
+def worker(argv):
+    from .workqueue import WorkQueue, get_worker_id, run_worker
+
+    parser = argparse.ArgumentParser(
+        prog="fundatracker worker",
+        description="Run searches from the work queue until stopped",
+    )
+    parser.add_argument("--worker_id", type=str, default=get_worker_id())
+    parser.add_argument("--poll_interval", type=float, default=10.0)
+    parser.add_argument("--exit_when_empty", action="store_true")
+    add_tracker_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    print(f"👷 Starting worker with args: {args.__dict__}")
+
+    # Heartbeats are sent from another thread, so the queue gets its own
+    # connection next to the one the tracker writes with
+    queue = WorkQueue(utils.new_database_connection(**get_connection_params()))
+    queue.setup()
+    tracker_kwargs = get_tracker_kwargs(args)
+    sink = tracker_kwargs["sink"]
+
+    def run_task(task):
+        maintain_partitions(args)
+        try:
+            tracker(
+                task.postal_code,
+                task.km_radius,
+                task.publication_date,
+                filters=task.filters,
+                # A retried task continues where the failed attempt stopped
+                **{**tracker_kwargs, "resume": args.resume or task.attempts > 1},
+            )
+        finally:
+            # Completes the Parquet files (or background writes) of the task
+            sink.flush()
+
+    # Finish the current task on SIGTERM (e.g. `docker stop`) or Ctrl+C
+    stop_event = get_stop_event()
+
+    stats = run_worker(
+        queue,
+        run_task,
+        worker_id=args.worker_id,
+        stop_event=stop_event,
+        poll_interval_sec=args.poll_interval,
+        exit_when_empty=args.exit_when_empty,
     )
+    print(f"👷 Worker stats: {stats}")
+    print_stats()
     print("🏁 Finished")
+
+
+def serve(argv):
+    from .scheduler import Scheduler, load_jobs
+
+    parser = argparse.ArgumentParser(
+        prog="fundatracker serve",
+        description="Keep running the searches of a jobs file on their interval",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=str,
+        default=os.environ.get("JOBS_PATH"),
+        required=os.environ.get("JOBS_PATH") is None,
+        help="JSON file with the jobs to run",
+    )
+    parser.add_argument("--max_concurrent", type=int, default=1)
+    add_tracker_arguments(parser)
+
+    args = parser.parse_args(argv)
+    jobs = load_jobs(args.jobs)
+    if not jobs:
+        parser.error(f"No jobs in {args.jobs}")
+
+    print(f"🕰️ Serving {len(jobs)} jobs with args: {args.__dict__}")
+
+    # The tables, checkpoints and caches are set up once and stay warm, every
+    # run writes with a sink of its own
+    tracker_kwargs = get_tracker_kwargs(args)
+    tracker_kwargs.pop("sink").close()
+    stop_event = get_stop_event()
+
+    def run_job(job):
+        # Every run gets its own `_run_id`, files and metrics label, also
+        # while other jobs run at the same time
+        start_run()
+        maintain_partitions(args)
+        with open_run_sink(args) as sink:
+            tracker(
+                job.postal_code,
+                job.km_radius,
+                job.publication_date,
+                filters=job.filters,
+                stop_event=stop_event,
+                # Runs interrupted by a shutdown continue on the next run
+                **{**tracker_kwargs, "sink": sink, "resume": True},
+            )
+
+    scheduler = Scheduler(
+        jobs,
+        run_job,
+        max_concurrent=args.max_concurrent,
+        stop_event=stop_event,
+        metrics=metrics,
+    )
+    stats = scheduler.run()
+    print(f"🕰️ Scheduler stats: {stats}")
+    print_stats()
+    print("🏁 Finished")
+
+
+def manage_partitions(argv):
+    parser = argparse.ArgumentParser(
+        prog="fundatracker partitions",
+        description="Manage the monthly partitions of the funda table",
+    )
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Move an existing unpartitioned funda table into partitions",
+    )
+    parser.add_argument("--months_ahead", type=int, default=1)
+    parser.add_argument("--retention_months", type=int, default=None)
+
+    args = parser.parse_args(argv)
+
+    connect()
+    if args.migrate and partitions.is_partitioned(CONNECTION, "funda") is False:
+        moved = partitions.migrate_to_partitioned(
+            CONNECTION, "funda", get_funda_schema(), months_ahead=args.months_ahead
+        )
+        print(f"🚚 Moved {moved} rows, the old table is kept as funda_unpartitioned")
+    partitions.setup_partitioned_table(
+        "funda", get_funda_schema(), CONNECTION, months_ahead=args.months_ahead
+    )
+    if args.retention_months:
+        dropped = partitions.drop_old_partitions(
+            CONNECTION, "funda", args.retention_months
+        )
+        print(f"🗑️ Dropped {len(dropped)} partitions: {dropped}")
+    for name, month in partitions.get_partitions(CONNECTION, "funda"):
+        print(f"📦 {name}: {month:%Y-%m}")
+
+
+# Subcommands, any other arguments run the tracker
+COMMANDS = {
+    "reprocess": reprocess,
+    "enqueue": enqueue,
+    "worker": worker,
+    "serve": serve,
+    "plan": plan,
+    "partitions": manage_partitions,
+}
+
+
+def cli(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    return track(argv)
@@ -0,0 +1,120 @@
+import contextlib
+import logging
+import threading
+import time
+
+from curl_cffi import requests
+
+from .ratelimit import RETRY_STATUS_CODES, parse_retry_after
+
+
+class FundaClient:
+    """
+    HTTP client for a single Funda host.
+
+    Requests go through a persistent curl_cffi session, so connections (and
+    their TLS/impersonation handshakes) are kept alive and reused. Impersonating
+    Chrome negotiates HTTP/2 where the host supports it. Sessions are not
+    thread-safe, so every request checks a session out of a pool and returns
+    it afterwards. Threads that come and go (e.g. a thread pool per page)
+    reuse the same sessions, at most `max_idle_sessions` are kept open.
+
+    With a `rate_limiter` every request waits for its turn, reports its
+    outcome back to the limiter and is retried (up to `max_retries` times,
+    with exponential backoff unless the host sends `Retry-After`) when the
+    host throttles or fails.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        headers=None,
+        impersonate="chrome",
+        timeout=30,
+        rate_limiter=None,
+        max_retries=3,
+        backoff_sec=2.0,
+        max_idle_sessions=16,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.headers = headers or {}
+        self.impersonate = impersonate
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.max_idle_sessions = max_idle_sessions
+        self._idle_sessions = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def session(self):
+        """Check a session out of the pool, a new one if none is idle."""
+        with self._lock:
+            session = self._idle_sessions.pop() if self._idle_sessions else None
+        if session is None:
+            session = requests.Session(
+                impersonate=self.impersonate,
+                headers=self.headers,
+                timeout=self.timeout,
+            )
+        try:
+            yield session
+        finally:
+            with self._lock:
+                if len(self._idle_sessions) < self.max_idle_sessions:
+                    self._idle_sessions.append(session)
+                    session = None
+            if session is not None:
+                session.close()
+
+    def request(self, method, path, **kwargs):
+        with self.session() as session:
+            return self._request(session, method, path, **kwargs)
+
+    def _request(self, session, method, path, **kwargs):
+        url = f"{self.base_url}{path}"
+        if self.rate_limiter is None:
+            return session.request(method, url, **kwargs)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                res = session.request(method, url, **kwargs)
+            except requests.RequestsError as e:
+                self.rate_limiter.observe(None, time.monotonic() - started)
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"Request to {url} failed, retrying: {e}")
+                self.rate_limiter.backoff(self.backoff_sec * 2**attempt)
+                continue
+
+            retry_after_sec = parse_retry_after(res.headers.get("Retry-After"))
+            self.rate_limiter.observe(
+                res.status_code, time.monotonic() - started, retry_after_sec
+            )
+            if res.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return res
+
+            logging.warning(
+                f"Request to {url} returned {res.status_code}, retrying "
+                f"({attempt + 1}/{self.max_retries})..."
+            )
+            if retry_after_sec is None:
+                self.rate_limiter.backoff(self.backoff_sec * 2**attempt)
+
+        return res
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        """Close the idle sessions."""
+        with self._lock:
+            sessions, self._idle_sessions = self._idle_sessions, []
+        for session in sessions:
+            session.close()
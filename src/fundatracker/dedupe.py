@@ -0,0 +1,106 @@
+import math
+import threading
+
+import xxhash
+
+
+class SeenSet:
+    """Exact run-wide index of listing ids, thread-safe."""
+
+    def __init__(self):
+        self._ids = set()
+        self._lock = threading.Lock()
+
+    def add(self, listing_id):
+        """
+        Add a listing id.
+
+        Returns:
+            bool: True if the id wasn't seen before
+        """
+        with self._lock:
+            if listing_id in self._ids:
+                return False
+            self._ids.add(listing_id)
+            return True
+
+    def __contains__(self, listing_id):
+        return listing_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class BloomFilter:
+    """
+    Fixed size run-wide index of listing ids, thread-safe.
+
+    Uses a fraction of the memory of `SeenSet` for large runs. The price is
+    that about `error_rate` of the new listings are taken for seen ones (and
+    skipped), once more than `capacity` ids were added that share grows.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, listing_id):
+        # Double hashing: k positions from the two halves of one 128 bit hash
+        digest = xxhash.xxh3_128_intdigest(str(listing_id))
+        h1, h2 = digest & 0xFFFFFFFFFFFFFFFF, (digest >> 64) | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, listing_id):
+        """
+        Add a listing id.
+
+        Returns:
+            bool: True if the id wasn't (probably) seen before
+        """
+        positions = self._positions(listing_id)
+        with self._lock:
+            new = False
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not self._bits[position >> 3] & mask:
+                    self._bits[position >> 3] |= mask
+                    new = True
+            self._count += new
+            return new
+
+    def __contains__(self, listing_id):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(listing_id)
+        )
+
+    def __len__(self):
+        return self._count
+
+
+def get_seen_index(kind="set", capacity=1_000_000, error_rate=0.001):
+    """
+    Create a run-wide index of seen listings for `tracker(seen=...)`.
+
+    Args:
+        kind: `set` (exact), `bloom` (fixed memory) or `none`
+        capacity: Expected number of listings, for a Bloom filter
+        error_rate: Share of new listings a Bloom filter may take for seen ones
+
+    Returns:
+        SeenSet or BloomFilter, None for `none`
+    """
+    if kind == "set":
+        return SeenSet()
+    if kind == "bloom":
+        return BloomFilter(capacity, error_rate)
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown seen index {kind}, use set, bloom or none")
@@ -0,0 +1,105 @@
+import re
+
+# A path segment: a key, optionally marked required with `!`, optionally
+# followed by a list index, e.g. `address!`, `agent[0]` or `price!`
+_SEGMENT = re.compile(
+    r"^(?P<key>[A-Za-z0-9_]+)(?P<required>!)?(?:\[(?P<index>\d+)\])?$"
+)
+
+
+def parse_path(path):
+    """
+    Parse a field path into steps.
+
+    Paths are dot separated keys relative to a hit's `_source`, or to the hit
+    itself when they start with `/`. Keys marked with `!` are required (the
+    listing fails to parse without them), other keys fall back to the field
+    default. A key can be followed by a list index, e.g. `agent[0].name`.
+
+    Returns:
+        tuple: Root (`hit` or `source`) and list of (key or index, required) steps
+    """
+    root = "source"
+    if path.startswith("/"):
+        root, path = "hit", path[1:]
+
+    steps = []
+    for segment in path.split("."):
+        match = _SEGMENT.match(segment)
+        if not match:
+            raise ValueError(f"Invalid path segment '{segment}' in '{path}'")
+        steps.append((match["key"], bool(match["required"])))
+        if match["index"] is not None:
+            steps.append((int(match["index"]), True))
+    return root, steps
+
+
+def _step_expression(parent, steps, i, default):
+    step, required = steps[i]
+    if isinstance(step, int) or required:
+        return f"{parent}[{step!r}]"
+
+    if i + 1 == len(steps):
+        step_default = default
+    elif isinstance(steps[i + 1][0], int):
+        # A missing list defaults to a single element list, so that indexing
+        # it yields the field default (or an empty dict to look further into)
+        step_default = [default if i + 2 == len(steps) else {}]
+    else:
+        step_default = {}
+    return f"{parent}.get({step!r}, {step_default!r})"
+
+
+def compile_extractor(spec, record_type, columns):
+    """
+    Compile a declarative field spec into a single extractor function.
+
+    Every intermediate lookup shared by several fields (e.g. the first agent
+    or the address) is evaluated once per listing and kept in a local
+    variable. The generated function creates a `record_type` instance and
+    sets every column, columns missing from the spec are set to None.
+
+    Args:
+        spec: List of (column, path, default, transform) tuples, `transform`
+            is an optional function applied to the extracted value
+        record_type: Slotted record class to create
+        columns: All columns of the record
+
+    Returns:
+        function: Extractor taking a hit and returning a record
+    """
+    namespace = {"record_type": record_type, "new_record": object.__new__}
+    lines = [
+        "def extract(hit):",
+        "    record = new_record(record_type)",
+        "    source = hit['_source']",
+    ]
+    local_names = {}
+
+    for column, path, default, transform in spec:
+        root, steps = parse_path(path)
+        expression = root
+        for i in range(len(steps)):
+            expression = _step_expression(expression, steps, i, default)
+            if i + 1 < len(steps):
+                if expression not in local_names:
+                    local_names[expression] = f"v{len(local_names)}"
+                    lines.append(f"    {local_names[expression]} = {expression}")
+                expression = local_names[expression]
+
+        if transform is not None:
+            namespace[f"transform_{column}"] = transform
+            expression = f"transform_{column}({expression})"
+        lines.append(f"    record.{column} = {expression}")
+
+    specified = {column for column, *_ in spec}
+    for column in columns:
+        if column not in specified:
+            lines.append(f"    record.{column} = None")
+    lines.append("    return record")
+
+    source = "\n".join(lines)
+    exec(compile(source, "<listing extractor>", "exec"), namespace)
+    extract = namespace["extract"]
+    extract.source = source
+    return extract
@@ -0,0 +1,88 @@
+import datetime
+
+from .scheduler import parse_interval
+
+
+class InsightsRefreshPolicy:
+    """
+    Decide which listings need their views and saves fetched again.
+
+    Insights stored less than a maximum age ago are carried forward instead
+    of fetched. Newly published listings change quickly and get a shorter
+    age, listings that are no longer available hardly change and get a
+    longer one.
+
+    Args:
+        max_age: Maximum age of the insights of other listings
+        new_max_age: Maximum age for listings published less than
+            `new_listing_age` ago
+        inactive_max_age: Maximum age for listings with an `inactive`
+            availability
+        new_listing_age: Age up to which a listing counts as new
+        inactive: Availabilities of listings that are no longer on the market
+    """
+
+    def __init__(
+        self,
+        max_age="6h",
+        new_max_age="1h",
+        inactive_max_age="7d",
+        new_listing_age="3d",
+        inactive=("unavailable",),
+    ):
+        self.max_age = datetime.timedelta(seconds=parse_interval(max_age))
+        self.new_max_age = datetime.timedelta(seconds=parse_interval(new_max_age))
+        self.inactive_max_age = datetime.timedelta(
+            seconds=parse_interval(inactive_max_age)
+        )
+        self.new_listing_age = datetime.timedelta(
+            seconds=parse_interval(new_listing_age)
+        )
+        self.inactive = set(inactive)
+
+    def get_max_age(self, source, now):
+        """Maximum age of the insights of a listing, from its search hit source."""
+        if source.get("availability") in self.inactive:
+            return self.inactive_max_age
+
+        publish_date = source.get("publish_date")
+        if publish_date:
+            try:
+                published = datetime.datetime.fromisoformat(publish_date)
+            except ValueError:
+                published = None
+            if published is not None:
+                if published.tzinfo is not None:
+                    published = published.astimezone().replace(tzinfo=None)
+                if now - published < self.new_listing_age:
+                    return self.new_max_age
+        return self.max_age
+
+    def get_fresh_insights(self, hits, stored, now=None):
+        """
+        Select the stored insights that are still fresh enough to reuse.
+
+        Args:
+            hits: Search hits of a page
+            stored: Listing id mapped to its stored `nr_of_views`,
+                `nr_of_saves` and `fetched_at`, e.g. from
+                `Sink.load_listing_insights`
+            now: Current (naive, local) time
+
+        Returns:
+            dict: Listing id mapped to insights in the API format, for
+                `parse_funda_results(known_insights=...)`
+        """
+        now = now or datetime.datetime.now()
+        fresh = {}
+        for hit in hits:
+            listing_id = hit.get("_id")
+            insights = stored.get(listing_id)
+            if insights is None or insights["fetched_at"] is None:
+                continue
+            if now - insights["fetched_at"] < self.get_max_age(hit["_source"], now):
+                fresh[listing_id] = {
+                    "nrOfViews": insights["nr_of_views"],
+                    "nrOfSaves": insights["nr_of_saves"],
+                }
+        return fresh
@@ -1,13 +1,23 @@
+import contextlib
+import contextvars
 import datetime
 import json
 import logging
+import os
+import re
 import time
 import uuid
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 
 import xxhash
-from curl_cffi import requests
+
+from .cache import InsightsCache
+from .client import FundaClient
+from .extract import compile_extractor
+from .metrics import Metrics
+from .pipeline import run_pipeline
+from .ratelimit import RateLimiter
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -15,8 +25,29 @@ logging.basicConfig(
 
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
 
+# Id of the process's run, runs started with `start_run` get their own
 run_id = str(uuid.uuid4())
-neighbourhood_insights = {}
+_current_run_id = contextvars.ContextVar("run_id", default=None)
+
+
+def get_run_id():
+    """Id of the current run, the one started in this context by `start_run`."""
+    return _current_run_id.get() or run_id
+
+
+def start_run():
+    """
+    Start a new run in the current context, e.g. a scheduled job's thread.
+
+    Runs of jobs running at the same time in other threads keep their own id.
+    """
+    new_run_id = str(uuid.uuid4())
+    _current_run_id.set(new_run_id)
+    return new_run_id
+
+
+insights_cache = InsightsCache()
+metrics = Metrics(get_run_id)
 
 
 def get_authorization_key():
@@ -24,6 +55,35 @@ def get_authorization_key():
     return "Basic ZjVhMjQyZGIxZmUwOjM5ZDYxMjI3LWQ1YTgtNDIxMi04NDY4LWU1NWQ0MjhjMmM2Zg=="
 
 
+DEFAULT_SEARCH_URL = "https://listing-search-wonen.funda.io"
+DEFAULT_INSIGHTS_URL = "https://marketinsights.funda.io"
+
+# Both hosts can be pointed at a local stand-in (see `benchmarks/fake_funda.py`)
+SEARCH_URL = os.environ.get("FUNDA_SEARCH_URL", DEFAULT_SEARCH_URL)
+INSIGHTS_URL = os.environ.get("FUNDA_INSIGHTS_URL", DEFAULT_INSIGHTS_URL)
+
+search_client = FundaClient(
+    SEARCH_URL,
+    headers={
+        "accept": "application/json",
+        "content-type": "application/json",
+        "cache-control": "no-cache",
+        "Referer": "https://www.funda.nl/",
+        "User-Agent": USER_AGENT,
+    },
+    # Start at one search every 2 seconds and speed up while Funda keeps up
+    rate_limiter=RateLimiter(rate=0.5, max_rate=2.0, increase=0.02),
+)
+insights_client = FundaClient(
+    INSIGHTS_URL,
+    headers={
+        "User-Agent": USER_AGENT,
+        "Authorization": get_authorization_key(),
+    },
+    rate_limiter=RateLimiter(rate=5.0, burst=5, max_rate=20.0, increase=0.2),
+)
+
+
 def get_funda_schema():
     return {
         "id": "VARCHAR(100) PRIMARY KEY",
@@ -78,13 +138,105 @@ def get_funda_schema():
         "neighbourhood_families_with_children_pct": "REAL",
         "listing_nr_of_saves": "INTEGER",
         "listing_nr_of_views": "INTEGER",
+        "content_hash": "VARCHAR(100)",
         "search_query": "VARCHAR(500)",
         "_processing_time": "TIMESTAMP",
         "_run_id": "VARCHAR(100)",
     }
 
 
-def get_results(
+# Columns set when a listing is stored rather than when it is parsed
+METADATA_COLUMNS = ("id", "_processing_time", "_run_id")
+
+
+class ListingRecord:
+    """
+    Compact row for a single listing with one slot per `get_funda_schema()` column.
+
+    Records are created by the parser and passed on to the writer as is, values
+    are kept in schema column order. They support item access like the dicts
+    they replace (`record["price"]`, `record["search_query"] = ...`, `{**record}`).
+    """
+
+    __slots__ = tuple(get_funda_schema().keys())
+    columns = __slots__
+
+    def __init__(self, **values):
+        for column in self.columns:
+            setattr(self, column, values.pop(column, None))
+        if values:
+            raise KeyError(f"Unknown listing columns: {list(values)}")
+
+    def __getitem__(self, column):
+        try:
+            return getattr(self, column)
+        except AttributeError:
+            raise KeyError(column)
+
+    def __setitem__(self, column, value):
+        try:
+            setattr(self, column, value)
+        except AttributeError:
+            raise KeyError(column)
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __eq__(self, other):
+        if not isinstance(other, ListingRecord):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __repr__(self):
+        return f"ListingRecord(listing_id={self.listing_id!r})"
+
+    def get(self, column, default=None):
+        return getattr(self, column, default)
+
+    def keys(self):
+        return self.columns
+
+    def values(self):
+        return tuple(getattr(self, column) for column in self.columns)
+
+    def items(self):
+        return zip(self.columns, self.values(), strict=True)
+
+    def data_values(self):
+        """Values of all columns except those set when storing the record."""
+        return tuple(
+            getattr(self, column)
+            for column in self.columns
+            if column not in METADATA_COLUMNS
+        )
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+SEARCH_PATH = "/_msearch/template"
+ES_MAX_RESULT_WINDOW = 10000
+
+AVAILABILITY = ["available", "negotiations", "unavailable"]
+ZONING = ["residential", "recreational"]
+LISTING_TYPES = ["single", "group"]
+
+# Search filters that partition the results into disjoint sets, in the order
+# they are used to split a search that exceeds the result window
+SPLIT_DIMENSIONS = [
+    ("availability", AVAILABILITY),
+    ("zoning", ZONING),
+    ("listing_type", LISTING_TYPES),
+]
+
+
+def build_search_query(
     postal_code4: Literal[1000, 9999],
     km_radius: Literal[1, 2, 5, 10, 15, 30, 50, 100, None] = 1,
     publication_date: Literal[
@@ -93,9 +245,12 @@ def get_results(
     offering_type: Literal["buy", "rent"] = "buy",
     start_index: int = 0,
     page_size: int = 100,
+    availability: list[str] | None = None,
+    zoning: list[str] | None = None,
+    listing_type: list[str] | None = None,
 ):
     """
-    Get property listings from Funda API using the new endpoint format.
+    Build the header and query lines of a single `_msearch/template` search.
 
     Args:
         postal_code4: 4-digit postal code for location search
@@ -104,12 +259,13 @@ def get_results(
         offering_type: Type of offering (buy/rent/all)
         start_index: Starting index for pagination
         page_size: Number of results per page
+        availability: Availability statuses to include (default: all)
+        zoning: Zonings to include (default: all)
+        listing_type: Single listings and/or project groups (default: both)
 
     Returns:
-        dict: API response containing property listings
+        tuple: Index line and query line of the NDJSON request body
     """
-    base_url = "https://listing-search-wonen.funda.io/_msearch/template"
-
     # Map publication_date to new format
     publication_date_map = {
         "now-1d": {"1": True},
@@ -133,32 +289,63 @@ def get_results(
         "offering_type": offering_type,
         "project_phase": {},
         "publication_date": publication_date_map.get(publication_date, {}),
-        "availability": ["available", "negotiations", "unavailable"],
+        "availability": availability or AVAILABILITY,
         "free_text_search": "",
         "page": {"from": start_index},  # Remove size parameter to match sample
-        "zoning": ["residential", "recreational"],
-        "type": ["single", "group"],
+        "zoning": zoning or ZONING,
+        "type": listing_type or LISTING_TYPES,
         "sort": {"field": None, "order": None},
         "open_house": {},
     }
 
-    # Create NDJSON request body (newline-delimited JSON)
     index_line = {"index": "listings-wonen-searcher-alias-prod"}
     query_line = {
         "id": "search_result_20251211",
         "params": query_params,
-    }  # Format as NDJSON (each JSON object on a separate line)
-    ndjson_body = json.dumps(index_line) + "\n" + json.dumps(query_line) + "\n"
-
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "cache-control" : "no-cache",
-        "Referer": "https://www.funda.nl/",
-        "User-Agent": USER_AGENT,
     }
+    return index_line, query_line
+
+
+def _call_endpoint(endpoint, request, *args, **kwargs):
+    """Call `request` and record its latency and status code for `endpoint`."""
+    try:
+        with metrics.timer("http_request_seconds", endpoint=endpoint):
+            res = request(*args, **kwargs)
+    except Exception:
+        metrics.inc("http_requests_total", endpoint=endpoint, status="error")
+        raise
+    metrics.inc("http_requests_total", endpoint=endpoint, status=res.status_code)
+    return res
+
+
+def _get_cached(namespace, key):
+    cached = insights_cache.get(namespace, key)
+    metrics.inc(
+        "cache_lookups_total",
+        namespace=namespace,
+        result="miss" if cached is None else "hit",
+    )
+    return cached
+
+
+def post_search(queries):
+    """
+    Post one or more searches to the `_msearch/template` endpoint in one request.
+
+    Args:
+        queries: List of (index line, query line) tuples from `build_search_query`
+
+    Returns:
+        dict: API response, with one entry in `responses` per query
+    """
+    # Create NDJSON request body (newline-delimited JSON), each JSON object on a
+    # separate line and a header/query pair per search
+    ndjson_body = "".join(
+        json.dumps(index_line) + "\n" + json.dumps(query_line) + "\n"
+        for index_line, query_line in queries
+    )
 
-    res = requests.post(base_url, data=ndjson_body, headers=headers, impersonate="chrome")
+    res = _call_endpoint("search", search_client.post, SEARCH_PATH, data=ndjson_body)
 
     if res.status_code != 200:
         raise Exception(
@@ -168,21 +355,103 @@ def get_results(
     return res.json()
 
 
-@lru_cache
-def get_listing_insights(listing_id):
-    url = f"https://marketinsights.funda.io/v1/objectinsights/{listing_id}"
+def get_results(
+    postal_code4: Literal[1000, 9999],
+    km_radius: Literal[1, 2, 5, 10, 15, 30, 50, 100, None] = 1,
+    publication_date: Literal[
+        "now-1d", "now-3d", "now-5d", "now-10d", "now-30d", "no_preference"
+    ] = "no_preference",
+    offering_type: Literal["buy", "rent"] = "buy",
+    start_index: int = 0,
+    page_size: int = 100,
+    availability: list[str] | None = None,
+    zoning: list[str] | None = None,
+    listing_type: list[str] | None = None,
+):
+    """
+    Get property listings from Funda API using the new endpoint format.
 
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Authorization": get_authorization_key(),
-    }
+    Args:
+        postal_code4: 4-digit postal code for location search
+        km_radius: Search radius in kilometers
+        publication_date: Filter by publication date
+        offering_type: Type of offering (buy/rent/all)
+        start_index: Starting index for pagination
+        page_size: Number of results per page
+        availability: Availability statuses to include (default: all)
+        zoning: Zonings to include (default: all)
+        listing_type: Single listings and/or project groups (default: both)
+
+    Returns:
+        dict: API response containing property listings
+    """
+    return post_search(
+        [
+            build_search_query(
+                postal_code4,
+                km_radius,
+                publication_date,
+                offering_type,
+                start_index,
+                page_size,
+                availability=availability,
+                zoning=zoning,
+                listing_type=listing_type,
+            )
+        ]
+    )
 
-    res = requests.get(url, headers=headers, impersonate="chrome")
+
+def get_results_batch(queries):
+    """
+    Get several pages and/or searches with a single `_msearch` request.
+
+    Args:
+        queries: List of dicts with `get_results` keyword arguments, e.g. several
+            pages, postal codes or offering types
+
+    Returns:
+        list: One API response per query, in the same shape `get_results` returns
+    """
+    if not queries:
+        return []
+
+    res = post_search([build_search_query(**query) for query in queries])
+    responses = res.get("responses", [])
+
+    if len(responses) != len(queries):
+        raise Exception(
+            f"Failed to get results from funda. Expected {len(queries)} responses, got {len(responses)}. Response: {res}"
+        )
+
+    for query, response in zip(queries, responses, strict=True):
+        if "error" in response:
+            raise Exception(
+                f"Failed to get results from funda for {query}. Error: {response['error']}"
+            )
+
+    return [{"responses": [response]} for response in responses]
+
+
+def get_listing_insights(listing_id, use_cache=True):
+    # Without `use_cache` the insights are always fetched (and still cached),
+    # e.g. when the caller records when they were fetched
+    if use_cache:
+        cached = _get_cached("listing_insights", listing_id)
+        if cached is not None:
+            return cached
+
+    res = _call_endpoint(
+        "listing_insights", insights_client.get, f"/v1/objectinsights/{listing_id}"
+    )
 
     if res.status_code == 200:
-        return res.json()
+        insights = res.json()
+        insights_cache.set("listing_insights", listing_id, insights)
+        return insights
     if res.status_code == 204:
         # No insights available
+        insights_cache.set("listing_insights", listing_id, {})
         return {}
     else:
         logging.error(
@@ -191,25 +460,26 @@ def get_listing_insights(listing_id):
         return {}
 
 
-@lru_cache(maxsize=2400)
 def get_neighbourhood_insights(city, neighbourhood):
-    global neighbourhood_insights
     neighbourhood = neighbourhood.replace("/", "-").replace(" ", "-").replace("--", "-")
     neighbourhood_key = xxhash.xxh64(f"{city}-{neighbourhood}").hexdigest()
-    if neighbourhood_key in neighbourhood_insights:
-        return neighbourhood_insights[neighbourhood_key]
-
-    url = f"https://marketinsights.funda.io/v2/LocalInsights/preview/{city}/{neighbourhood}"
-
-    headers = {"User-Agent": USER_AGENT}
+    cached = _get_cached("neighbourhood_insights", neighbourhood_key)
+    if cached is not None:
+        return cached
 
-    res = requests.get(url, headers=headers, impersonate="chrome")
+    res = _call_endpoint(
+        "neighbourhood_insights",
+        insights_client.get,
+        f"/v2/LocalInsights/preview/{city}/{neighbourhood}",
+    )
 
     if res.status_code == 200:
-        neighbourhood_insights[neighbourhood_key] = res.json()
-        return neighbourhood_insights[neighbourhood_key]
+        insights = res.json()
+        insights_cache.set("neighbourhood_insights", neighbourhood_key, insights)
+        return insights
     if res.status_code == 204:
         # No insights available
+        insights_cache.set("neighbourhood_insights", neighbourhood_key, {})
         return {}
     else:
         logging.error(
@@ -218,115 +488,237 @@ def get_neighbourhood_insights(city, neighbourhood):
         return {}
 
 
-def parse_funda_results(results_object, use_listing_insights=True):
+# Attributes of a listing's `_source` that the parser uses. Other attributes
+# (thumbnails, media types, ...) change without the listing itself changing.
+CONTENT_HASH_FIELDS = [
+    "address",
+    "agent",
+    "amenities",
+    "availability",
+    "construction_date_range",
+    "construction_period",
+    "construction_type",
+    "description",
+    "energy_label",
+    "exterior_space_garden_orientation",
+    "exterior_space_garden_size",
+    "exterior_space_type",
+    "floor_area",
+    "garage_capacity",
+    "garage_type",
+    "number_of_bedrooms",
+    "number_of_rooms",
+    "object_detail_page_relative_url",
+    "object_type",
+    "offering_type",
+    "placement_type",
+    "plot_area",
+    "price",
+    "project",
+    "publish_date",
+    "sale_date_range",
+    "selected_area",
+    "status",
+    "surrounding",
+    "zoning",
+]
+
+
+def get_content_hash(listing_details):
+    """Hash the canonical subset of a listing's `_source`, before any enrichment."""
+    canonical = {field: listing_details.get(field) for field in CONTENT_HASH_FIELDS}
+    return xxhash.xxh64(
+        json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    ).hexdigest()
+
+
+def _fetch_listing_insights(listing_id, use_cache=True):
+    # Exceptions are returned rather than raised so the parser can handle them
+    # per listing, exactly like it does when fetching sequentially.
+    try:
+        return get_listing_insights(listing_id, use_cache=use_cache)
+    except Exception as e:
+        return e
+
+
+def prefetch_listing_insights(listing_ids, max_workers=8, use_cache=True):
     """
-    Parse Funda API results from the new API format.
+    Fetch listing insights for several listings concurrently.
+
+    Args:
+        listing_ids: Listing ids to fetch insights for
+        max_workers: Maximum number of concurrent requests
+        use_cache: Whether to use cached insights
+
+    Returns:
+        dict: Listing id mapped to its insights (or the exception raised)
+    """
+    listing_ids = list(dict.fromkeys(listing_ids))
+    if not listing_ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(listing_ids))) as pool:
+        insights = pool.map(
+            lambda listing_id: _fetch_listing_insights(listing_id, use_cache),
+            listing_ids,
+        )
+        return dict(zip(listing_ids, insights, strict=True))
+
+
+def _join(values):
+    return ",".join(values)
+
+
+def _date_range(date_range):
+    return f"{date_range.get('gte', '')}~{date_range.get('lte', '')}"
+
+
+# Mapping of listing columns to their location in a search hit, see
+# `extract.parse_path` for the path format: (column, path, default, transform)
+FIELD_SPEC = [
+    ("listing_id", "/_id!", None, None),
+    ("agent_id", "agent[0].id", "", None),
+    ("agent_url", "agent[0].relative_url", "", None),
+    ("agent_name", "agent[0].name", "", None),
+    ("agent_association", "agent[0].association", "", None),
+    ("address_country", "address!.country!", None, None),
+    ("address_province", "address!.province", "", None),
+    ("address_city", "address!.city", "", None),
+    ("address_neighbourhood", "address!.neighbourhood", "", None),
+    ("address_municipality", "address!.municipality", "", None),
+    ("address_house_number", "address!.house_number", "", None),
+    ("address_house_number_suffix", "address!.house_number_suffix", "", None),
+    ("address_postal_code", "address!.postal_code!", None, None),
+    ("address_street_name", "address!.street_name", "", None),
+    ("number_of_bedrooms", "number_of_bedrooms", None, None),
+    ("number_of_rooms", "number_of_rooms", None, None),
+    ("object_type", "object_type", None, None),
+    ("energy_label", "energy_label", None, None),
+    ("floor_area", "floor_area[0]", None, None),
+    ("plot_area", "plot_area[0]", None, None),
+    ("publish_date", "publish_date!", None, None),
+    ("url_path", "object_detail_page_relative_url!", None, None),
+    ("status", "status", "", None),
+    ("price", "price!.selling_price[0]", None, None),
+    ("price_type", "price!.selling_price_type", "", None),
+    ("price_condition", "price!.selling_price_condition", "", None),
+    ("placement_type", "placement_type", "", None),
+    ("availability", "availability", "", None),
+    ("amenities", "amenities", [], _join),
+    ("construction_date_range", "construction_date_range", {}, _date_range),
+    ("construction_period", "construction_period", "", None),
+    ("construction_type", "construction_type", "", None),
+    ("offering_type", "offering_type", "", None),
+    ("project", "project.id", "", None),
+    ("sale_date_range", "sale_date_range", {}, _date_range),
+    ("selected_area", "selected_area", "", None),
+    ("description", "description.dutch", "", None),
+    ("description_tags", "description.tags", "", None),
+    ("zoning", "zoning", "", None),
+    ("surrounding", "surrounding", [], _join),
+    ("exterior_space_garden_size", "exterior_space_garden_size", "", None),
+    ("exterior_space_type", "exterior_space_type", "", None),
+    (
+        "exterior_space_garden_orientation",
+        "exterior_space_garden_orientation",
+        "",
+        None,
+    ),
+    ("garage_capacity", "garage_capacity", "", None),
+    ("garage_type", "garage_type", "", None),
+    ("content_hash", "/_source!", None, get_content_hash),
+]
+
+extract_listing = compile_extractor(FIELD_SPEC, ListingRecord, ListingRecord.columns)
+
+
+def get_hits(results_object):
+    """Return the search hits of a response in the new or the old API format."""
+    if "responses" in results_object:
+        return results_object["responses"][0]["hits"]["hits"]
+    return results_object["search_result"]["hits"]["hits"]
+
+
+def parse_funda_results(
+    results_object,
+    use_listing_insights=True,
+    insights_concurrency=1,
+    use_neighbourhood_insights=True,
+    known_insights=None,
+    refresh_insights=False,
+):
+    """
+    Parse Funda API results from the new (or old) API format.
 
     Args:
         results_object: API response object
         use_listing_insights: Whether to fetch additional listing insights
+        insights_concurrency: Number of listing insights to fetch in parallel,
+            1 fetches them one by one while parsing
+        use_neighbourhood_insights: Whether to fetch neighbourhood insights
+        known_insights: Listing id mapped to listing insights to use instead
+            of fetching them
+        refresh_insights: Whether to fetch the other listing insights even
+            when they are cached
 
     Returns:
         list: Parsed listing data
     """
     try:
-        listings = results_object["responses"][0]["hits"]["hits"]
+        listings = get_hits(results_object)
     except Exception as e:
         raise Exception(f"Failed to parse results. Error: {e} — Got: {results_object}")
 
     logging.debug(f"Parsing {len(listings)} listings...")
+
+    known_insights = known_insights or {}
+    prefetched_insights = None
+    if use_listing_insights and insights_concurrency > 1:
+        prefetched_insights = prefetch_listing_insights(
+            [
+                listing["_id"]
+                for listing in listings
+                if "_id" in listing and listing["_id"] not in known_insights
+            ],
+            max_workers=insights_concurrency,
+            use_cache=not refresh_insights,
+        )
+
     parsed_results = []
     for listing in listings:
         try:
-            listing_details = listing["_source"]
-            listing_parsed = {
-                "listing_id": listing["_id"],
-                "agent_id": listing_details.get("agent", [{}])[0].get("id", ""),
-                "agent_url": listing_details.get("agent", [{}])[0].get(
-                    "relative_url", ""
-                ),
-                "agent_name": listing_details.get("agent", [{}])[0].get("name", ""),
-                "agent_association": listing_details.get("agent", [{}])[0].get(
-                    "association", ""
-                ),
-                "address_country": listing_details["address"]["country"],
-                "address_province": listing_details["address"].get("province", ""),
-                "address_city": listing_details["address"].get("city", ""),
-                "address_neighbourhood": listing_details["address"].get(
-                    "neighbourhood", ""
-                ),
-                "address_municipality": listing_details["address"].get(
-                    "municipality", ""
-                ),
-                "address_house_number": listing_details["address"].get(
-                    "house_number", ""
-                ),
-                "address_house_number_suffix": listing_details["address"].get(
-                    "house_number_suffix", ""
-                ),
-                "address_postal_code": listing_details["address"]["postal_code"],
-                "address_street_name": listing_details["address"].get(
-                    "street_name", ""
-                ),
-                "number_of_bedrooms": listing_details.get("number_of_bedrooms", None),
-                "number_of_rooms": listing_details.get("number_of_rooms", None),
-                "object_type": listing_details.get("object_type", None),
-                "energy_label": listing_details.get("energy_label", None),
-                "floor_area": listing_details.get("floor_area", [None])[0],
-                "plot_area": listing_details.get("plot_area", [None])[0],
-                "publish_date": listing_details["publish_date"],
-                "url_path": listing_details["object_detail_page_relative_url"],
-                "status": listing_details.get("status", ""),
-                "price": listing_details["price"].get("selling_price", [None])[0],
-                "price_type": listing_details["price"].get("selling_price_type", ""),
-                "price_condition": listing_details["price"].get(
-                    "selling_price_condition", ""
-                ),
-                "placement_type": listing_details.get("placement_type", ""),
-                "availability": listing_details.get("availability", ""),
-                "amenities": ",".join(listing_details.get("amenities", [])),
-                "construction_date_range": f"{listing_details.get('construction_date_range', {}).get('gte', '')}~{listing_details.get('construction_date_range', {}).get('lte', '')}",
-                "construction_period": listing_details.get("construction_period", ""),
-                "construction_type": listing_details.get("construction_type", ""),
-                "offering_type": listing_details.get("offering_type", ""),
-                "project": listing_details.get("project", {}).get("id", ""),
-                "sale_date_range": f"{listing_details.get('sale_date_range', {}).get('gte', '')}~{listing_details.get('sale_date_range', {}).get('lte', '')}",
-                "selected_area": listing_details.get("selected_area", ""),
-                "description": listing_details.get("description", {}).get("dutch", ""),
-                "description_tags": listing_details.get("description", {}).get(
-                    "tags", ""
-                ),
-                "zoning": listing_details.get("zoning", ""),
-                "surrounding": ",".join(listing_details.get("surrounding", [])),
-                "exterior_space_garden_size": listing_details.get(
-                    "exterior_space_garden_size", ""
-                ),
-                "exterior_space_type": listing_details.get("exterior_space_type", ""),
-                "exterior_space_garden_orientation": listing_details.get(
-                    "exterior_space_garden_orientation", ""
-                ),
-                "garage_capacity": listing_details.get("garage_capacity", ""),
-                "garage_type": listing_details.get("garage_type", ""),
-            }
-
-            neightbourhood_insights = get_neighbourhood_insights(
-                listing_parsed["address_city"], listing_parsed["address_neighbourhood"]
-            )
-            listing_parsed["neighbourhood_inhabitants"] = neightbourhood_insights.get(
-                "inhabitants", None
-            )
-            listing_parsed["neighbourhood_avg_askingprice_m2"] = (
-                neightbourhood_insights.get("averageAskingPricePerM2", None)
-            )
-            listing_parsed["neighbourhood_families_with_children_pct"] = (
-                neightbourhood_insights.get("familiesWithChildren", None)
-            )
+            listing_parsed = extract_listing(listing)
+
+            if use_neighbourhood_insights:
+                neightbourhood_insights = get_neighbourhood_insights(
+                    listing_parsed["address_city"],
+                    listing_parsed["address_neighbourhood"],
+                )
+                listing_parsed["neighbourhood_inhabitants"] = (
+                    neightbourhood_insights.get("inhabitants", None)
+                )
+                listing_parsed["neighbourhood_avg_askingprice_m2"] = (
+                    neightbourhood_insights.get("averageAskingPricePerM2", None)
+                )
+                listing_parsed["neighbourhood_families_with_children_pct"] = (
+                    neightbourhood_insights.get("familiesWithChildren", None)
+                )
 
             if use_listing_insights:
                 try:
-                    listing_insights = get_listing_insights(
-                        listing_parsed["listing_id"]
-                    )
+                    if listing_parsed["listing_id"] in known_insights:
+                        listing_insights = known_insights[listing_parsed["listing_id"]]
+                    elif prefetched_insights is None:
+                        listing_insights = get_listing_insights(
+                            listing_parsed["listing_id"],
+                            use_cache=not refresh_insights,
+                        )
+                    else:
+                        listing_insights = prefetched_insights[
+                            listing_parsed["listing_id"]
+                        ]
+                        if isinstance(listing_insights, Exception):
+                            raise listing_insights
                     listing_parsed["listing_nr_of_views"] = listing_insights[
                         "nrOfViews"
                     ]
@@ -347,85 +739,821 @@ def parse_funda_results(results_object, use_listing_insights=True):
     return parsed_results
 
 
-def store_results(results, table, conn):
+def prepare_row(result):
+    """Set the content hash id and processing metadata on a parsed result."""
+    if not isinstance(result, ListingRecord):
+        result = ListingRecord(**result)
+
+    result.id = xxhash.xxh64(
+        "~~".join([str(x) for x in result.data_values()])
+    ).hexdigest()
+    result._processing_time = str(datetime.datetime.now())
+    result._run_id = get_run_id()
+    return result
+
+
+def get_insert_query(table, partitioned=False):
+    """
+    Insert query for rows of `prepare_row`, skipping already stored ids.
+
+    A partitioned table (see `partitions.setup_partitioned_table`) is only
+    unique on `id` within a partition, so stored ids are looked up in all
+    partitions before inserting. That lookup doesn't see rows of writers
+    that haven't committed yet, so the ids are locked first with
+    `get_id_lock_query` in the same transaction.
+    """
+    columns = ListingRecord.columns
+    if not partitioned:
+        return f"""
+        INSERT INTO {table}({", ".join(columns)})
+        VALUES({", ".join(["%s"] * len(columns))})
+        ON CONFLICT (id) DO NOTHING
+    """
+
+    # Parameters in a VALUES list aren't typed by the target columns
+    casts = [
+        "%s::" + re.sub(r"\(.*\)|PRIMARY KEY", "", column_type).strip()
+        for column_type in get_funda_schema().values()
+    ]
+    return f"""
+        INSERT INTO {table}({", ".join(columns)})
+        SELECT * FROM (VALUES({", ".join(casts)})) AS new({", ".join(columns)})
+        WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {table}.id = new.id)
+        ON CONFLICT DO NOTHING
+    """
+
+
+def get_id_lock_query():
+    """
+    Lock a list of ids until the end of the transaction.
+
+    Writers of a partitioned table take these advisory locks before
+    inserting, so a second writer of the same id waits for the first to
+    commit and then skips it. Ids are locked in order to avoid deadlocks.
+    """
+    return """
+        SELECT pg_advisory_xact_lock(hashtextextended(id, 0))
+        FROM (SELECT DISTINCT id FROM unnest(%s::TEXT[]) AS ids(id) ORDER BY id) AS ids
+    """
+
+
+def store_results(results, table, conn, batch=False, partitioned=False):
+    """
+    Store parsed results, skipping rows whose content hash already exists.
+
+    Args:
+        results: Parsed listing records (or dicts with the same keys)
+        table: Table to insert into
+        conn: Database connection
+        batch: Write the whole page in a single transaction using executemany
+        partitioned: The table is partitioned by month
+
+    Returns:
+        dict: Number of inserted, skipped (already stored) and failed rows
+    """
+    if batch:
+        return store_results_batch(results, table, conn, partitioned=partitioned)
+
+    counts = {"inserted": 0, "skipped": 0, "failed": 0}
     cursor = conn.cursor()
+    query = get_insert_query(table, partitioned=partitioned)
     logging.debug(f"Storing {len(results)} results...")
     for result in results:
         try:
-            data = {
-                "id": xxhash.xxh64(
-                    "~~".join([str(x) for x in result.values()])
-                ).hexdigest(),
-                **result,
-                "_processing_time": str(datetime.datetime.now()),
-                "_run_id": run_id,
-            }
-
-            query = f"""
-                INSERT INTO {table}({", ".join(data.keys())})
-                VALUES({", ".join(["%s"] * len(data.keys()))})
-                ON CONFLICT (id) DO NOTHING
-            """
-
-            cursor.execute(query, tuple(data.values()))
+            row = prepare_row(result)
+            with conn.transaction() if partitioned else contextlib.nullcontext():
+                if partitioned:
+                    cursor.execute(get_id_lock_query(), ([row["id"]],))
+                cursor.execute(query, row.values())
+            if cursor.rowcount:
+                counts["inserted"] += 1
+            else:
+                counts["skipped"] += 1
 
         except Exception as e:
+            counts["failed"] += 1
             logging.error(
                 f"Error storing results for {result['listing_id']} ({result}) \n\n {query}"
             )
             logging.error(e)
 
+    return counts
 
-def tracker(
-    postal_code, km_radius, publication_date, connection, sleep_between_requests_sec=5
+
+def store_results_batch(results, table, conn, partitioned=False):
+    """
+    Store a page of parsed results in one transaction with a single executemany.
+
+    Args:
+        results: Parsed listing records (or dicts with the same keys)
+        table: Table to insert into
+        conn: Database connection
+        partitioned: The table is partitioned by month
+
+    Returns:
+        dict: Number of inserted, skipped (already stored) and failed rows
+    """
+    counts = {"inserted": 0, "skipped": 0, "failed": 0}
+    if not results:
+        return counts
+
+    logging.debug(f"Storing {len(results)} results in batch...")
+    try:
+        rows = [prepare_row(result) for result in results]
+        with conn.transaction():
+            cursor = conn.cursor()
+            if partitioned:
+                cursor.execute(get_id_lock_query(), ([row["id"] for row in rows],))
+            cursor.executemany(
+                get_insert_query(table, partitioned=partitioned),
+                [row.values() for row in rows],
+            )
+            counts["inserted"] = max(cursor.rowcount, 0)
+    except Exception as e:
+        counts["failed"] = len(results)
+        logging.error(f"Error storing batch of {len(results)} results into {table}")
+        logging.error(e)
+        return counts
+
+    counts["skipped"] = len(results) - counts["inserted"]
+    return counts
+
+
+def get_page_stats(res):
+    """Return the total number of results and the number of hits on this page."""
+    try:
+        return (
+            res["responses"][0]["hits"]["total"]["value"],
+            len(res["responses"][0]["hits"]["hits"]),
+        )
+    except Exception as e:
+        raise Exception(f"Failed to get results from funda. Got: {res}\n\nError: {e}")
+
+
+def plan_query_slices(query, first_page=None):
+    """
+    Split a search into slices that each fit in the Elasticsearch result window.
+
+    Searches with more results than the window are recursively split on the
+    filters in `SPLIT_DIMENSIONS`, which partition the results without overlap.
+
+    Args:
+        query: Dict with `get_results` keyword arguments
+        first_page: Already fetched first page of `query`, if any
+
+    Returns:
+        list: Tuples of slice query and the first page of its results
+    """
+    if first_page is None:
+        first_page = get_results(**query, start_index=0)
+
+    results_total, _ = get_page_stats(first_page)
+    if results_total <= ES_MAX_RESULT_WINDOW:
+        return [(query, first_page)]
+
+    for dimension, values in SPLIT_DIMENSIONS:
+        current_values = query.get(dimension) or values
+        if len(current_values) < 2:
+            continue
+
+        logging.info(
+            f"Splitting search with {results_total} results on {dimension}: {current_values}"
+        )
+        slices = []
+        for value in current_values:
+            slices += plan_query_slices({**query, dimension: [value]})
+        return slices
+
+    logging.warning(
+        f"Unable to split search further, {results_total} results exceed the "
+        f"Elasticsearch max result window ({ES_MAX_RESULT_WINDOW}): {query}"
+    )
+    return [(query, first_page)]
+
+
+def with_hits(res, hits):
+    """Return a copy of a single search response with only the given hits."""
+    response = res["responses"][0]
+    return {"responses": [{**response, "hits": {**response["hits"], "hits": hits}}]}
+
+
+def drop_seen_hits(res, seen_ids):
+    """Remove hits that were already processed and add the rest to `seen_ids`."""
+    hits = []
+    for hit in res["responses"][0]["hits"]["hits"]:
+        if hit.get("_id") in seen_ids:
+            continue
+        seen_ids.add(hit.get("_id"))
+        hits.append(hit)
+
+    return with_hits(res, hits)
+
+
+def drop_repeated_hits(res, seen):
+    """
+    Remove hits of listings already seen by another search of the run.
+
+    Args:
+        res: API response
+        seen: Run-wide index of listing ids (see `dedupe.get_seen_index`), new
+            listings are added to it
+
+    Returns:
+        tuple: Response with only the new hits, and the ids of repeated listings
+    """
+    hits = []
+    repeated_ids = []
+    for hit in res["responses"][0]["hits"]["hits"]:
+        if seen.add(hit.get("_id")):
+            hits.append(hit)
+        else:
+            repeated_ids.append(hit.get("_id"))
+
+    return with_hits(res, hits), repeated_ids
+
+
+def setup_search_listings_table(conn, table="funda_search_listings"):
+    """Create the table linking listings to every search they were found by."""
+    conn.cursor().execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table}(
+            search_query VARCHAR(500),
+            listing_id VARCHAR(100),
+            _run_id VARCHAR(100),
+            _processing_time TIMESTAMP,
+            PRIMARY KEY (search_query, listing_id)
+        )
+        """
+    )
+
+
+def get_search_listings_query(table):
+    return f"""
+        INSERT INTO {table}(search_query, listing_id, _run_id, _processing_time)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (search_query, listing_id) DO UPDATE SET
+            _run_id = EXCLUDED._run_id,
+            _processing_time = EXCLUDED._processing_time
+    """
+
+
+def get_search_listings_rows(listing_ids, search_query):
+    now = datetime.datetime.now()
+    run_id = get_run_id()
+    return [(search_query, listing_id, run_id, now) for listing_id in listing_ids]
+
+
+def store_search_listings(listing_ids, search_query, table, conn):
+    """
+    Record that listings were (also) found by a search.
+
+    Returns:
+        int: Number of listings recorded
+    """
+    if not listing_ids:
+        return 0
+
+    conn.cursor().executemany(
+        get_search_listings_query(table),
+        get_search_listings_rows(listing_ids, search_query),
+    )
+    return len(listing_ids)
+
+
+def setup_listing_insights_table(conn, table="funda_listing_insights"):
+    """Create the table with the last fetched insights of every listing."""
+    conn.cursor().execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table}(
+            listing_id VARCHAR(100) PRIMARY KEY,
+            nr_of_views INTEGER,
+            nr_of_saves INTEGER,
+            fetched_at TIMESTAMP
+        )
+        """
+    )
+
+
+def load_listing_insights(conn, table, listing_ids):
+    """
+    Load the last fetched insights of listings in one query.
+
+    Returns:
+        dict: Listing id mapped to its `nr_of_views`, `nr_of_saves` and
+            `fetched_at`
+    """
+    if not listing_ids:
+        return {}
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT listing_id, nr_of_views, nr_of_saves, fetched_at
+        FROM {table}
+        WHERE listing_id = ANY(%s)
+        """,
+        (list(listing_ids),),
+    )
+    return {
+        listing_id: {
+            "nr_of_views": nr_of_views,
+            "nr_of_saves": nr_of_saves,
+            "fetched_at": fetched_at,
+        }
+        for listing_id, nr_of_views, nr_of_saves, fetched_at in cursor.fetchall()
+    }
+
+
+def get_listing_insights_query(table):
+    return f"""
+        INSERT INTO {table}(listing_id, nr_of_views, nr_of_saves, fetched_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (listing_id) DO UPDATE SET
+            nr_of_views = EXCLUDED.nr_of_views,
+            nr_of_saves = EXCLUDED.nr_of_saves,
+            fetched_at = EXCLUDED.fetched_at
+    """
+
+
+def store_listing_insights(insights, table, conn):
+    """
+    Store freshly fetched listing insights.
+
+    Args:
+        insights: (listing id, views, saves, fetched at) tuples
+        table: Table with the last fetched insights
+        conn: Database connection
+
+    Returns:
+        int: Number of listings stored
+    """
+    if not insights:
+        return 0
+
+    conn.cursor().executemany(get_listing_insights_query(table), insights)
+    return len(insights)
+
+
+def load_known_hashes(conn, table, search_query):
+    """
+    Load the latest stored content hash per listing for a search query.
+
+    Args:
+        conn: Database connection
+        table: Table with stored listings
+        search_query: Search query the listings were stored for
+
+    Returns:
+        dict: Listing id mapped to its latest content hash
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT DISTINCT ON (listing_id) listing_id, content_hash
+        FROM {table}
+        WHERE search_query = %s AND content_hash IS NOT NULL
+        ORDER BY listing_id, _processing_time DESC
+        """,
+        (search_query,),
+    )
+    return dict(cursor.fetchall())
+
+
+def drop_unchanged_hits(res, known_hashes):
+    """Remove hits whose content hash matches the latest stored version."""
+    hits = [
+        hit
+        for hit in res["responses"][0]["hits"]["hits"]
+        if "_source" not in hit
+        or known_hashes.get(hit.get("_id")) != get_content_hash(hit["_source"])
+    ]
+    return with_hits(res, hits)
+
+
+def iter_result_pages(
+    query,
+    first_page=None,
+    page_size=100,
+    pages_per_request=1,
+    start_index=0,
+):
+    """
+    Fetch all result pages of a search, up to the Elasticsearch result window.
+
+    The first page is fetched on its own (unless given) to learn the total
+    number of results, the remaining pages are fetched `pages_per_request`
+    at a time.
+
+    Args:
+        query: Dict with `get_results` keyword arguments
+        first_page: Already fetched first page of `query`, if any
+        start_index: Index of the first result to fetch, e.g. to resume
+
+    Yields:
+        tuple: Start index and API response of each page
+    """
+    query = {**query, "page_size": page_size}
+    results_processed = start_index
+    results_total = start_index + 1
+    results_per_page = None
+    while (
+        results_processed < results_total
+        and results_processed + page_size <= ES_MAX_RESULT_WINDOW
+    ):
+        if results_per_page is None and first_page is not None:
+            # Already fetched while planning the search
+            start_indexes = [0]
+            responses = [first_page]
+        elif results_per_page is None or pages_per_request <= 1:
+            start_indexes = [results_processed]
+            responses = [get_results(**query, start_index=results_processed)]
+        else:
+            last_index = min(results_total, ES_MAX_RESULT_WINDOW - page_size + 1)
+            start_indexes = list(
+                range(results_processed, last_index, results_per_page)
+            )[:pages_per_request]
+            responses = get_results_batch(
+                [{**query, "start_index": i} for i in start_indexes]
+            )
+
+        for page_start_index, res in zip(start_indexes, responses, strict=True):
+            results_total, results_current_length = get_page_stats(res)
+            yield page_start_index, res
+
+            if results_per_page is None and results_current_length:
+                results_per_page = results_current_length
+            results_processed = page_start_index + results_current_length
+
+        if results_current_length == 0:
+            break
+
+
+def get_slice_key(query):
+    """Identify a search slice by the split filters it sets, `*` if none."""
+    filters = [
+        f"{dimension}={','.join(query[dimension])}"
+        for dimension, _ in SPLIT_DIMENSIONS
+        if query.get(dimension)
+    ]
+    return ";".join(filters) or "*"
+
+
+def iter_search_pages(
+    postal_code,
+    km_radius,
+    publication_date,
+    pages_per_request=1,
+    split_queries=True,
+    resume_from=None,
+    filters=None,
+    truncated=None,
 ):
-    ES_MAX_RESULT_WINDOW = 10000
-    results_processed = 0
-    results_total = 1
-    page_size = 100
-    while results_processed < results_total and results_processed + page_size <= ES_MAX_RESULT_WINDOW:
-        res = get_results(
-            postal_code4=postal_code,
-            km_radius=km_radius,
-            publication_date=publication_date,
+    """
+    Fetch all result pages of a search, split into slices when it is too large.
+
+    Args:
+        resume_from: Checkpoints by slice key, slices continue after the
+            results processed in their checkpoint
+        filters: Split filters (e.g. `{"availability": ["available"]}`) to
+            only fetch a slice of the search
+        truncated: Dict the number of results past the result window is added
+            to, by slice key, for slices that can't be split any further
+
+    Yields:
+        tuple: Slice key, start index and API response of each page
+    """
+    resume_from = resume_from or {}
+    query = {
+        "postal_code4": postal_code,
+        "km_radius": km_radius,
+        "publication_date": publication_date,
+        **(filters or {}),
+    }
+
+    if split_queries:
+        slices = plan_query_slices(query)
+    else:
+        slices = [(query, None)]
+
+    for slice_query, first_page in slices:
+        slice_key = get_slice_key(slice_query)
+        checkpoint = resume_from.get(slice_key)
+        results_processed = 0
+        results_total = 0
+        if checkpoint is not None:
+            results_processed = checkpoint["results_processed"]
+            results_total = checkpoint["results_total"]
+            if results_processed >= results_total:
+                logging.info(f"Skipping finished slice {slice_key}.")
+                continue
+            logging.info(
+                f"Resuming slice {slice_key} at {results_processed}/{results_total}..."
+            )
+        elif len(slices) > 1:
+            logging.info(f"Processing slice {slice_query}...")
+
+        pages = iter_result_pages(
+            slice_query,
+            first_page=first_page if results_processed == 0 else None,
+            pages_per_request=pages_per_request,
             start_index=results_processed,
-            page_size=page_size,
         )
+        for start_index, res in pages:
+            results_total, results_current_length = get_page_stats(res)
+            yield slice_key, start_index, res
+            results_processed = start_index + results_current_length
 
-        try:
-            results_total = res["responses"][0]["hits"]["total"]["value"]
-            results_current_length = len(res["responses"][0]["hits"]["hits"])
-
-        except Exception as e:
-            raise Exception(
-                f"Failed to get results from funda. Got: {res}\n\nError: {e}"
+        if (
+            results_processed >= ES_MAX_RESULT_WINDOW
+            and results_processed < results_total
+        ):
+            logging.warning(
+                f"Reached Elasticsearch max result window ({ES_MAX_RESULT_WINDOW}). "
+                f"Processed {results_processed}/{results_total} results for postal code {postal_code}. "
+                f"Consider using a smaller radius or more restrictive date filter."
             )
+            if truncated is not None:
+                truncated[slice_key] = results_total - results_processed
+
+
+def tracker(
+    postal_code,
+    km_radius,
+    publication_date,
+    connection=None,
+    insights_concurrency=1,
+    batch_writes=False,
+    pages_per_request=1,
+    split_queries=True,
+    pipelined=False,
+    delta=False,
+    metrics_textfile=None,
+    metrics_json=None,
+    sink=None,
+    archive=None,
+    checkpoints=None,
+    resume=False,
+    filters=None,
+    stop_event=None,
+    seen=None,
+    refresh_policy=None,
+    changes=None,
+):
+    """
+    Fetch, parse and store all listings of a search.
+
+    Listings are written to `sink`, by default a `PostgresSink` on
+    `connection`. With an `archive` (a `ResponseArchive`) every raw result
+    page is stored as well, before it is parsed.
+
+    With a checkpoint store the progress of every search slice is saved after
+    each stored page, and cleared once the whole search is done. With
+    `resume` a search continues after the last stored page of an earlier,
+    unfinished run. `filters` limits the run to a slice of the search.
+
+    Setting `stop_event` (a `threading.Event`) stops the run before the next
+    page is fetched. Pages already fetched are still parsed and stored, and
+    the checkpoints are kept so the search can be resumed.
+
+    Searches in one run often overlap. Passing the same `seen` index (see
+    `dedupe.get_seen_index`) to each of them skips listings an earlier search
+    already processed, only their link to this search is written through
+    `sink.write_search_listings`.
+
+    With a `refresh_policy` (an `InsightsRefreshPolicy`) the stored insights
+    of a page's listings are loaded from the sink in one go, and only those
+    that are too old are fetched again.
+
+    With `changes` (a `ListingChanges`) every stored page is compared with
+    the current state of its listings, and price, status and availability
+    changes are written to the sink (and an NDJSON file) as events.
+
+    Returns:
+        dict: Number of results of slices still over the result window that
+            couldn't be fetched, by slice key (empty if none)
+    """
+    # Imported here, the sinks build on the functions in this module
+    from .sinks import PostgresSink
+
+    started = time.perf_counter()
+    search_query = f"{postal_code}~{km_radius}~{publication_date}"
+    # Slices of a search run separately keep their own checkpoints
+    checkpoint_key = search_query
+    if filters:
+        checkpoint_key = f"{search_query}~{get_slice_key(filters)}"
+    seen_ids = set()
+    if sink is None:
+        sink = PostgresSink(connection, "funda", batch=batch_writes)
+
+    known_hashes = {}
+    if delta:
+        known_hashes = sink.load_known_hashes(search_query)
+        logging.info(f"Loaded {len(known_hashes)} known listings for delta mode.")
+
+    run_id = get_run_id()
+    resume_from = {}
+    if resume and checkpoints is not None:
+        resume_from = checkpoints.load(checkpoint_key)
+        if resume_from:
+            run_ids = sorted({c["run_id"] for c in resume_from.values()})
+            logging.info(f"Resuming {len(resume_from)} slices of runs {run_ids}.")
+
+    def parse_page(page):
+        slice_key, start_index, res = page
+        results_total, results_current_length = get_page_stats(res)
+        progress = (slice_key, start_index + results_current_length, results_total)
 
         if results_total == 0:
             logging.info("No results returned.")
-            return
+            return progress, [], [], []
 
         logging.info(
-            f"Processing results {results_processed}-{results_processed + results_current_length}/{results_total}..."
+            f"Processing results {start_index}-{start_index + results_current_length}/{results_total}..."
         )
 
-        parsed_results = [
-            {**x, "search_query": f"{postal_code}~{km_radius}~{publication_date}"}
-            for x in parse_funda_results(res)
-            if x
-        ]
+        res = drop_seen_hits(res, seen_ids)
+        repeated_ids = []
+        if seen is not None:
+            res, repeated_ids = drop_repeated_hits(res, seen)
+            if repeated_ids:
+                logging.info(
+                    f"Skipping {len(repeated_ids)} listings found by earlier searches."
+                )
+                metrics.inc("listings_repeated_total", len(repeated_ids))
+        if known_hashes:
+            changed = drop_unchanged_hits(res, known_hashes)
+            unchanged = get_page_stats(res)[1] - get_page_stats(changed)[1]
+            if unchanged:
+                logging.info(f"Skipping {unchanged} unchanged listings.")
+                metrics.inc("listings_unchanged_total", unchanged)
+            res = changed
 
-        store_results(parsed_results, "funda", connection)
+        known_insights = {}
+        if refresh_policy is not None:
+            hits = res["responses"][0]["hits"]["hits"]
+            stored = sink.load_listing_insights([hit.get("_id") for hit in hits])
+            known_insights = refresh_policy.get_fresh_insights(hits, stored)
+            metrics.inc("listing_insights_reused_total", len(known_insights))
 
-        results_processed += results_current_length
+        with metrics.timer("parse_page_seconds"):
+            parsed_results = parse_funda_results(
+                res,
+                insights_concurrency=insights_concurrency,
+                known_insights=known_insights,
+                # Insights not carried forward are fetched now, never from the
+                # cache, so `fetched_at` below is when they were fetched
+                refresh_insights=refresh_policy is not None,
+            )
+        metrics.inc("listings_parsed_total", len(parsed_results))
+
+        fetched_insights = []
+        fetched_at = datetime.datetime.now()
+        for listing in parsed_results:
+            listing.search_query = search_query
+            if (
+                refresh_policy is not None
+                and listing["listing_id"] not in known_insights
+                and listing["listing_nr_of_views"] is not None
+            ):
+                fetched_insights.append(
+                    (
+                        listing["listing_id"],
+                        listing["listing_nr_of_views"],
+                        listing["listing_nr_of_saves"],
+                        fetched_at,
+                    )
+                )
+        return progress, parsed_results, repeated_ids, fetched_insights
 
-        time.sleep(sleep_between_requests_sec)
+    failed_pages = []
+    truncated = {}
 
-    if results_processed >= ES_MAX_RESULT_WINDOW and results_processed < results_total:
-        logging.warning(
-            f"Reached Elasticsearch max result window ({ES_MAX_RESULT_WINDOW}). "
-            f"Processed {results_processed}/{results_total} results for postal code {postal_code}. "
-            f"Consider using a smaller radius or more restrictive date filter."
+    def store_page(parsed_page):
+        progress, parsed_results, repeated_ids, fetched_insights = parsed_page
+        with metrics.timer("store_page_seconds"):
+            counts = sink.write(parsed_results)
+            if repeated_ids:
+                sink.write_search_listings(search_query, repeated_ids)
+            if fetched_insights:
+                sink.write_listing_insights(fetched_insights)
+            events = []
+            # Rows that failed to store aren't recorded, a resumed run stores
+            # the page again and reports its changes then
+            if changes is not None and not counts.get("failed"):
+                events = changes.record(parsed_results, sink)
+        for result, count in counts.items():
+            metrics.inc("rows_total", count, result=result)
+        for event in events:
+            metrics.inc("listing_events_total", event=event[1])
+        if events:
+            logging.info(f"Found {len(events)} new or changed listings.")
+        if "queued" in counts:
+            logging.info(f"Queued {counts['queued']} rows for writing.")
+        else:
+            logging.info(
+                f"Stored {counts['inserted']} new rows, skipped {counts['skipped']} "
+                f"existing rows, {counts['failed']} failed."
+            )
+        if counts.get("failed"):
+            failed_pages.append(progress)
+        # After a failed page the checkpoint stays before it, so a resumed
+        # run stores its rows again
+        if checkpoints is not None and not failed_pages:
+            # Sinks that write in the background save it once the page is stored
+            sink.after_stored(
+                lambda: checkpoints.save(checkpoint_key, *progress, run_id=run_id)
+            )
+        return counts
+
+    pages = iter_search_pages(
+        postal_code,
+        km_radius,
+        publication_date,
+        pages_per_request=pages_per_request,
+        split_queries=split_queries,
+        resume_from=resume_from,
+        filters=filters,
+        truncated=truncated,
+    )
+    if archive is not None:
+        pages = archive.archive_pages(pages, search_query)
+    if stop_event is not None:
+        pages = iter_until_stopped(pages, stop_event)
+
+    succeeded = False
+    try:
+        if pipelined:
+            # Fetching, parsing (incl. insights) and storing overlap, the search
+            # rate limiter only holds up the fetch stage
+            report = run_pipeline(pages, [("parse", parse_page), ("store", store_page)])
+            for stage, stage_stats in report.items():
+                metrics.set(
+                    "pipeline_items_per_second",
+                    stage_stats["items_per_sec"],
+                    stage=stage,
+                )
+                metrics.set(
+                    "pipeline_utilisation", stage_stats["utilisation"], stage=stage
+                )
+        else:
+            for page in pages:
+                store_page(parse_page(page))
+        if stop_event is not None and stop_event.is_set():
+            logging.warning(f"Stopped {search_query} before all pages were fetched.")
+            return truncated
+        for slice_key, results in truncated.items():
+            metrics.inc(
+                "results_truncated_total",
+                results,
+                search_query=search_query,
+                slice=slice_key,
+            )
+        sink.flush()
+        if failed_pages:
+            # Raised like other failures, so the search is retried (a worker
+            # task is failed, `track` reports the postal code) and resumed
+            raise RuntimeError(
+                f"{len(failed_pages)} pages of {search_query} failed to store, "
+                "kept the checkpoint before the first one."
+            )
+        succeeded = True
+        if checkpoints is not None:
+            checkpoints.clear(checkpoint_key)
+    finally:
+        # Per search, a run of several searches keeps the gauges of each
+        metrics.set(
+            "run_duration_seconds",
+            round(time.perf_counter() - started, 3),
+            search_query=search_query,
         )
+        metrics.set("run_success", int(succeeded), search_query=search_query)
+        export_metrics(metrics_textfile, metrics_json)
+
+    return truncated
+
+
+def iter_until_stopped(pages, stop_event):
+    """Pass on pages until `stop_event` is set, checked before each fetch."""
+    for page in pages:
+        yield page
+        if stop_event.is_set():
+            return
+
+
+def export_metrics(textfile=None, json_path=None):
+    """
+    Write the run metrics as a Prometheus textfile and/or a JSON summary.
+
+    Request rates of the clients are added as gauges first, so the exported
+    files reflect where the rate limiters ended up.
+    """
+    for endpoint, client in [("search", search_client), ("insights", insights_client)]:
+        if client.rate_limiter is not None:
+            metrics.set("request_rate", client.rate_limiter.rate, client=endpoint)
 
-    return
+    if textfile:
+        metrics.write_textfile(textfile)
+        logging.info(f"Wrote metrics textfile to {textfile}")
+    if json_path:
+        metrics.write_json(json_path)
+        logging.info(f"Wrote metrics summary to {json_path}")
@@ -0,0 +1,163 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "mean": round(self.sum / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+        }
+
+
+class Metrics:
+    """
+    Counters, gauges and latency histograms for a single run.
+
+    Every series is tagged with the `run_id` and can be exported as a
+    Prometheus textfile (for the node exporter textfile collector) or as a
+    JSON summary.
+    """
+
+    def __init__(self, run_id, prefix="fundatracker"):
+        # A function returning the id labels series with the run exporting them
+        self._run_id = run_id
+        self.prefix = prefix
+        self._types = {}
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @property
+    def run_id(self):
+        return self._run_id() if callable(self._run_id) else self._run_id
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = self._key(name, "counter", labels)
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[self._key(name, "gauge", labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = self._key(name, "histogram", labels)
+            if key not in self._values:
+                self._values[key] = Histogram()
+            self._values[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the `with` block in the `name` histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def get(self, name, **labels):
+        return self._values.get(
+            (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        )
+
+    def reset(self):
+        with self._lock:
+            self._types = {}
+            self._values = {}
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, metric_type in sorted(self._types.items()):
+                full_name = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full_name} {metric_type}")
+                for (key_name, labels), value in sorted(
+                    self._values.items(), key=lambda item: str(item[0])
+                ):
+                    if key_name != name:
+                        continue
+                    if metric_type == "histogram":
+                        lines += self._format_histogram(full_name, labels, value)
+                    else:
+                        lines.append(f"{full_name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        metrics = {}
+        with self._lock:
+            for (name, labels), value in self._values.items():
+                series = {
+                    "labels": dict(labels),
+                    "value": value.summary() if isinstance(value, Histogram) else value,
+                }
+                metrics.setdefault(name, []).append(series)
+        return {"run_id": self.run_id, "metrics": metrics}
+
+    def write_textfile(self, path):
+        _write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2, default=str) + "\n")
+
+    def _key(self, name, metric_type, labels):
+        # Caller must hold the lock
+        known_type = self._types.setdefault(name, metric_type)
+        if known_type != metric_type:
+            raise ValueError(f"Metric {name} is a {known_type}, not a {metric_type}")
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def _labels(self, labels, **extra):
+        labels = {"run_id": self.run_id, **dict(labels), **extra}
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+    def _format_histogram(self, full_name, labels, histogram):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(
+            histogram.buckets, histogram.bucket_counts, strict=True
+        ):
+            cumulative += count
+            lines.append(
+                f"{full_name}_bucket{self._labels(labels, le=bound)} {cumulative}"
+            )
+        lines.append(
+            f"{full_name}_bucket{self._labels(labels, le='+Inf')} {histogram.count}"
+        )
+        lines.append(f"{full_name}_sum{self._labels(labels)} {histogram.sum}")
+        lines.append(f"{full_name}_count{self._labels(labels)} {histogram.count}")
+        return lines
+
+
+def _write_atomic(path, content):
+    # Write to a temporary file first, so collectors never read a partial file
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
@@ -0,0 +1,228 @@
+import datetime
+import logging
+import re
+
+PARTITION_KEY = "_processing_time"
+
+# Columns with their own index on every partition. The primary key, which
+# starts with `id`, makes the check for already stored rows fast,
+# `search_query` the known hashes of a search.
+PARTITION_INDEXES = [
+    "listing_id",
+    "address_postal_code",
+    "_run_id",
+    "search_query",
+]
+
+
+def get_month(value):
+    """First day of the month of a date or datetime."""
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def parse_partition_name(table, name):
+    """Month of a partition named by `get_partition_name`, None for others."""
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{4}})_(\d{{2}})", name)
+    if match is None:
+        return None
+    return datetime.date(int(match[1]), int(match[2]), 1)
+
+
+def is_partitioned(conn, table):
+    """
+    Check how a table is stored.
+
+    Returns:
+        bool: True for a partitioned table, False for a plain one and None
+            if the table doesn't exist
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row[0] == "p"
+
+
+def setup_partitioned_table(table, schema, conn, months_ahead=1):
+    """
+    Create `table` partitioned by month on `_processing_time`.
+
+    The primary key of a partitioned table has to include the partition key,
+    so it becomes (`id`, `_processing_time`). Rows are kept unique on `id`
+    by the insert query of `get_insert_query(partitioned=True)` instead.
+    Partitions are created for the current month and `months_ahead` months
+    after it.
+
+    Args:
+        table: Table name
+        schema: Column types, like `get_funda_schema()`
+        conn: Database connection
+        months_ahead: Months to create partitions for in advance
+    """
+    if is_partitioned(conn, table) is False:
+        raise RuntimeError(
+            f"Table {table} exists and isn't partitioned, move its rows with "
+            "`fundatracker partitions --migrate` first."
+        )
+
+    columns = {
+        column: column_type.replace("PRIMARY KEY", "").strip()
+        for column, column_type in schema.items()
+    }
+    conn.cursor().execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table}(
+            {", ".join([f"{k} {v}" for (k, v) in columns.items()])},
+            PRIMARY KEY (id, {PARTITION_KEY})
+        ) PARTITION BY RANGE ({PARTITION_KEY})
+        """
+    )
+
+    # Add columns introduced after the table was first created, new columns
+    # and indexes of the partitioned table are added to all its partitions
+    for column, column_type in columns.items():
+        if column in ("id", PARTITION_KEY):
+            continue
+        conn.cursor().execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+        )
+    for column in PARTITION_INDEXES:
+        conn.cursor().execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_{column}_idx ON {table}({column})"
+        )
+
+    ensure_partitions(conn, table, months_ahead=months_ahead)
+
+
+def create_partition(conn, table, month):
+    name = get_partition_name(table, month)
+    conn.cursor().execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+        FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')
+        """
+    )
+    return name
+
+
+def ensure_partitions(conn, table, now=None, months_ahead=1):
+    """
+    Create the partitions for this month and `months_ahead` next months.
+
+    Call it at least once a month (every run does), rows of a month
+    without a partition can't be stored.
+
+    Returns:
+        list: Names of the partitions
+    """
+    month = get_month(now or datetime.datetime.now())
+    return [
+        create_partition(conn, table, add_months(month, i))
+        for i in range(months_ahead + 1)
+    ]
+
+
+def get_partitions(conn, table):
+    """
+    List the monthly partitions of a table.
+
+    Returns:
+        list: Tuples of partition name and month, oldest first
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        """,
+        (table,),
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        month = parse_partition_name(table, name)
+        if month is not None:
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def drop_old_partitions(conn, table, retention_months, now=None):
+    """
+    Drop partitions of the months before the last `retention_months` months.
+
+    The current month counts as one, so `retention_months=12` keeps this
+    month and the 11 before it. Dropping a partition is instant and leaves
+    no dead rows behind, unlike deleting old rows.
+
+    Returns:
+        list: Names of the dropped partitions
+    """
+    if retention_months < 1:
+        raise ValueError("Keep at least one month of partitions")
+
+    oldest = add_months(get_month(now or datetime.datetime.now()), 1 - retention_months)
+    dropped = []
+    for name, month in get_partitions(conn, table):
+        if month >= oldest:
+            break
+        conn.cursor().execute(f"DROP TABLE {name}")
+        logging.info(f"Dropped partition {name}")
+        dropped.append(name)
+    return dropped
+
+
+def migrate_to_partitioned(conn, table, schema, months_ahead=1):
+    """
+    Move the rows of a plain table into a new partitioned table.
+
+    The plain table is renamed to `<table>_unpartitioned` and kept, drop it
+    once the migration is checked. Rows without a `_processing_time` can't
+    be placed in a partition and stay behind. Runs in one transaction, stop
+    writers to the table while it runs.
+
+    Returns:
+        int: Number of moved rows
+    """
+    old_table = f"{table}_unpartitioned"
+    with conn.transaction():
+        cursor = conn.cursor()
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        # Frees the constraint name for the primary key of the new table
+        cursor.execute(
+            f"ALTER TABLE {old_table} RENAME CONSTRAINT {table}_pkey TO {old_table}_pkey"
+        )
+        setup_partitioned_table(table, schema, conn, months_ahead=months_ahead)
+
+        cursor.execute(
+            f"SELECT min({PARTITION_KEY}), max({PARTITION_KEY}) FROM {old_table}"
+        )
+        first, last = cursor.fetchone()
+        if first is not None:
+            month = get_month(first)
+            while month <= get_month(last):
+                create_partition(conn, table, month)
+                month = add_months(month, 1)
+
+        columns = ", ".join(schema)
+        cursor.execute(
+            f"""
+            INSERT INTO {table}({columns})
+            SELECT {columns} FROM {old_table}
+            WHERE {PARTITION_KEY} IS NOT NULL
+            """
+        )
+        moved = cursor.rowcount
+
+    logging.info(f"Moved {moved} rows from {old_table} into partitioned {table}")
+    return moved
@@ -0,0 +1,150 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+
+# Marks the end of the stream between two stages
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_sec = 0.0
+
+    def record(self, busy_sec):
+        self.items += 1
+        self.busy_sec += busy_sec
+
+    def as_dict(self, elapsed_sec):
+        return {
+            "items": self.items,
+            "busy_sec": round(self.busy_sec, 3),
+            "items_per_sec": round(self.items / elapsed_sec, 3) if elapsed_sec else 0.0,
+            "utilisation": round(self.busy_sec / elapsed_sec, 3)
+            if elapsed_sec
+            else 0.0,
+        }
+
+
+def run_pipeline(source, stages, source_name="fetch", queue_size=2):
+    """
+    Run a source iterator and a chain of stages concurrently.
+
+    Every stage runs in its own thread and is connected to the previous one by
+    a bounded queue, so e.g. page N+1 is fetched while page N is parsed and
+    page N-1 is stored. Items keep their order. The first exception raised by
+    any stage stops the pipeline and is re-raised.
+
+    Args:
+        source: Iterable producing the items for the first stage
+        stages: List of (name, function) tuples, each function receives the
+            output of the previous stage
+        source_name: Name of the source stage in the returned stats
+        queue_size: Maximum number of items waiting between two stages
+
+    Returns:
+        dict: Items processed, busy time, throughput and utilisation per stage
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = [StageStats(source_name)] + [StageStats(name) for name, _ in stages]
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def produce():
+        try:
+            items = iter(source)
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                stats[0].record(time.perf_counter() - started)
+                if not put(queues[0], item):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(queues[0], _DONE)
+
+    def work(index, func):
+        output = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            while True:
+                item = get(queues[index])
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                result = func(item)
+                stats[index + 1].record(time.perf_counter() - started)
+                if output is not None and not put(output, result):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if output is not None:
+                put(output, _DONE)
+
+    # Stages run in the caller's context, e.g. with the id of its run
+    threads = [
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(produce,),
+            name=source_name,
+            daemon=True,
+        )
+    ]
+    threads += [
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(work, i, func),
+            name=name,
+            daemon=True,
+        )
+        for i, (name, func) in enumerate(stages)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+    except BaseException:
+        stop.set()
+        raise
+    elapsed_sec = time.perf_counter() - started
+
+    if errors:
+        raise errors[0]
+
+    report = {stage.name: stage.as_dict(elapsed_sec) for stage in stats}
+    for name, stage in report.items():
+        logging.info(
+            f"Pipeline stage {name}: {stage['items']} items, {stage['busy_sec']}s busy, "
+            f"{stage['items_per_sec']} items/s, {stage['utilisation']:.0%} utilised"
+        )
+    return report
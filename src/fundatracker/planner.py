@@ -0,0 +1,303 @@
+import csv
+import heapq
+import logging
+import math
+
+from .funda import ES_MAX_RESULT_WINDOW
+
+# Radii of the `area_with_radius.N` search paths
+RADII = [1, 2, 5, 10, 15, 30, 50, 100]
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class PostalArea:
+    __slots__ = ("postal_code", "lat", "lon", "province", "listings")
+
+    def __init__(self, postal_code, lat, lon, province=None, listings=None):
+        self.postal_code = int(postal_code)
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.province = province or None
+        self.listings = None if listings in (None, "") else int(listings)
+
+    def __repr__(self):
+        return f"PostalArea({self.postal_code} @ {self.lat:.4f},{self.lon:.4f})"
+
+
+class PlannedSearch:
+    __slots__ = ("postal_code", "km_radius", "covers", "estimated_results")
+
+    def __init__(self, postal_code, km_radius, covers, estimated_results):
+        self.postal_code = postal_code
+        self.km_radius = km_radius
+        self.covers = covers
+        self.estimated_results = estimated_results
+
+    def __repr__(self):
+        return (
+            f"PlannedSearch({self.postal_code}~{self.km_radius}: "
+            f"{len(self.covers)} areas, ~{self.estimated_results} results)"
+        )
+
+
+def load_postal_areas(path):
+    """
+    Read postal-4 areas from a CSV file.
+
+    The file needs `postal_code`, `lat` and `lon` columns with the centroid
+    of every area (e.g. from the CBS/PDOK postal code data), and can add a
+    `province` and a `listings` estimate per area.
+
+    Returns:
+        list: PostalArea for every row
+    """
+    with open(path, newline="") as f:
+        return [
+            PostalArea(
+                row["postal_code"],
+                row["lat"],
+                row["lon"],
+                province=row.get("province"),
+                listings=row.get("listings"),
+            )
+            for row in csv.DictReader(f)
+        ]
+
+
+def load_listing_counts(conn, table="funda", days=30):
+    """
+    Count the listings stored per postal-4 area over the last `days` days.
+
+    Returns:
+        dict: Postal code mapped to its number of listings
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT left(address_postal_code, 4), count(DISTINCT listing_id)
+        FROM {table}
+        WHERE _processing_time > now() - make_interval(days => %s)
+            AND address_postal_code ~ '^[0-9]{{4}}'
+        GROUP BY 1
+        """,
+        (days,),
+    )
+    return {int(postal_code): count for postal_code, count in cursor.fetchall()}
+
+
+def select_targets(areas, postal_codes=None, province=None):
+    """Areas to cover: the given postal codes and/or all areas of a province."""
+    postal_codes = set(postal_codes or [])
+    targets = [
+        area
+        for area in areas
+        if area.postal_code in postal_codes
+        or (province and (area.province or "").lower() == province.lower())
+    ]
+    missing = postal_codes - {area.postal_code for area in targets}
+    if missing:
+        raise ValueError(f"Postal codes without a known location: {sorted(missing)}")
+    return targets
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class _GridIndex:
+    """Areas bucketed in cells of about `cell_km`, to find neighbours quickly."""
+
+    def __init__(self, areas, cell_km=10.0):
+        self.cell_deg = cell_km / 111.0
+        self.cells = {}
+        for area in areas:
+            self.cells.setdefault(self._cell(area.lat, area.lon), []).append(area)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def within(self, center, km):
+        # Longitude degrees shrink towards the poles, widen the search to match
+        lat_cells = math.ceil(km / 111.0 / self.cell_deg)
+        lon_cells = math.ceil(lat_cells / max(math.cos(math.radians(center.lat)), 0.01))
+        lat_cell, lon_cell = self._cell(center.lat, center.lon)
+        # Flat earth distances, within 0.5% of `haversine_km` up to 100 km
+        km_per_lat = 110.57
+        km_per_lon = 111.32 * math.cos(math.radians(center.lat))
+        max_distance = km * km
+        return [
+            area
+            for i in range(lat_cell - lat_cells, lat_cell + lat_cells + 1)
+            for j in range(lon_cell - lon_cells, lon_cell + lon_cells + 1)
+            for area in self.cells.get((i, j), [])
+            if ((area.lat - center.lat) * km_per_lat) ** 2
+            + ((area.lon - center.lon) * km_per_lon) ** 2
+            <= max_distance
+        ]
+
+
+def estimate_requests(results, results_per_page=15, pages_per_request=1):
+    """Search requests to fetch `results` results, the first page included."""
+    pages = max(1, math.ceil(min(results, ES_MAX_RESULT_WINDOW) / results_per_page))
+    return 1 + math.ceil((pages - 1) / pages_per_request)
+
+
+def plan_searches(
+    areas,
+    targets,
+    radii=RADII,
+    listings_per_area=25,
+    max_results=ES_MAX_RESULT_WINDOW,
+    results_per_page=15,
+    pages_per_request=1,
+    search_overhead=5,
+):
+    """
+    Choose a small set of (postal code, radius) searches covering `targets`.
+
+    An area counts as covered by a search when its centroid lies within the
+    radius of the search's postal code centroid. Searches are picked greedily
+    by the number of target listings they add per search request, counting
+    listings of areas outside the target (and already covered ones) as cost.
+    Every search also costs `search_overhead` requests, so larger searches
+    with a little overlap win over many small ones.
+    Searches estimated above `max_results` results are left out, so every
+    search fits in the result window. Searches that turn out to be redundant
+    are dropped afterwards.
+
+    Args:
+        areas: All known PostalArea, also those outside the target
+        targets: PostalArea to cover, taken from `areas`
+        radii: Radii to choose from
+        listings_per_area: Listings estimate for areas without one
+        max_results: Maximum estimated results per search
+        results_per_page: Results per search page, for the request estimate
+        pages_per_request: Pages fetched per request after the first
+        search_overhead: Extra cost of a search, in requests
+
+    Returns:
+        list: PlannedSearch, in the order they were picked
+    """
+    if not targets:
+        return []
+
+    def listings(area):
+        return listings_per_area if area.listings is None else area.listings
+
+    index = _GridIndex(areas)
+    target_codes = {area.postal_code for area in targets}
+    weights = {area.postal_code: max(listings(area), 1) for area in targets}
+
+    candidates = []
+    for center in targets:
+        for km_radius in sorted(radii):
+            members = index.within(center, km_radius)
+            estimated_results = sum(listings(area) for area in members)
+            if estimated_results > max_results:
+                break
+            covers = frozenset(
+                area.postal_code for area in members if area.postal_code in target_codes
+            )
+            cost = search_overhead + estimate_requests(
+                estimated_results, results_per_page, pages_per_request
+            )
+            candidates.append(
+                (center.postal_code, km_radius, covers, estimated_results, cost)
+            )
+
+    uncovered = set(target_codes)
+    selected = []
+
+    def gain(candidate):
+        return sum(weights[code] for code in candidate[2] & uncovered) / candidate[4]
+
+    # Lazy greedy: gains only drop as more is covered, so a candidate whose
+    # recomputed gain still beats the best stored gain is the best choice
+    heap = [(-gain(c), i) for i, c in enumerate(candidates)]
+    heapq.heapify(heap)
+    while uncovered and heap:
+        _, i = heapq.heappop(heap)
+        current = gain(candidates[i])
+        if current <= 0:
+            continue
+        if heap and current < -heap[0][0]:
+            heapq.heappush(heap, (-current, i))
+            continue
+        selected.append(candidates[i])
+        uncovered -= candidates[i][2]
+
+    for postal_code in sorted(uncovered):
+        # Even its own area doesn't fit in the window, splitting the search
+        # into slices at run time has to handle it
+        logging.warning(
+            f"Postal code {postal_code} has more than {max_results} estimated "
+            "results at the smallest radius."
+        )
+        area = next(area for area in targets if area.postal_code == postal_code)
+        selected.append(
+            (postal_code, min(radii), frozenset([postal_code]), listings(area), None)
+        )
+
+    # Drop searches whose areas are all covered by the other searches
+    for candidate in reversed(list(selected)):
+        others = set().union(*(c[2] for c in selected if c is not candidate))
+        if candidate[2] <= others:
+            selected.remove(candidate)
+
+    return [
+        PlannedSearch(postal_code, km_radius, sorted(covers), estimated_results)
+        for postal_code, km_radius, covers, estimated_results, _ in selected
+    ]
+
+
+def estimate_cost(
+    searches,
+    targets,
+    listings_per_area=25,
+    results_per_page=15,
+    pages_per_request=1,
+    search_rate=0.5,
+):
+    """
+    Estimate what running a plan costs, before anything is requested.
+
+    Args:
+        searches: PlannedSearch of a plan
+        targets: PostalArea the plan covers
+        listings_per_area: Listings estimate for areas without one
+        results_per_page: Results per search page
+        pages_per_request: Pages fetched per request after the first
+        search_rate: Search requests per second (the search rate limiter's
+            starting rate)
+
+    Returns:
+        dict: Number of searches, estimated results (with overlap), unique
+            target listings, overlap ratio, search requests, listing insight
+            requests (one per unique listing) and minutes spent on searching
+    """
+    estimated_results = sum(search.estimated_results for search in searches)
+    unique_listings = sum(
+        listings_per_area if area.listings is None else area.listings
+        for area in targets
+    )
+    search_requests = sum(
+        estimate_requests(search.estimated_results, results_per_page, pages_per_request)
+        for search in searches
+    )
+    return {
+        "searches": len(searches),
+        "estimated_results": estimated_results,
+        "unique_listings": unique_listings,
+        "overlap": round(estimated_results / unique_listings, 2)
+        if unique_listings
+        else None,
+        "search_requests": search_requests,
+        "insight_requests": unique_listings,
+        "search_minutes": round(search_requests / search_rate / 60, 1),
+    }
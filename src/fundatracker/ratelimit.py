@@ -0,0 +1,115 @@
+import datetime
+import email.utils
+import logging
+import threading
+import time
+
+# Responses that tell us to slow down, and are worth retrying
+THROTTLE_STATUS_CODES = (429, 503)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """
+    Adaptive token bucket for a single host.
+
+    Requests take a token from a bucket that refills at `rate` tokens per
+    second. The rate is adjusted AIMD style: it grows by `increase` after
+    every fast, successful response and is multiplied by `decrease` when the
+    host throttles (429/503), fails or responds slower than
+    `latency_target_sec`. A `Retry-After` header pauses all requests to the
+    host until it has passed.
+    """
+
+    def __init__(
+        self,
+        rate,
+        burst=1,
+        min_rate=0.05,
+        max_rate=10.0,
+        increase=0.05,
+        decrease=0.5,
+        latency_target_sec=2.0,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target_sec = latency_target_sec
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "slow": 0}
+
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the next request to this host is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # Reserve a token, the bucket can go negative while we wait for it
+            self._tokens -= 1
+            wait_sec = max(-self._tokens / self.rate, self._blocked_until - now, 0)
+            self.stats["requests"] += 1
+
+        if wait_sec:
+            time.sleep(wait_sec)
+
+    def observe(self, status_code, latency_sec, retry_after_sec=None):
+        """Adjust the rate based on the outcome of a request."""
+        with self._lock:
+            if status_code in THROTTLE_STATUS_CODES:
+                self.stats["throttled"] += 1
+                self._slow_down()
+            elif status_code is None or status_code >= 500:
+                self.stats["errors"] += 1
+                self._slow_down()
+            elif latency_sec > self.latency_target_sec:
+                self.stats["slow"] += 1
+                self._slow_down()
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+            if retry_after_sec:
+                self._blocked_until = max(
+                    self._blocked_until, time.monotonic() + retry_after_sec
+                )
+
+    def backoff(self, seconds):
+        """Pause all requests to this host for `seconds`."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def _slow_down(self):
+        # Caller must hold the lock
+        rate = max(self.min_rate, self.rate * self.decrease)
+        if rate != self.rate:
+            logging.debug(
+                f"Lowering request rate from {self.rate:.2f}/s to {rate:.2f}/s"
+            )
+        self.rate = rate
+
+
+def parse_retry_after(value):
+    """Parse a `Retry-After` header (seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.UTC)
+    return max((retry_at - datetime.datetime.now(datetime.UTC)).total_seconds(), 0.0)
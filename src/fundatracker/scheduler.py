@@ -0,0 +1,225 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(value):
+    """
+    Parse an interval like `90`, `30s`, `15m`, `6h` or `1d` into seconds.
+
+    Returns:
+        float: Number of seconds
+    """
+    if isinstance(value, int | float):
+        return float(value)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(value))
+    if match is None:
+        raise ValueError(f"Invalid interval {value!r}, use e.g. 30s, 15m, 6h or 1d")
+    number, unit = match.groups()
+    return float(number) * INTERVAL_UNITS[unit or "s"]
+
+
+def get_next_run(now, interval_sec, offset_sec=0.0):
+    """
+    First time after `now` on the interval's grid, like cron.
+
+    The grid starts at the Unix epoch (midnight UTC) shifted by `offset_sec`,
+    so `every=1d, offset=6h` runs daily at 06:00 UTC and `every=6h` runs at
+    00:00, 06:00, 12:00 and 18:00 UTC.
+    """
+    periods = (now - offset_sec) // interval_sec + 1
+    return periods * interval_sec + offset_sec
+
+
+class Job:
+    """A search run by the scheduler every `interval_sec`."""
+
+    def __init__(
+        self,
+        name,
+        postal_code,
+        km_radius,
+        publication_date="now-30d",
+        every="1d",
+        offset=0,
+        jitter=0,
+        filters=None,
+        run_on_start=False,
+    ):
+        self.name = name
+        self.postal_code = postal_code
+        self.km_radius = km_radius
+        self.publication_date = publication_date
+        self.interval_sec = parse_interval(every)
+        self.offset_sec = parse_interval(offset)
+        self.jitter_sec = parse_interval(jitter)
+        self.filters = filters
+        self.run_on_start = run_on_start
+        self.next_run = None
+
+    def __repr__(self):
+        return (
+            f"Job({self.name}: {self.postal_code}~{self.km_radius}~"
+            f"{self.publication_date} every {self.interval_sec:g}s)"
+        )
+
+
+def load_jobs(path):
+    """
+    Read jobs from a JSON file.
+
+    The file holds a list of jobs, e.g.
+    `{"jobs": [{"name": "utrecht", "postal_code": 3511, "km_radius": 5,
+    "publication_date": "now-1d", "every": "6h", "jitter": "10m"}]}`. Jobs
+    without a name are named after their search.
+
+    Returns:
+        list: Job for every entry
+    """
+    with open(path) as f:
+        config = json.load(f)
+
+    jobs = []
+    for entry in config["jobs"]:
+        entry = dict(entry)
+        entry.setdefault(
+            "name",
+            f"{entry['postal_code']}~{entry['km_radius']}~"
+            f"{entry.get('publication_date', 'now-30d')}",
+        )
+        jobs.append(Job(**entry))
+
+    names = [job.name for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Job names must be unique, found duplicates: {duplicates}")
+    return jobs
+
+
+class Scheduler:
+    """
+    Run jobs on their interval until stopped.
+
+    Every job's run is delayed by a random part of its jitter, so jobs on the
+    same grid don't all hit Funda at the same moment. At most
+    `max_concurrent` jobs run at the same time, due jobs wait for a free
+    slot. A job never overlaps itself: when it is still running at its next
+    run time, that run is skipped.
+
+    Once `stop_event` is set no more jobs are started, and `run` returns when
+    the running jobs have finished. Pass the same event to the jobs to let
+    them stop early.
+    """
+
+    def __init__(
+        self,
+        jobs,
+        run_job,
+        max_concurrent=1,
+        stop_event=None,
+        metrics=None,
+        tick_sec=1.0,
+        clock=time.time,
+        rng=None,
+    ):
+        self.jobs = jobs
+        self.run_job = run_job
+        self.max_concurrent = max_concurrent
+        self.stop_event = stop_event or threading.Event()
+        self.metrics = metrics
+        self.tick_sec = tick_sec
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.stats = {"started": 0, "completed": 0, "failed": 0, "skipped": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, result, job):
+        with self._lock:
+            self.stats[result] += 1
+        if self.metrics is not None:
+            self.metrics.inc("scheduled_runs_total", job=job.name, result=result)
+
+    def schedule(self, job, now):
+        job.next_run = get_next_run(now, job.interval_sec, job.offset_sec)
+        job.next_run += self.rng.uniform(0, job.jitter_sec)
+        logging.info(
+            f"Next run of {job.name} at "
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job.next_run))}"
+        )
+
+    def _run(self, job):
+        started = time.perf_counter()
+        logging.info(f"Running {job}")
+        try:
+            self.run_job(job)
+        except Exception as e:
+            logging.error(f"Job {job.name} failed: {e}")
+            self._count("failed", job)
+        else:
+            self._count("completed", job)
+        finally:
+            duration = round(time.perf_counter() - started, 3)
+            logging.info(f"Job {job.name} finished after {duration}s")
+            if self.metrics is not None:
+                self.metrics.set("job_duration_seconds", duration, job=job.name)
+
+    def run(self):
+        """
+        Schedule and run the jobs until `stop_event` is set.
+
+        Returns:
+            dict: Number of runs started, completed, failed and skipped
+        """
+        now = self.clock()
+        for job in self.jobs:
+            if job.run_on_start:
+                job.next_run = now
+            else:
+                self.schedule(job, now)
+
+        running = {}
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrent, thread_name_prefix="job"
+        ) as executor:
+            while not self.stop_event.is_set():
+                running = {
+                    name: future
+                    for name, future in running.items()
+                    if not future.done()
+                }
+                now = self.clock()
+                waiting = False
+                for job in sorted(self.jobs, key=lambda job: job.next_run):
+                    if job.next_run > now or self.stop_event.is_set():
+                        break
+                    if job.name in running:
+                        logging.warning(f"Skipping {job.name}, it is still running.")
+                        self._count("skipped", job)
+                        self.schedule(job, now)
+                        continue
+                    if len(running) >= self.max_concurrent:
+                        waiting = True
+                        break
+                    self._count("started", job)
+                    running[job.name] = executor.submit(self._run, job)
+                    self.schedule(job, now)
+
+                if waiting:
+                    timeout = self.tick_sec
+                else:
+                    next_run = min(
+                        (job.next_run for job in self.jobs), default=float("inf")
+                    )
+                    timeout = min(max(next_run - self.clock(), 0), self.tick_sec)
+                self.stop_event.wait(timeout)
+
+            running = [name for name, future in running.items() if not future.done()]
+            if running:
+                logging.info(f"Stopping, waiting for running jobs: {running}")
+        return self.stats
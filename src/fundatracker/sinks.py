@@ -0,0 +1,728 @@
+import asyncio
+import concurrent.futures
+import datetime
+import glob
+import logging
+import os
+import threading
+import uuid
+
+import psycopg
+
+from . import changes, funda
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional, install with `fundatracker[parquet]`
+    pa = pq = None
+
+
+class Sink:
+    """
+    Destination for parsed listings.
+
+    `tracker` writes every page of parsed listings with `write`. Sinks that
+    can tell which listings are already stored also support delta mode
+    through `load_known_hashes`.
+    """
+
+    def write(self, results):
+        """
+        Store a page of parsed listings.
+
+        Returns:
+            dict: Number of rows inserted, skipped (already stored) and failed
+        """
+        raise NotImplementedError
+
+    def load_known_hashes(self, search_query):
+        """Latest stored content hash per listing id for a search query."""
+        raise NotImplementedError(f"{type(self).__name__} doesn't support delta mode")
+
+    def write_search_listings(self, search_query, listing_ids):
+        """
+        Record that listings stored for another search were also found by
+        `search_query`. Sinks that don't keep these links ignore them.
+        """
+        return 0
+
+    def load_listing_insights(self, listing_ids):
+        """
+        Last fetched insights of listings, for an `InsightsRefreshPolicy`.
+        Sinks that don't keep them return nothing, so insights are fetched.
+        """
+        return {}
+
+    def write_listing_insights(self, insights):
+        """Store (listing id, views, saves, fetched at) of fetched insights."""
+        return 0
+
+    def load_listing_state(self, listing_ids):
+        """
+        Current state of listings, for `ListingChanges`. Sinks that don't
+        keep it return nothing, so every listing is reported as listed.
+        """
+        return {}
+
+    def write_listing_state(self, states):
+        """Store the new state of changed listings."""
+        return 0
+
+    def write_listing_events(self, events):
+        """Store change events of listings."""
+        return 0
+
+    def after_stored(self, callback):
+        """Call `callback` once everything written so far is stored."""
+        callback()
+
+    def flush(self):
+        """Wait until everything written so far is stored."""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PostgresSink(Sink):
+    def __init__(
+        self,
+        connection,
+        table="funda",
+        batch=False,
+        search_listings_table="funda_search_listings",
+        listing_insights_table="funda_listing_insights",
+        partitioned=False,
+        listing_state_table="funda_listing_state",
+        listing_events_table="funda_listing_events",
+    ):
+        self.connection = connection
+        self.table = table
+        self.batch = batch
+        self.partitioned = partitioned
+        self.search_listings_table = search_listings_table
+        self.listing_insights_table = listing_insights_table
+        self.listing_state_table = listing_state_table
+        self.listing_events_table = listing_events_table
+
+    def write(self, results):
+        return funda.store_results(
+            results,
+            self.table,
+            self.connection,
+            batch=self.batch,
+            partitioned=self.partitioned,
+        )
+
+    def load_known_hashes(self, search_query):
+        return funda.load_known_hashes(self.connection, self.table, search_query)
+
+    def write_search_listings(self, search_query, listing_ids):
+        return funda.store_search_listings(
+            listing_ids, search_query, self.search_listings_table, self.connection
+        )
+
+    def load_listing_insights(self, listing_ids):
+        return funda.load_listing_insights(
+            self.connection, self.listing_insights_table, listing_ids
+        )
+
+    def write_listing_insights(self, insights):
+        return funda.store_listing_insights(
+            insights, self.listing_insights_table, self.connection
+        )
+
+    def load_listing_state(self, listing_ids):
+        return changes.load_listing_state(
+            self.connection, self.listing_state_table, listing_ids
+        )
+
+    def write_listing_state(self, states):
+        return changes.store_listing_state(
+            states, self.listing_state_table, self.connection
+        )
+
+    def write_listing_events(self, events):
+        return changes.store_listing_events(
+            events, self.listing_events_table, self.connection
+        )
+
+
+class AsyncPostgresSink(Sink):
+    """
+    Write listings to Postgres in the background.
+
+    Pages are put on a bounded queue and written by a task on an asyncio event
+    loop in its own thread, over a psycopg `AsyncConnection` in pipeline mode
+    with one transaction per page. The tracker only waits for the database
+    when `max_queue_pages` pages are waiting to be written.
+
+    A lost connection is opened again with exponential backoff, and the page
+    is retried on the new connection. Pages still failing after
+    `max_retries` reconnects are counted as failed.
+
+    `write` returns the number of queued rows, the inserted, skipped and
+    failed rows are counted in `stats` (and the `rows_total` metric) once
+    written. After a page failed `after_stored` callbacks are skipped, so
+    checkpoints stay before it, and the next `flush` raises.
+    Reads use a separate synchronous connection.
+    """
+
+    def __init__(
+        self,
+        conninfo,
+        table="funda",
+        max_queue_pages=16,
+        max_retries=10,
+        reconnect_delay_sec=1.0,
+        max_reconnect_delay_sec=30.0,
+        search_listings_table="funda_search_listings",
+        listing_insights_table="funda_listing_insights",
+        partitioned=False,
+        listing_state_table="funda_listing_state",
+        listing_events_table="funda_listing_events",
+    ):
+        self.conninfo = conninfo
+        self.table = table
+        self.partitioned = partitioned
+        self.listing_state_table = listing_state_table
+        self.listing_events_table = listing_events_table
+        self.max_retries = max_retries
+        self.reconnect_delay_sec = reconnect_delay_sec
+        self.max_reconnect_delay_sec = max_reconnect_delay_sec
+        self.search_listings_table = search_listings_table
+        self.listing_insights_table = listing_insights_table
+        self.stats = {"inserted": 0, "skipped": 0, "failed": 0, "reconnects": 0}
+        self._connection = None
+        self._read_connection = None
+        self._closed = False
+        self._failed_pages = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="postgres-writer", daemon=True
+        )
+        self._thread.start()
+        self._queue = self._run_in_loop(self._make_queue(max_queue_pages))
+        self._writer = asyncio.run_coroutine_threadsafe(self._write_queue(), self._loop)
+
+    async def _make_queue(self, maxsize):
+        return asyncio.Queue(maxsize=maxsize)
+
+    def _run_in_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _enqueue(self, operation, wait=False):
+        """Queue an operation, blocking while the queue is full."""
+        if self._closed:
+            raise RuntimeError("Can't write to a closed sink")
+        if self._writer.done():
+            # Surfaces the error that stopped the writer
+            self._writer.result()
+
+        done = concurrent.futures.Future()
+        self._run_in_loop(self._queue.put((operation, done)))
+        if wait:
+            return done.result()
+        return done
+
+    async def _write_queue(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            operation, done = item
+            try:
+                done.set_result(await self._with_reconnect(operation))
+            except Exception as e:
+                logging.error(f"Failed to write to Postgres: {e}")
+                done.set_exception(e)
+
+        if self._connection is not None:
+            await self._connection.close()
+
+    async def _with_reconnect(self, operation):
+        delay = self.reconnect_delay_sec
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self._connection is None or self._connection.closed:
+                    self._connection = await psycopg.AsyncConnection.connect(
+                        self.conninfo, autocommit=True
+                    )
+                return await operation(self._connection)
+            except psycopg.OperationalError as e:
+                if self._connection is not None and not self._connection.broken:
+                    # The connection is fine, the statement itself failed
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(
+                    f"Lost connection to Postgres ({e}), reconnecting in {delay}s."
+                )
+                self.stats["reconnects"] += 1
+                if self._connection is not None:
+                    await self._connection.close()
+                    self._connection = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay_sec)
+
+    def _count(self, counts):
+        for result, count in counts.items():
+            self.stats[result] += count
+            funda.metrics.inc("rows_total", count, result=result)
+
+    def write(self, results):
+        records = [funda.prepare_row(result) for result in results]
+        rows = [record.values() for record in records]
+        if not rows:
+            return {"queued": 0}
+
+        query = funda.get_insert_query(self.table, partitioned=self.partitioned)
+        ids = [record["id"] for record in records]
+
+        async def insert(connection):
+            async with connection.transaction():
+                cursor = connection.cursor()
+                if self.partitioned:
+                    await cursor.execute(funda.get_id_lock_query(), (ids,))
+                async with connection.pipeline():
+                    await cursor.executemany(query, rows)
+            inserted = max(cursor.rowcount, 0)
+            return {"inserted": inserted, "skipped": len(rows) - inserted}
+
+        def count(done):
+            if done.exception() is None:
+                self._count(done.result())
+            else:
+                self._failed_pages += 1
+                self._count({"failed": len(rows)})
+
+        self._enqueue(insert).add_done_callback(count)
+        return {"queued": len(rows)}
+
+    def _execute_many(self, query, rows, skip_after_failure=False):
+        async def execute(connection):
+            if skip_after_failure and self._failed_pages:
+                logging.warning("Skipping a write derived from a failed page.")
+                return
+            async with connection.pipeline():
+                await connection.cursor().executemany(query, rows)
+
+        return self._enqueue(execute)
+
+    def write_search_listings(self, search_query, listing_ids):
+        if listing_ids:
+            self._execute_many(
+                funda.get_search_listings_query(self.search_listings_table),
+                funda.get_search_listings_rows(listing_ids, search_query),
+            )
+        return len(listing_ids)
+
+    def write_listing_insights(self, insights):
+        if insights:
+            self._execute_many(
+                funda.get_listing_insights_query(self.listing_insights_table),
+                insights,
+            )
+        return len(insights)
+
+    def write_listing_state(self, states):
+        if states:
+            self._execute_many(
+                changes.get_listing_state_query(self.listing_state_table),
+                states,
+                skip_after_failure=True,
+            )
+        return len(states)
+
+    def write_listing_events(self, events):
+        if events:
+            self._execute_many(
+                changes.get_listing_events_query(self.listing_events_table),
+                events,
+                skip_after_failure=True,
+            )
+        return len(events)
+
+    def after_stored(self, callback):
+        async def call(connection):
+            if self._failed_pages:
+                logging.warning("Skipping callback after a page failed to write.")
+                return
+            # Runs in a worker thread, callbacks may block (e.g. write a file)
+            await asyncio.to_thread(callback)
+
+        self._enqueue(call)
+
+    def flush(self):
+        async def noop(connection):
+            pass
+
+        self._enqueue(noop, wait=True)
+        if self._failed_pages:
+            failed_pages, self._failed_pages = self._failed_pages, 0
+            raise RuntimeError(f"{failed_pages} pages failed to write to Postgres")
+
+    def _read(self, load, *args):
+        """Call `load(connection, *args)`, reconnecting once if needed."""
+        for attempt in range(2):
+            if self._read_connection is None or self._read_connection.closed:
+                self._read_connection = psycopg.connect(self.conninfo, autocommit=True)
+            try:
+                return load(self._read_connection, *args)
+            except psycopg.OperationalError:
+                if attempt or not self._read_connection.broken:
+                    raise
+                self._read_connection.close()
+
+    def load_known_hashes(self, search_query):
+        self.flush()
+        return self._read(funda.load_known_hashes, self.table, search_query)
+
+    def load_listing_insights(self, listing_ids):
+        return self._read(
+            funda.load_listing_insights, self.listing_insights_table, listing_ids
+        )
+
+    def load_listing_state(self, listing_ids):
+        # Queued states aren't visible yet, `ListingChanges` keeps those itself
+        return self._read(
+            changes.load_listing_state, self.listing_state_table, listing_ids
+        )
+
+    def close(self):
+        """Write the queued pages and stop the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        self._run_in_loop(self._queue.put(None))
+        try:
+            self._writer.result()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            if self._read_connection is not None:
+                self._read_connection.close()
+        logging.info(f"Postgres writer stats: {self.stats}")
+
+
+def get_arrow_type(sql_type):
+    """Map a column type of `get_funda_schema()` to an Arrow type."""
+    sql_type = sql_type.upper()
+    if sql_type.startswith("VARCHAR"):
+        return pa.string()
+    if sql_type.startswith("INTEGER"):
+        return pa.int64()
+    if sql_type.startswith("REAL"):
+        return pa.float64()
+    if sql_type.startswith("TIMESTAMP"):
+        return pa.timestamp("us")
+    raise ValueError(f"No Arrow type for column type {sql_type}")
+
+
+SEARCH_LISTINGS_COLUMNS = {
+    "search_query": "VARCHAR(500)",
+    "listing_id": "VARCHAR(100)",
+    "_run_id": "VARCHAR(100)",
+    "_processing_time": "TIMESTAMP",
+}
+
+LISTING_INSIGHTS_COLUMNS = {
+    "listing_id": "VARCHAR(100)",
+    "nr_of_views": "INTEGER",
+    "nr_of_saves": "INTEGER",
+    "fetched_at": "TIMESTAMP",
+}
+
+
+def get_arrow_schema(columns=None):
+    columns = columns or funda.get_funda_schema()
+    return pa.schema(
+        [(column, get_arrow_type(sql_type)) for column, sql_type in columns.items()]
+    )
+
+
+def _to_text(value):
+    if isinstance(value, list):
+        # Same text as Postgres stores for a list in a VARCHAR column
+        return "{" + ",".join(str(v) for v in value) + "}"
+    return str(value)
+
+
+def _to_timestamp(value):
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.UTC).replace(tzinfo=None)
+    return value
+
+
+_CONVERTERS = {
+    "string": _to_text,
+    "int64": int,
+    "double": float,
+    "timestamp[us]": _to_timestamp,
+}
+
+
+class ParquetSink(Sink):
+    """
+    Write listings to Parquet files, typed according to `get_funda_schema()`.
+
+    Files are partitioned Hive style by run date and search query, e.g.
+    `{output_dir}/funda/run_date=2025-01-31/search_query=1011~5~now-30d/`, and
+    every written page becomes one row group of the partition's file. Files
+    are only complete once the sink is closed.
+
+    Links of listings to the other searches that found them and fetched
+    listing insights are written to their own tables next to it, e.g.
+    `{output_dir}/funda_search_listings/run_date=2025-01-31/`.
+
+    Known hashes, listing insights and listing states are read from the
+    files of the last `history_days` run dates (all of them with `None`), so
+    a run doesn't read the whole history of the output directory.
+    """
+
+    def __init__(self, output_dir, table="funda", run_date=None, history_days=90):
+        if pa is None:
+            raise ImportError(
+                "Writing Parquet requires pyarrow, install fundatracker[parquet]"
+            )
+        self.output_dir = output_dir
+        self.table = table
+        self.run_date = run_date or datetime.date.today()
+        self.history_days = history_days
+        self.schema = get_arrow_schema()
+        self._converters = [_CONVERTERS[str(field.type)] for field in self.schema]
+        self._writers = {}
+        self._files_written = 0
+        # Sinks of the same run (e.g. a flushed or a new one) never reuse a name
+        self._sink_id = uuid.uuid4().hex[:8]
+        self._table_writers = {}
+        self._listing_insights = None
+        self._listing_state = None
+
+    def _next_file_name(self):
+        name = (
+            f"part-{funda.get_run_id()}-{self._sink_id}-{self._files_written}.parquet"
+        )
+        self._files_written += 1
+        return name
+
+    def partition_dir(self, search_query, run_date=None):
+        return os.path.join(
+            self.output_dir,
+            self.table,
+            f"run_date={(run_date or self.run_date).isoformat()}",
+            f"search_query={search_query}",
+        )
+
+    def _get_writer(self, search_query):
+        if search_query not in self._writers:
+            directory = self.partition_dir(search_query)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self._next_file_name())
+            self._writers[search_query] = (path, pq.ParquetWriter(path, self.schema))
+            logging.info(f"Writing listings to {path}")
+        return self._writers[search_query][1]
+
+    def to_table(self, records):
+        columns = [[] for _ in self.schema]
+        for record in records:
+            for i, value in enumerate(record.values()):
+                columns[i].append(None if value is None else self._converters[i](value))
+        return pa.Table.from_arrays(
+            [
+                pa.array(values, type=field.type)
+                for values, field in zip(columns, self.schema, strict=True)
+            ],
+            schema=self.schema,
+        )
+
+    def write(self, results):
+        counts = {"inserted": 0, "skipped": 0, "failed": 0}
+        pages = {}
+        for result in results:
+            record = funda.prepare_row(result)
+            pages.setdefault(record.search_query, []).append(record)
+
+        for search_query, records in pages.items():
+            try:
+                table = self.to_table(records)
+            except (TypeError, ValueError, pa.ArrowException) as e:
+                logging.error(f"Failed to convert {len(records)} listings: {e}")
+                counts["failed"] += len(records)
+                continue
+            self._get_writer(search_query).write_table(table)
+            counts["inserted"] += len(records)
+        return counts
+
+    def history_paths(self, table, *subdirs):
+        """Completed files of a table from the last `history_days` run dates."""
+        first_date = None
+        if self.history_days is not None:
+            first_date = self.run_date - datetime.timedelta(days=self.history_days)
+
+        paths = []
+        for directory in glob.glob(os.path.join(self.output_dir, table, "run_date=*")):
+            run_date = os.path.basename(directory).removeprefix("run_date=")
+            # ISO dates sort like the dates themselves
+            if first_date is not None and run_date < first_date.isoformat():
+                continue
+            paths += glob.glob(os.path.join(directory, *subdirs, "*.parquet"))
+
+        # Files that are still being written can't be read yet
+        open_paths = self.open_paths()
+        return [path for path in paths if path not in open_paths]
+
+    def load_known_hashes(self, search_query):
+        latest = {}
+        for path in self.history_paths(
+            self.table, f"search_query={glob.escape(search_query)}"
+        ):
+            rows = pq.read_table(
+                path, columns=["listing_id", "content_hash", "_processing_time"]
+            ).to_pylist()
+            for row in rows:
+                if row["content_hash"] is None:
+                    continue
+                known = latest.get(row["listing_id"])
+                if known is None or row["_processing_time"] > known[1]:
+                    latest[row["listing_id"]] = (
+                        row["content_hash"],
+                        row["_processing_time"],
+                    )
+        return {listing_id: known[0] for listing_id, known in latest.items()}
+
+    def open_paths(self):
+        writers = [*self._writers.values(), *self._table_writers.values()]
+        return {path for path, _ in writers}
+
+    def _write_rows(self, table, columns, rows):
+        """Append rows (a dict of column lists) to the run's file of a table."""
+        if table not in self._table_writers:
+            directory = os.path.join(
+                self.output_dir, table, f"run_date={self.run_date.isoformat()}"
+            )
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self._next_file_name())
+            writer = pq.ParquetWriter(path, get_arrow_schema(columns))
+            self._table_writers[table] = (path, writer)
+
+        writer = self._table_writers[table][1]
+        writer.write_table(pa.Table.from_pydict(rows, schema=writer.schema))
+
+    def write_search_listings(self, search_query, listing_ids):
+        if not listing_ids:
+            return 0
+
+        now = datetime.datetime.now()
+        rows = {
+            "search_query": [search_query] * len(listing_ids),
+            "listing_id": [str(listing_id) for listing_id in listing_ids],
+            "_run_id": [funda.get_run_id()] * len(listing_ids),
+            "_processing_time": [now] * len(listing_ids),
+        }
+        self._write_rows("funda_search_listings", SEARCH_LISTINGS_COLUMNS, rows)
+        return len(listing_ids)
+
+    def _load_all_listing_insights(self):
+        latest = {}
+        for path in self.history_paths("funda_listing_insights"):
+            for row in pq.read_table(path).to_pylist():
+                known = latest.get(row["listing_id"])
+                if known is None or row["fetched_at"] > known["fetched_at"]:
+                    latest[row["listing_id"]] = row
+        return latest
+
+    def load_listing_insights(self, listing_ids):
+        # Earlier files are read once, later fetches are added in memory
+        if self._listing_insights is None:
+            self._listing_insights = self._load_all_listing_insights()
+        return {
+            listing_id: self._listing_insights[listing_id]
+            for listing_id in listing_ids
+            if listing_id in self._listing_insights
+        }
+
+    def write_listing_insights(self, insights):
+        if not insights:
+            return 0
+
+        rows = {column: [] for column in LISTING_INSIGHTS_COLUMNS}
+        for listing_id, views, saves, fetched_at in insights:
+            rows["listing_id"].append(str(listing_id))
+            rows["nr_of_views"].append(views)
+            rows["nr_of_saves"].append(saves)
+            rows["fetched_at"].append(fetched_at)
+            if self._listing_insights is not None:
+                self._listing_insights[str(listing_id)] = {
+                    "listing_id": str(listing_id),
+                    "nr_of_views": views,
+                    "nr_of_saves": saves,
+                    "fetched_at": fetched_at,
+                }
+        self._write_rows("funda_listing_insights", LISTING_INSIGHTS_COLUMNS, rows)
+        return len(insights)
+
+    def load_listing_state(self, listing_ids):
+        # Like the insights, earlier files are read once and updated in memory
+        if self._listing_state is None:
+            self._listing_state = {}
+            for path in self.history_paths("funda_listing_state"):
+                for row in pq.read_table(path).to_pylist():
+                    known = self._listing_state.get(row["listing_id"])
+                    if known is None or row["updated_at"] > known["updated_at"]:
+                        self._listing_state[row.pop("listing_id")] = row
+        return {
+            listing_id: self._listing_state[listing_id]
+            for listing_id in listing_ids
+            if listing_id in self._listing_state
+        }
+
+    def write_listing_state(self, states):
+        if not states:
+            return 0
+
+        columns = list(changes.LISTING_STATE_COLUMNS)
+        rows = {column: [] for column in columns}
+        for state in states:
+            for column, value in zip(columns, state, strict=True):
+                rows[column].append(value)
+            if self._listing_state is not None:
+                self._listing_state[state[0]] = dict(
+                    zip(columns[1:], state[1:], strict=True)
+                )
+        self._write_rows("funda_listing_state", changes.LISTING_STATE_COLUMNS, rows)
+        return len(states)
+
+    def write_listing_events(self, events):
+        if not events:
+            return 0
+
+        columns = list(changes.LISTING_EVENTS_COLUMNS)
+        rows = {column: [] for column in columns}
+        for event in events:
+            for column, value in zip(columns, event, strict=True):
+                rows[column].append(value)
+        self._write_rows("funda_listing_events", changes.LISTING_EVENTS_COLUMNS, rows)
+        return len(events)
+
+    def flush(self):
+        """Complete the files written so far, later writes start new files."""
+        self.close()
+
+    def close(self):
+        for _, writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        for _, writer in self._table_writers.values():
+            writer.close()
+        self._table_writers = {}
@@ -21,10 +21,45 @@ def get_database_connection(db_name="", db_user="", db_password="", db_host="",
         except psycopg.OperationalError as e:
             print(f"Encountered error: {e}")
             return None
-        
+
+
+def get_conninfo(db_name="", db_user="", db_password="", db_host="", db_port=5432):
+    """Connection string for connections opened elsewhere, e.g. async ones."""
+    return psycopg.conninfo.make_conninfo(
+        dbname=db_name,
+        user=db_user,
+        password=db_password,
+        host=db_host,
+        port=db_port,
+    )
+
+
+def new_database_connection(
+    db_name="", db_user="", db_password="", db_host="", db_port=5432
+):
+    """Open a connection of its own, next to the shared `CONNECTION`."""
+    connection = psycopg.connect(
+        dbname=db_name,
+        user=db_user,
+        password=db_password,
+        host=db_host,
+        port=db_port,
+    )
+    connection.autocommit = True
+    return connection
+
+
 def db_setup(table, schema, conn):
     query = f"""
         CREATE TABLE IF NOT EXISTS {table}({", ".join([f"{k} {v}" for (k,v) in schema.items()])})
     """
 
     conn.cursor().execute(query)
+
+    # Add columns introduced after the table was first created
+    for column, column_type in schema.items():
+        if "PRIMARY KEY" in column_type:
+            continue
+        conn.cursor().execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+        )
@@ -0,0 +1,289 @@
+import json
+import logging
+import os
+import socket
+import threading
+
+from psycopg.types.json import Jsonb
+
+TASK_COLUMNS = (
+    "id",
+    "postal_code",
+    "km_radius",
+    "publication_date",
+    "filters",
+    "attempts",
+    "max_attempts",
+)
+
+
+class Task:
+    __slots__ = TASK_COLUMNS
+
+    def __init__(self, *values):
+        for column, value in zip(TASK_COLUMNS, values, strict=True):
+            setattr(self, column, value)
+
+    def __repr__(self):
+        filters = f", {self.filters}" if self.filters else ""
+        return (
+            f"Task({self.id}: {self.postal_code}~{self.km_radius}~"
+            f"{self.publication_date}{filters})"
+        )
+
+
+def get_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Search tasks in a Postgres table, shared by any number of workers.
+
+    Workers claim one pending task at a time with `FOR UPDATE SKIP LOCKED`,
+    so concurrent workers never get the same task and never wait for each
+    other. A claimed task's heartbeat is refreshed while it runs, tasks whose
+    worker stopped sending heartbeats are claimed again. Failed tasks are
+    retried with exponential backoff until `max_attempts` is reached.
+
+    The queue should get its own connection, heartbeats are sent from a
+    background thread while the tracker uses its connection.
+    """
+
+    def __init__(
+        self,
+        connection,
+        table="funda_tasks",
+        stale_after_sec=300,
+        retry_delay_sec=60,
+    ):
+        self.connection = connection
+        self.table = table
+        self.stale_after_sec = stale_after_sec
+        self.retry_delay_sec = retry_delay_sec
+
+    def setup(self):
+        self.connection.cursor().execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table}(
+                id BIGSERIAL PRIMARY KEY,
+                postal_code INTEGER NOT NULL,
+                km_radius INTEGER NOT NULL,
+                publication_date VARCHAR(20) NOT NULL,
+                filters JSONB,
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                worker_id VARCHAR(200),
+                last_error TEXT,
+                available_at TIMESTAMP NOT NULL DEFAULT now(),
+                heartbeat_at TIMESTAMP,
+                created_at TIMESTAMP NOT NULL DEFAULT now(),
+                updated_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+            """
+        )
+        self.connection.cursor().execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {self.table}_status_idx
+            ON {self.table}(status, available_at)
+            """
+        )
+
+    def enqueue(
+        self, postal_code, km_radius, publication_date, filters=None, max_attempts=3
+    ):
+        """Add a task, `filters` limits it to a slice of the search."""
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            INSERT INTO {self.table}(
+                postal_code, km_radius, publication_date, filters, max_attempts
+            )
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING id
+            """,
+            (
+                postal_code,
+                km_radius,
+                publication_date,
+                Jsonb(filters) if filters else None,
+                max_attempts,
+            ),
+        )
+        return cursor.fetchone()[0]
+
+    def claim(self, worker_id):
+        """
+        Claim the next pending (or abandoned) task.
+
+        Returns:
+            Task: The claimed task, or None when there is nothing to do
+        """
+        cursor = self.connection.cursor()
+        # Give up on abandoned tasks that already used all their attempts
+        cursor.execute(
+            f"""
+            UPDATE {self.table}
+            SET status = 'failed',
+                last_error = 'Worker stopped sending heartbeats',
+                updated_at = now()
+            WHERE status = 'running'
+                AND heartbeat_at < now() - make_interval(secs => %s)
+                AND attempts >= max_attempts
+            """,
+            (self.stale_after_sec,),
+        )
+        cursor.execute(
+            f"""
+            UPDATE {self.table}
+            SET status = 'running',
+                worker_id = %s,
+                attempts = attempts + 1,
+                heartbeat_at = now(),
+                updated_at = now()
+            WHERE id = (
+                SELECT id FROM {self.table}
+                WHERE (status = 'pending' AND available_at <= now())
+                    OR (
+                        status = 'running'
+                        AND heartbeat_at < now() - make_interval(secs => %s)
+                    )
+                ORDER BY available_at, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {", ".join(TASK_COLUMNS)}
+            """,
+            (worker_id, self.stale_after_sec),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        task = Task(*row)
+        if isinstance(task.filters, str):
+            task.filters = json.loads(task.filters)
+        return task
+
+    def heartbeat(self, task, worker_id):
+        self.connection.cursor().execute(
+            f"""
+            UPDATE {self.table} SET heartbeat_at = now()
+            WHERE id = %s AND worker_id = %s AND status = 'running'
+            """,
+            (task.id, worker_id),
+        )
+
+    def complete(self, task, worker_id):
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            UPDATE {self.table}
+            SET status = 'done', last_error = NULL, updated_at = now()
+            WHERE id = %s AND worker_id = %s AND status = 'running'
+            """,
+            (task.id, worker_id),
+        )
+        if not cursor.rowcount:
+            logging.warning(f"{task} was claimed by another worker, not completing it.")
+
+    def fail(self, task, worker_id, error):
+        """Schedule a retry of a failed task, or give up after `max_attempts`."""
+        retry = task.attempts < task.max_attempts
+        delay_sec = self.retry_delay_sec * 2 ** (task.attempts - 1)
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"""
+            UPDATE {self.table}
+            SET status = %s,
+                last_error = %s,
+                available_at = now() + make_interval(secs => %s),
+                updated_at = now()
+            WHERE id = %s AND worker_id = %s AND status = 'running'
+            """,
+            (
+                "pending" if retry else "failed",
+                str(error),
+                delay_sec,
+                task.id,
+                worker_id,
+            ),
+        )
+        if not cursor.rowcount:
+            # A worker that took over the stale task decides what happens to it
+            logging.warning(f"{task} was claimed by another worker, not failing it.")
+        return retry
+
+    def counts(self):
+        """Number of tasks by status."""
+        cursor = self.connection.cursor()
+        cursor.execute(f"SELECT status, count(*) FROM {self.table} GROUP BY status")
+        return dict(cursor.fetchall())
+
+
+def run_worker(
+    queue,
+    run_task,
+    worker_id=None,
+    stop_event=None,
+    poll_interval_sec=10.0,
+    heartbeat_interval_sec=30.0,
+    exit_when_empty=False,
+):
+    """
+    Claim and run tasks until stopped (or until the queue is empty).
+
+    Args:
+        queue: WorkQueue to take tasks from
+        run_task: Function running a single Task, raising on failure
+        worker_id: Name of this worker in the task table
+        stop_event: Event to stop the worker after the current task
+        poll_interval_sec: Time to wait before polling an empty queue again
+        heartbeat_interval_sec: Time between heartbeats of a running task
+        exit_when_empty: Return as soon as there are no pending tasks
+
+    Returns:
+        dict: Number of tasks completed and failed
+    """
+    worker_id = worker_id or get_worker_id()
+    stop_event = stop_event or threading.Event()
+    stats = {"completed": 0, "failed": 0}
+
+    while not stop_event.is_set():
+        task = queue.claim(worker_id)
+        if task is None:
+            if exit_when_empty:
+                break
+            stop_event.wait(poll_interval_sec)
+            continue
+
+        logging.info(f"Worker {worker_id} running {task} (attempt {task.attempts})")
+        task_done = threading.Event()
+
+        def send_heartbeats(task=task, task_done=task_done):
+            while not task_done.wait(heartbeat_interval_sec):
+                try:
+                    queue.heartbeat(task, worker_id)
+                except Exception as e:
+                    logging.warning(f"Failed to send heartbeat for {task}: {e}")
+
+        heartbeat = threading.Thread(target=send_heartbeats, daemon=True)
+        heartbeat.start()
+        try:
+            run_task(task)
+        except Exception as e:
+            stats["failed"] += 1
+            retry = queue.fail(task, worker_id, e)
+            logging.error(
+                f"{task} failed: {e}. {'Retrying later' if retry else 'Giving up'}."
+            )
+        else:
+            stats["completed"] += 1
+            queue.complete(task, worker_id)
+            logging.info(f"{task} done.")
+        finally:
+            task_done.set()
+            heartbeat.join()
+
+    return stats
@@ -0,0 +1,77 @@
+import datetime
+import tempfile
+import unittest
+
+from fundatracker import archive, funda
+from fundatracker.sinks import Sink
+from tests.fixtures import MINIMAL_RESPONSE, SAMPLE_RESPONSE
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.results = []
+
+    def write(self, results):
+        self.results += results
+        return {"inserted": len(results), "skipped": 0, "failed": 0}
+
+
+@unittest.skipIf(archive.zstandard is None, "zstandard is not installed")
+class TestResponseArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.archive = archive.ResponseArchive(
+            self.tmpdir.name, run_date=datetime.date(2025, 1, 31)
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_archive_pages(self):
+        """Test pages are passed on unchanged and archived one file per page."""
+        pages = [("*", 0, SAMPLE_RESPONSE), ("*", 15, MINIMAL_RESPONSE)]
+
+        passed_on = list(self.archive.archive_pages(pages, "1011~5~now-30d"))
+
+        self.assertEqual(passed_on, pages)
+        paths = archive.find_archive_files(self.tmpdir.name)
+        self.assertEqual(len(paths), 2)
+        self.assertIn("run_date=2025-01-31", paths[0])
+        self.assertIn(f"run_id={funda.get_run_id()}", paths[0])
+
+        page = archive.read_archive_file(paths[1])[0]
+        self.assertEqual(page["start_index"], 15)
+        self.assertEqual(page["search_query"], "1011~5~now-30d")
+        self.assertEqual(page["response"], MINIMAL_RESPONSE)
+
+    def test_find_archive_files_filters(self):
+        """Test archived files can be selected by run date and search query."""
+        self.archive.write("1011~5~now-30d", 0, SAMPLE_RESPONSE)
+        self.archive.write("1012~5~now-30d", 0, SAMPLE_RESPONSE)
+
+        def find(**filters):
+            return archive.find_archive_files(self.tmpdir.name, **filters)
+
+        self.assertEqual(len(find(search_query="1012~5~now-30d")), 1)
+        self.assertEqual(len(find(run_date="2025-01-31")), 2)
+        self.assertEqual(find(run_date="2025-02-01"), [])
+
+    def test_reprocess(self):
+        """Test archived pages are parsed on a process pool and written in order."""
+        self.archive.write("1011~5~now-30d", 0, SAMPLE_RESPONSE)
+        self.archive.write("1012~5~now-30d", 0, MINIMAL_RESPONSE)
+        paths = archive.find_archive_files(self.tmpdir.name)
+        sink = ListSink()
+
+        totals = archive.reprocess(paths, sink, processes=2)
+
+        self.assertEqual(totals["files"], 2)
+        self.assertEqual(totals["listings"], len(sink.results))
+        self.assertEqual(totals["inserted"], len(sink.results))
+        self.assertEqual(sink.results[0].search_query, "1011~5~now-30d")
+        self.assertEqual(sink.results[-1].search_query, "1012~5~now-30d")
+        self.assertIsNone(sink.results[0].listing_nr_of_views)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fundatracker.cache import InsightsCache
+
+
+class TestInsightsCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_get_set(self):
+        """Test values are returned from memory and misses are counted."""
+        cache = InsightsCache()
+
+        self.assertIsNone(cache.get("listing_insights", "1"))
+        cache.set("listing_insights", "1", {"nrOfViews": 10})
+
+        self.assertEqual(cache.get("listing_insights", "1"), {"nrOfViews": 10})
+        self.assertEqual(cache.stats["misses"], 1)
+        self.assertEqual(cache.stats["memory_hits"], 1)
+
+    def test_lru_eviction(self):
+        """Test the memory tier is bounded and evicts least recently used."""
+        cache = InsightsCache(max_entries=2)
+        cache.set("listing_insights", "1", {})
+        cache.set("listing_insights", "2", {})
+        cache.get("listing_insights", "1")
+        cache.set("listing_insights", "3", {})
+
+        self.assertEqual(cache.stats["evictions"], 1)
+        self.assertIsNone(cache.get("listing_insights", "2"))
+        self.assertEqual(cache.get("listing_insights", "1"), {})
+
+    def test_ttl_expiry(self):
+        """Test entries expire according to the namespace TTL."""
+        cache = InsightsCache(ttls={"listing_insights": 10})
+
+        with patch("fundatracker.cache.time.time", return_value=1000):
+            cache.set("listing_insights", "1", {"nrOfViews": 1})
+        with patch("fundatracker.cache.time.time", return_value=1005):
+            self.assertEqual(cache.get("listing_insights", "1"), {"nrOfViews": 1})
+        with patch("fundatracker.cache.time.time", return_value=1011):
+            self.assertIsNone(cache.get("listing_insights", "1"))
+
+        self.assertEqual(cache.stats["expirations"], 1)
+
+    def test_disk_tier_persists(self):
+        """Test values survive a new cache instance via the SQLite tier."""
+        cache = InsightsCache(path=self.path)
+        cache.set("neighbourhood_insights", "abc", {"inhabitants": 50000})
+        cache.close()
+
+        cache = InsightsCache(path=self.path)
+        self.assertEqual(
+            cache.get("neighbourhood_insights", "abc"), {"inhabitants": 50000}
+        )
+        self.assertEqual(cache.stats["disk_hits"], 1)
+
+        # Second lookup is served from memory
+        cache.get("neighbourhood_insights", "abc")
+        self.assertEqual(cache.stats["memory_hits"], 1)
+        cache.close()
+
+    def test_clear_namespace(self):
+        """Test clearing a namespace leaves other namespaces untouched."""
+        cache = InsightsCache(path=self.path)
+        cache.set("listing_insights", "1", {})
+        cache.set("neighbourhood_insights", "1", {})
+
+        cache.clear("listing_insights")
+
+        self.assertIsNone(cache.get("listing_insights", "1"))
+        self.assertEqual(cache.get("neighbourhood_insights", "1"), {})
+        cache.close()
+
+    def test_purge_trims_disk(self):
+        """Test the disk tier is trimmed to max_disk_entries."""
+        cache = InsightsCache(path=self.path, max_disk_entries=1)
+        cache.set("listing_insights", "1", {})
+        cache.set("listing_insights", "2", {})
+
+        cache.purge_expired()
+
+        self.assertEqual(cache.stats["evictions"], 1)
+        cache.close()
+
+    def test_writes_trim_disk(self):
+        """Test the disk tier stays bounded while writing, without reopening."""
+        cache = InsightsCache(path=self.path, max_disk_entries=2, purge_every=2)
+        for listing_id in range(6):
+            cache.set("listing_insights", str(listing_id), {})
+
+        (count,) = cache._db.execute("SELECT COUNT(*) FROM insights_cache").fetchone()
+
+        self.assertEqual(count, 2)
+        self.assertEqual(cache.stats["evictions"], 4)
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,188 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fundatracker import funda
+from fundatracker.changes import LISTING_EVENTS_COLUMNS, ListingChanges
+from tests.test_checkpoint import ListSink, make_page
+
+NOW = datetime.datetime(2025, 2, 1, 12, 0)
+
+
+def make_record(listing_id="1", price=450000, status="available", content_hash="a"):
+    return funda.ListingRecord(
+        listing_id=listing_id,
+        price=price,
+        status=status,
+        availability="available",
+        content_hash=content_hash,
+        url_path=f"/koop/{listing_id}",
+        search_query="1011~5~now-30d",
+    )
+
+
+def make_state(price=450000, status="available", content_hash="a", hours_ago=1):
+    return {
+        "price": price,
+        "status": status,
+        "availability": "available",
+        "content_hash": content_hash,
+        "updated_at": NOW - datetime.timedelta(hours=hours_ago),
+    }
+
+
+class StateSink(ListSink):
+    def __init__(self, states=None):
+        super().__init__()
+        self.states = states or {}
+        self.written_states = []
+        self.events = []
+
+    def load_listing_state(self, listing_ids):
+        return {i: self.states[i] for i in listing_ids if i in self.states}
+
+    def write_listing_state(self, states):
+        self.written_states += states
+        return len(states)
+
+    def write_listing_events(self, events):
+        self.events += events
+        return len(events)
+
+
+class QueuedStateSink(StateSink):
+    # Like a background sink, callbacks run once the writes are stored
+    def __init__(self, states=None):
+        super().__init__(states)
+        self.callbacks = []
+
+    def after_stored(self, callback):
+        self.callbacks.append(callback)
+
+
+def as_dicts(events):
+    return [dict(zip(LISTING_EVENTS_COLUMNS, event, strict=True)) for event in events]
+
+
+class TestListingChanges(unittest.TestCase):
+    def test_get_changes(self):
+        """Test new and changed listings become events, unchanged ones don't."""
+        records = [
+            make_record("1"),
+            make_record("2", price=425000),
+            make_record("3", content_hash="b"),
+            make_record("4", status="sold_under_reservation"),
+            make_record("5"),
+        ]
+        stored = {
+            "2": make_state(),
+            "3": make_state(),
+            "4": make_state(),
+            "5": make_state(),
+        }
+
+        states, events = ListingChanges().get_changes(records, stored, NOW)
+
+        self.assertEqual([state[0] for state in states], ["1", "2", "3", "4"])
+        events = as_dicts(events)
+        self.assertEqual(
+            [(e["listing_id"], e["event"], e["changes"]) for e in events],
+            [
+                ("1", "listed", None),
+                ("2", "changed", "price"),
+                ("4", "changed", "status"),
+            ],
+        )
+        self.assertEqual(events[1]["previous_price"], 450000)
+        self.assertEqual(events[1]["price"], 425000)
+        self.assertEqual(events[2]["status"], "sold_under_reservation")
+        self.assertEqual(events[2]["observed_at"], NOW)
+
+    def test_record_keeps_own_states(self):
+        """Test states not yet stored by the sink are used from memory."""
+        sink = QueuedStateSink({"1": make_state(hours_ago=2)})
+        changes = ListingChanges()
+
+        changes.record([make_record("1", price=400000)], sink, NOW)
+        # The sink still returns the old state, its write is still queued
+        events = changes.record([make_record("1", price=400000)], sink, NOW)
+
+        self.assertEqual(events, [])
+        self.assertEqual(len(sink.events), 1)
+        self.assertEqual(len(sink.written_states), 1)
+
+        for callback in sink.callbacks:
+            callback()
+        self.assertEqual(changes._states, {})
+
+    def test_record_forgets_stored_states(self):
+        """Test states are dropped from memory once the sink stored them."""
+        changes = ListingChanges()
+
+        changes.record([make_record(str(i)) for i in range(3)], StateSink(), NOW)
+
+        self.assertEqual(changes._states, {})
+
+    def test_events_stream(self):
+        """Test events are appended to an NDJSON file."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "events.ndjson")
+            changes = ListingChanges(events_path=path)
+            changes.record([make_record("1")], StateSink(), NOW)
+            changes.record([make_record("2")], StateSink(), NOW)
+
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+
+        self.assertEqual([line["listing_id"] for line in lines], ["1", "2"])
+        self.assertEqual(lines[0]["observed_at"], "2025-02-01T12:00:00")
+
+    @patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+    @patch("fundatracker.funda.get_listing_insights", return_value={})
+    def test_tracker_records_changes(self, *mocks):
+        """Test the tracker reports changes of every stored page."""
+        unchanged = {**make_state(price=100001, status=""), "availability": ""}
+        sink = StateSink({"0": make_state(price=1), "1": unchanged})
+
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 4),
+        ):
+            funda.tracker(1011, 5, "now-30d", sink=sink, changes=ListingChanges())
+
+        events = as_dicts(sink.events)
+        self.assertEqual(
+            [(e["listing_id"], e["event"]) for e in events],
+            [("0", "changed"), ("2", "listed"), ("3", "listed")],
+        )
+        self.assertEqual(events[0]["price"], 100000)
+
+    @patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+    @patch("fundatracker.funda.get_listing_insights", return_value={})
+    def test_tracker_skips_failed_pages(self, *mocks):
+        """Test changes of a page that failed to store aren't recorded."""
+
+        class FailingSink(StateSink):
+            def write(self, results):
+                super().write(results)
+                if results[0].listing_id == "2":
+                    return {"inserted": 0, "skipped": 0, "failed": len(results)}
+                return {"inserted": len(results), "skipped": 0, "failed": 0}
+
+        sink = FailingSink()
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 4),
+        ):
+            with self.assertRaises(RuntimeError):
+                funda.tracker(1011, 5, "now-30d", sink=sink, changes=ListingChanges())
+
+        self.assertEqual([e[0] for e in sink.events], ["0", "1"])
+        self.assertEqual([s[0] for s in sink.written_states], ["0", "1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
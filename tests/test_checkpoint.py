@@ -0,0 +1,187 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from fundatracker import funda
+from fundatracker.checkpoint import FileCheckpointStore, PostgresCheckpointStore
+from fundatracker.sinks import Sink
+
+
+def make_page(start_index, total, page_size=2):
+    hits = [
+        {
+            "_id": str(i),
+            "_source": {
+                "address": {"country": "NL", "postal_code": "1011AB"},
+                "publish_date": "2025-01-01T00:00:00",
+                "object_detail_page_relative_url": f"/koop/{i}",
+                "price": {"selling_price": [100000 + i]},
+            },
+        }
+        for i in range(start_index, min(start_index + page_size, total))
+    ]
+    return {"responses": [{"hits": {"total": {"value": total}, "hits": hits}}]}
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.listing_ids = []
+
+    def write(self, results):
+        self.listing_ids += [result.listing_id for result in results]
+        return {"inserted": len(results), "skipped": 0, "failed": 0}
+
+
+class TestFileCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "checkpoints.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_load_clear(self):
+        """Test checkpoints survive a new store and are cleared per search."""
+        store = FileCheckpointStore(self.path)
+        store.save("1011~5~now-30d", "*", 30, 100, run_id="run-1")
+        store.save("1011~5~now-30d", "*", 45, 100, run_id="run-1")
+        store.save("1012~5~now-30d", "zoning=residential", 15, 20, run_id="run-1")
+
+        checkpoints = FileCheckpointStore(self.path).load("1011~5~now-30d")
+        self.assertEqual(checkpoints["*"]["results_processed"], 45)
+        self.assertEqual(checkpoints["*"]["run_id"], "run-1")
+
+        store.clear("1011~5~now-30d")
+        self.assertEqual(store.load("1011~5~now-30d"), {})
+        self.assertIn("zoning=residential", store.load("1012~5~now-30d"))
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+
+class TestPostgresCheckpointStore(unittest.TestCase):
+    def test_save_load(self):
+        """Test checkpoints are upserted and loaded per slice."""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [("*", "run-1", 45, 100)]
+        store = PostgresCheckpointStore(conn)
+
+        store.save("1011~5~now-30d", "*", 45, 100, run_id="run-1")
+        checkpoints = store.load("1011~5~now-30d")
+
+        self.assertIn("ON CONFLICT", cursor.execute.call_args_list[0][0][0])
+        self.assertEqual(
+            cursor.execute.call_args_list[0][0][1],
+            ("1011~5~now-30d", "*", "run-1", 45, 100),
+        )
+        self.assertEqual(
+            checkpoints,
+            {"*": {"run_id": "run-1", "results_processed": 45, "results_total": 100}},
+        )
+
+
+@patch("fundatracker.funda.get_listing_insights", return_value={})
+@patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+class TestTrackerResume(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = FileCheckpointStore(
+            os.path.join(self.tmpdir.name, "checkpoints.json")
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_tracker(self, sink, resume=False):
+        funda.tracker(
+            1011, 5, "now-30d", sink=sink, checkpoints=self.store, resume=resume
+        )
+
+    def test_resume_after_failure(self, *mocks):
+        """Test a failed run continues after the last stored page."""
+
+        def failing_results(start_index=0, **query):
+            if start_index == 4:
+                raise Exception("Failed to get results from funda.")
+            return make_page(start_index, 6)
+
+        first_sink = ListSink()
+        with (
+            patch("fundatracker.funda.get_results", side_effect=failing_results),
+            self.assertRaisesRegex(Exception, "Failed to get results"),
+        ):
+            self.run_tracker(first_sink)
+
+        self.assertEqual(first_sink.listing_ids, ["0", "1", "2", "3"])
+        self.assertEqual(self.store.load("1011~5~now-30d")["*"]["results_processed"], 4)
+
+        second_sink = ListSink()
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 6),
+        ) as mock_results:
+            self.run_tracker(second_sink, resume=True)
+
+        self.assertEqual(second_sink.listing_ids, ["4", "5"])
+        # Planning the slices fetches the first page again
+        self.assertEqual(
+            [c.kwargs["start_index"] for c in mock_results.call_args_list], [0, 4]
+        )
+        self.assertEqual(self.store.load("1011~5~now-30d"), {})
+
+    def test_stop_keeps_checkpoint(self, *mocks):
+        """Test a stopped run stores the fetched page and keeps its checkpoint."""
+        stop_event = threading.Event()
+        sink = ListSink()
+
+        def stopping_results(start_index=0, **query):
+            if start_index == 2:
+                stop_event.set()
+            return make_page(start_index, 6)
+
+        with patch("fundatracker.funda.get_results", side_effect=stopping_results):
+            funda.tracker(
+                1011,
+                5,
+                "now-30d",
+                sink=sink,
+                checkpoints=self.store,
+                stop_event=stop_event,
+            )
+
+        self.assertEqual(sink.listing_ids, ["0", "1", "2", "3"])
+        self.assertEqual(self.store.load("1011~5~now-30d")["*"]["results_processed"], 4)
+
+    def test_failed_page_keeps_checkpoint(self, *mocks):
+        """Test the checkpoint doesn't move past a page that failed to store."""
+
+        class FailingSink(ListSink):
+            def write(self, results):
+                counts = super().write(results)
+                if results[0].listing_id == "2":
+                    return {"inserted": 0, "skipped": 0, "failed": len(results)}
+                return counts
+
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 6),
+        ):
+            with self.assertRaisesRegex(RuntimeError, "1 pages .* failed to store"):
+                self.run_tracker(FailingSink())
+
+        self.assertEqual(self.store.load("1011~5~now-30d")["*"]["results_processed"], 2)
+
+        second_sink = ListSink()
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 6),
+        ):
+            self.run_tracker(second_sink, resume=True)
+
+        self.assertEqual(second_sink.listing_ids, ["2", "3", "4", "5"])
+        self.assertEqual(self.store.load("1011~5~now-30d"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
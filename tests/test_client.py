@@ -0,0 +1,58 @@
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from fundatracker.client import FundaClient
+
+
+class TestFundaClient(unittest.TestCase):
+    @patch("fundatracker.client.requests.Session")
+    def test_sessions_pooled(self, mock_session):
+        """Test sessions are reused across threads and created with preset headers."""
+        mock_session.side_effect = lambda **kwargs: Mock()
+        client = FundaClient("https://example.com/", headers={"User-Agent": "test"})
+
+        # Short-lived threads, like a thread pool per page, share one session
+        for _ in range(5):
+            thread = threading.Thread(target=lambda: client.get("/"))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(mock_session.call_count, 1)
+        self.assertEqual(mock_session.call_args[1]["headers"], {"User-Agent": "test"})
+        self.assertEqual(mock_session.call_args[1]["impersonate"], "chrome")
+
+        # Concurrent requests each get their own session
+        with client.session() as first, client.session() as second:
+            self.assertIsNot(first, second)
+        self.assertEqual(mock_session.call_count, 2)
+
+    @patch("fundatracker.client.requests.Session")
+    def test_idle_sessions_bounded(self, mock_session):
+        """Test sessions above `max_idle_sessions` are closed when returned."""
+        mock_session.side_effect = lambda **kwargs: Mock()
+        client = FundaClient("https://example.com/", max_idle_sessions=1)
+
+        with client.session() as first, client.session() as second:
+            pass
+
+        # The second session is returned first and kept
+        second.close.assert_not_called()
+        first.close.assert_called_once()
+        client.close()
+        second.close.assert_called_once()
+
+    @patch("fundatracker.client.requests.Session")
+    def test_request_joins_base_url(self, mock_session):
+        """Test paths are requested relative to the client base URL."""
+        client = FundaClient("https://example.com/")
+
+        client.get("/v1/objectinsights/1", params={"a": 1})
+
+        mock_session.return_value.request.assert_called_once_with(
+            "GET", "https://example.com/v1/objectinsights/1", params={"a": 1}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import patch
+
+from fundatracker import dedupe, funda
+from tests.test_checkpoint import ListSink, make_page
+
+
+class SearchListingsSink(ListSink):
+    def __init__(self):
+        super().__init__()
+        self.search_listings = {}
+
+    def write_search_listings(self, search_query, listing_ids):
+        self.search_listings.setdefault(search_query, []).extend(listing_ids)
+        return len(listing_ids)
+
+
+class TestSeenIndex(unittest.TestCase):
+    def test_seen_set(self):
+        """Test the exact index only reports the first sighting as new."""
+        seen = dedupe.get_seen_index("set")
+
+        self.assertTrue(seen.add("1"))
+        self.assertFalse(seen.add("1"))
+        self.assertIn("1", seen)
+        self.assertEqual(len(seen), 1)
+
+    def test_bloom_filter(self):
+        """Test the Bloom filter never misses a seen id and rarely errs."""
+        seen = dedupe.get_seen_index("bloom", capacity=10_000, error_rate=0.01)
+
+        new = [seen.add(str(i)) for i in range(10_000)]
+        self.assertTrue(all(str(i) in seen for i in range(10_000)))
+        self.assertFalse(any(seen.add(str(i)) for i in range(10_000)))
+        false_positives = new.count(False) + sum(
+            str(i) in seen for i in range(10_000, 20_000)
+        )
+        self.assertLess(false_positives / 20_000, 0.02)
+
+    def test_none(self):
+        """Test deduplication across searches can be turned off."""
+        self.assertIsNone(dedupe.get_seen_index("none"))
+        with self.assertRaisesRegex(ValueError, "Unknown seen index"):
+            dedupe.get_seen_index("dict")
+
+
+@patch("fundatracker.funda.get_listing_insights", return_value={})
+@patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+class TestTrackerSeen(unittest.TestCase):
+    def setUp(self):
+        funda.metrics.reset()
+
+    def test_overlapping_searches(self, *mocks):
+        """Test listings of an earlier search are only linked to the next one."""
+        seen = dedupe.SeenSet()
+        sink = SearchListingsSink()
+
+        for postal_code, total in [(1011, 4), (1012, 6)]:
+            with patch(
+                "fundatracker.funda.get_results",
+                side_effect=lambda start_index=0, total=total, **query: make_page(
+                    start_index, total
+                ),
+            ):
+                funda.tracker(postal_code, 5, "now-30d", sink=sink, seen=seen)
+
+        self.assertEqual(sink.listing_ids, ["0", "1", "2", "3", "4", "5"])
+        self.assertEqual(sink.search_listings, {"1012~5~now-30d": ["0", "1", "2", "3"]})
+        self.assertEqual(funda.metrics.get("listings_repeated_total"), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
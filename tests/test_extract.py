@@ -0,0 +1,70 @@
+import unittest
+
+from fundatracker.extract import compile_extractor, parse_path
+
+
+class Record:
+    __slots__ = ("id", "name", "price", "tags", "note")
+
+
+SPEC = [
+    ("id", "/_id!", None, None),
+    ("name", "agent[0].name", "", None),
+    ("price", "price!.selling_price[0]", None, None),
+    ("tags", "tags", [], ",".join),
+]
+
+
+class TestExtract(unittest.TestCase):
+    def test_parse_path(self):
+        """Test paths are parsed into keys, indexes and required markers."""
+        self.assertEqual(
+            parse_path("agent[0].name"),
+            ("source", [("agent", False), (0, True), ("name", False)]),
+        )
+        self.assertEqual(parse_path("/_id!"), ("hit", [("_id", True)]))
+
+        with self.assertRaises(ValueError):
+            parse_path("agent..name")
+
+    def test_compile_extractor(self):
+        """Test the compiled extractor follows paths, defaults and transforms."""
+        extract = compile_extractor(SPEC, Record, Record.__slots__)
+
+        record = extract(
+            {
+                "_id": "1",
+                "_source": {
+                    "agent": [{"name": "Makelaar"}],
+                    "price": {"selling_price": [100]},
+                    "tags": ["a", "b"],
+                },
+            }
+        )
+        self.assertEqual(
+            (record.id, record.name, record.price, record.tags),
+            ("1", "Makelaar", 100, "a,b"),
+        )
+        self.assertIsNone(record.note)
+
+        record = extract({"_id": "2", "_source": {"price": {}}})
+        self.assertEqual((record.name, record.price, record.tags), ("", None, ""))
+
+    def test_compile_extractor_shares_lookups(self):
+        """Test shared intermediate lookups are evaluated once."""
+        spec = [("name", "agent[0].name", "", None), ("id", "agent[0].id", "", None)]
+
+        extract = compile_extractor(spec, Record, ["name", "id"])
+
+        self.assertEqual(extract.source.count("source.get('agent'"), 1)
+
+    def test_compile_extractor_required(self):
+        """Test missing required keys raise, so the listing is skipped."""
+        extract = compile_extractor(SPEC, Record, Record.__slots__)
+
+        with self.assertRaises(KeyError):
+            extract({"_id": "1", "_source": {}})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,151 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from fundatracker import funda
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import fake_funda  # noqa: E402
+
+
+def make_body(*queries):
+    return "".join(
+        json.dumps(index_line) + "\n" + json.dumps(query_line) + "\n"
+        for index_line, query_line in queries
+    )
+
+
+def search(fake, start_index=0, **filters):
+    body = make_body(
+        funda.build_search_query(1011, 5, start_index=start_index, **filters)
+    )
+    status, _, response = fake.handle("POST", funda.SEARCH_PATH, body)
+    return status, json.loads(response)["responses"][0]
+
+
+class TestSynthetic(unittest.TestCase):
+    def setUp(self):
+        self.fake = fake_funda.FakeFunda(listings=40, page_size=15, seed=1)
+
+    def test_pages(self):
+        """Test pages of a search follow each other and add up to the total."""
+        ids = []
+        for start_index in range(0, 45, 15):
+            status, response = search(self.fake, start_index)
+            self.assertEqual(status, 200)
+            self.assertEqual(funda.get_page_stats({"responses": [response]})[0], 40)
+            ids += [hit["_id"] for hit in response["hits"]["hits"]]
+
+        self.assertEqual(ids, [str(i) for i in range(1, 41)])
+        self.assertEqual(self.fake.stats["search_requests"], 3)
+
+    def test_slices(self):
+        """Test sliced searches return disjoint listings matching their filter."""
+        unavailable, available = (
+            search(self.fake, availability=[availability])[1]["hits"]
+            for availability in ["unavailable", "available"]
+        )
+
+        unavailable_ids = {hit["_id"] for hit in unavailable["hits"]}
+        self.assertTrue(unavailable_ids)
+        self.assertFalse(unavailable_ids & {hit["_id"] for hit in available["hits"]})
+        self.assertEqual(
+            {hit["_source"]["availability"] for hit in unavailable["hits"]},
+            {"unavailable"},
+        )
+        self.assertEqual(
+            {hit["_source"]["availability"] for hit in available["hits"]},
+            {"available"},
+        )
+
+    def test_msearch(self):
+        """Test every search of an `_msearch` body gets its own response."""
+        body = make_body(
+            funda.build_search_query(1011, 5, start_index=0),
+            funda.build_search_query(1011, 5, start_index=15),
+        )
+
+        _, _, response = self.fake.handle("POST", funda.SEARCH_PATH, body)
+
+        first, second = json.loads(response)["responses"]
+        self.assertEqual(first["hits"]["hits"][0]["_id"], "1")
+        self.assertEqual(second["hits"]["hits"][0]["_id"], "16")
+
+    def test_result_window(self):
+        """Test pages past the result window fail like Elasticsearch does."""
+        _, response = search(self.fake, funda.ES_MAX_RESULT_WINDOW)
+
+        self.assertEqual(response["status"], 400)
+
+    def test_insights(self):
+        """Test listing insights are stable per listing and unknown paths 404."""
+        status, _, body = self.fake.handle("GET", "/v1/objectinsights/7", "")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {"nrOfViews": 107, "nrOfSaves": 7})
+        self.assertEqual(self.fake.handle("GET", "/unknown", "")[0], 404)
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.recordings = fake_funda.Recordings(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_replay(self):
+        """Test recorded responses are served, other requests are synthetic."""
+        path = "/v1/objectinsights/7"
+        self.recordings.save("GET", path, "", 200, '{"nrOfViews": 1}')
+        fake = fake_funda.FakeFunda(mode="replay", recordings=self.recordings)
+
+        self.assertEqual(fake.handle("GET", path, ""), (200, {}, '{"nrOfViews": 1}'))
+        self.assertEqual(fake.handle("GET", "/v1/objectinsights/8", "")[0], 200)
+        self.assertEqual(fake.stats["replayed"], 1)
+
+    def test_needs_recordings(self):
+        """Test record and replay mode need a recordings directory."""
+        with self.assertRaises(ValueError):
+            fake_funda.FakeFunda(mode="replay")
+
+
+class TestErrors(unittest.TestCase):
+    def test_error_rate(self):
+        """Test errors are injected with the configured status and Retry-After."""
+        fake = fake_funda.FakeFunda(
+            error_rate=1.0, error_status=429, retry_after=2, seed=1
+        )
+
+        status, headers, _ = fake.handle("GET", "/v1/objectinsights/7", "")
+
+        self.assertEqual(status, 429)
+        self.assertEqual(headers, {"Retry-After": "2"})
+        self.assertEqual(fake.stats["injected_errors"], 1)
+
+    def test_server(self):
+        """Test the HTTP server passes injected errors on to clients."""
+        fake = fake_funda.FakeFunda(error_rate=1.0, retry_after=1)
+        server = fake_funda.make_server(fake, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/v1/objectinsights/7"
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(url)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(context.exception.code, 503)
+        self.assertEqual(context.exception.headers["Retry-After"], "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from fundatracker import funda
+from fundatracker.freshness import InsightsRefreshPolicy
+from tests.test_checkpoint import ListSink, make_page
+
+NOW = datetime.datetime(2025, 2, 1, 12, 0)
+
+
+def make_hit(listing_id, publish_date="2025-01-01T00:00:00", availability="available"):
+    return {
+        "_id": listing_id,
+        "_source": {"publish_date": publish_date, "availability": availability},
+    }
+
+
+def stored_insights(hours_ago, views=10):
+    return {
+        "nr_of_views": views,
+        "nr_of_saves": 1,
+        "fetched_at": NOW - datetime.timedelta(hours=hours_ago),
+    }
+
+
+class TestInsightsRefreshPolicy(unittest.TestCase):
+    def setUp(self):
+        self.policy = InsightsRefreshPolicy(
+            max_age="6h", new_max_age="1h", inactive_max_age="7d"
+        )
+
+    def test_max_age(self):
+        """Test new listings get a shorter and inactive ones a longer age."""
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual(
+            self.policy.get_max_age(make_hit("1")["_source"], NOW), 6 * hour
+        )
+        self.assertEqual(
+            self.policy.get_max_age(
+                make_hit("1", publish_date="2025-02-01T10:00:00+01:00")["_source"],
+                NOW,
+            ),
+            hour,
+        )
+        self.assertEqual(
+            self.policy.get_max_age(
+                make_hit("1", availability="unavailable")["_source"], NOW
+            ),
+            7 * 24 * hour,
+        )
+
+    def test_get_fresh_insights(self):
+        """Test only stored insights younger than their max age are reused."""
+        hits = [
+            make_hit("fresh"),
+            make_hit("stale"),
+            make_hit("new", publish_date="2025-02-01T08:00:00"),
+            make_hit("sold", availability="unavailable"),
+            make_hit("unknown"),
+        ]
+        stored = {
+            "fresh": stored_insights(2, views=20),
+            "stale": stored_insights(8),
+            "new": stored_insights(2),
+            "sold": stored_insights(48),
+        }
+
+        fresh = self.policy.get_fresh_insights(hits, stored, now=NOW)
+
+        self.assertEqual(
+            fresh,
+            {
+                "fresh": {"nrOfViews": 20, "nrOfSaves": 1},
+                "sold": {"nrOfViews": 10, "nrOfSaves": 1},
+            },
+        )
+
+
+class InsightsSink(ListSink):
+    def __init__(self, stored):
+        super().__init__()
+        self.stored = stored
+        self.listings = {}
+        self.written_insights = []
+
+    def write(self, results):
+        self.listings.update({result.listing_id: result for result in results})
+        return super().write(results)
+
+    def load_listing_insights(self, listing_ids):
+        return {i: self.stored[i] for i in listing_ids if i in self.stored}
+
+    def write_listing_insights(self, insights):
+        self.written_insights += insights
+        return len(insights)
+
+
+@patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+class TestTrackerRefresh(unittest.TestCase):
+    def test_refresh_policy(self, *mocks):
+        """Test fresh stored insights are carried forward and stale ones fetched."""
+        now = datetime.datetime.now()
+        sink = InsightsSink(
+            {
+                "0": {"nr_of_views": 5, "nr_of_saves": 2, "fetched_at": now},
+                "1": {
+                    "nr_of_views": 5,
+                    "nr_of_saves": 2,
+                    "fetched_at": now - datetime.timedelta(days=1),
+                },
+            }
+        )
+
+        with (
+            patch(
+                "fundatracker.funda.get_results",
+                side_effect=lambda start_index=0, **query: make_page(start_index, 2),
+            ),
+            patch(
+                "fundatracker.funda.get_listing_insights",
+                return_value={"nrOfViews": 9, "nrOfSaves": 3},
+            ) as mock_insights,
+        ):
+            funda.tracker(
+                1011, 5, "now-30d", sink=sink, refresh_policy=InsightsRefreshPolicy()
+            )
+
+        # Stale insights are fetched again, not served from the insights cache
+        mock_insights.assert_called_once_with("1", use_cache=False)
+        self.assertEqual(sink.listings["0"]["listing_nr_of_views"], 5)
+        self.assertEqual(sink.listings["1"]["listing_nr_of_views"], 9)
+        self.assertEqual([row[:3] for row in sink.written_insights], [("1", 9, 3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,8 @@
+import json
 import os
 import sys
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 
 from fundatracker import funda
 from tests.fixtures import (
@@ -22,7 +23,8 @@ class TestFundaFunctions(unittest.TestCase):
         self.minimal_response = MINIMAL_RESPONSE
         self.empty_response = EMPTY_RESPONSE
 
-        funda.get_listing_insights.cache_clear()
+        funda.insights_cache.clear()
+        funda.metrics.reset()
 
     def test_get_funda_schema(self):
         """Test that get_funda_schema returns expected schema structure."""
@@ -53,8 +55,7 @@ class TestFundaFunctions(unittest.TestCase):
         self.assertEqual(schema["number_of_bedrooms"], "INTEGER")
         self.assertEqual(schema["price"], "INTEGER")
 
-    @patch("fundatracker.funda.requests.post")
-    @patch("fundatracker.funda.USER_AGENT", "Mozilla/5.0 Test Agent")
+    @patch("fundatracker.funda.search_client.post")
     def test_get_results_success(self, mock_post):
         """Test get_results function with successful response."""
 
@@ -66,25 +67,37 @@ class TestFundaFunctions(unittest.TestCase):
 
         result = funda.get_results(postal_code4=1000, km_radius=5)
 
-        # Check that requests.post was called
+        # Check that the search client was called
         mock_post.assert_called_once()
 
         # Check the result
         self.assertEqual(result, self.sample_response)
 
-        # Check headers were set correctly for new API
-        call_args = mock_post.call_args
-        headers = call_args[1]["headers"]
+        # Check the search endpoint was requested
+        self.assertEqual(mock_post.call_args[0][0], "/_msearch/template")
+
+        # Check headers are preset correctly on the client for new API
+        headers = funda.search_client.headers
         self.assertIn("User-Agent", headers)
         self.assertIn("accept", headers)
         self.assertIn("content-type", headers)
         self.assertIn("Referer", headers)
-        self.assertEqual(headers["User-Agent"], "Mozilla/5.0 Test Agent")
+        self.assertEqual(headers["User-Agent"], funda.USER_AGENT)
         self.assertEqual(headers["accept"], "application/json")
         self.assertEqual(headers["content-type"], "application/json")
         self.assertEqual(headers["Referer"], "https://www.funda.nl/")
 
-    @patch("fundatracker.funda.requests.post")
+    def test_clients_preset_headers(self):
+        """Test insight requests are authorised through the client headers."""
+        self.assertEqual(
+            funda.insights_client.headers["Authorization"],
+            funda.get_authorization_key(),
+        )
+        self.assertEqual(
+            funda.insights_client.base_url, "https://marketinsights.funda.io"
+        )
+
+    @patch("fundatracker.funda.search_client.post")
     def test_get_results_failure(self, mock_post):
         """Test get_results function with failed response."""
         # Mock failed response
@@ -99,7 +112,7 @@ class TestFundaFunctions(unittest.TestCase):
         self.assertIn("Failed to get results from funda", str(context.exception))
         self.assertIn("400", str(context.exception))
 
-    @patch("fundatracker.funda.requests.post")
+    @patch("fundatracker.funda.search_client.post")
     def test_get_results_parameters(self, mock_post):
         """Test get_results function parameter validation and query building."""
         mock_response = Mock()
@@ -128,8 +141,6 @@ class TestFundaFunctions(unittest.TestCase):
         lines = request_body.strip().split("\n")
         self.assertEqual(len(lines), 2)
 
-        import json
-
         index_line = json.loads(lines[0])
         query_line = json.loads(lines[1])
 
@@ -144,6 +155,183 @@ class TestFundaFunctions(unittest.TestCase):
         self.assertEqual(params["publication_date"], {"3": True})
         self.assertEqual(params["page"]["from"], 50)
 
+    @patch("fundatracker.funda.search_client.post")
+    def test_get_results_batch(self, mock_post):
+        """Test several searches are packed into one _msearch request."""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "responses": [{"hits": {"hits": [], "total": {"value": i}}} for i in (1, 2)]
+        }
+        mock_post.return_value = mock_response
+
+        results = funda.get_results_batch(
+            [
+                {"postal_code4": 1000, "km_radius": 5, "start_index": 100},
+                {"postal_code4": 3511, "offering_type": "rent"},
+            ]
+        )
+
+        mock_post.assert_called_once()
+        lines = mock_post.call_args[1]["data"].strip().split("\n")
+        self.assertEqual(len(lines), 4)
+
+        first_query = json.loads(lines[1])["params"]
+        second_query = json.loads(lines[3])["params"]
+        self.assertEqual(first_query["page"]["from"], 100)
+        self.assertEqual(second_query["radius_search"]["id"], "3511-0")
+        self.assertEqual(second_query["offering_type"], "rent")
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[1]["responses"][0]["hits"]["total"]["value"], 2)
+
+    @patch("fundatracker.funda.search_client.post")
+    def test_get_results_batch_error(self, mock_post):
+        """Test get_results_batch raises when one of the searches fails."""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "responses": [{"hits": {"hits": []}}, {"error": "bad query"}]
+        }
+        mock_post.return_value = mock_response
+
+        with self.assertRaises(Exception) as context:
+            funda.get_results_batch([{"postal_code4": 1000}, {"postal_code4": 1001}])
+
+        self.assertIn("bad query", str(context.exception))
+
+    @patch("fundatracker.funda.get_results_batch")
+    @patch("fundatracker.funda.get_results")
+    def test_iter_result_pages_batched(self, mock_results, mock_batch):
+        """Test pages after the first one are fetched several at a time."""
+
+        def page(total, length):
+            return {
+                "responses": [
+                    {"hits": {"total": {"value": total}, "hits": [{}] * length}}
+                ]
+            }
+
+        mock_results.return_value = page(250, 100)
+        mock_batch.return_value = [page(250, 100), page(250, 50)]
+
+        pages = list(
+            funda.iter_result_pages({"postal_code4": 1000}, pages_per_request=3)
+        )
+
+        self.assertEqual([start for start, _ in pages], [0, 100, 200])
+        mock_results.assert_called_once()
+        mock_batch.assert_called_once()
+        self.assertEqual(
+            [q["start_index"] for q in mock_batch.call_args[0][0]], [100, 200]
+        )
+
+    @patch("fundatracker.funda.get_results")
+    def test_plan_query_slices(self, mock_results):
+        """Test searches above the result window are split until they fit."""
+
+        def fake_results(**query):
+            # Only slicing on both availability and zoning gets below 10k
+            total = 4000 if query.get("zoning") else 15000
+            return {"responses": [{"hits": {"total": {"value": total}, "hits": []}}]}
+
+        mock_results.side_effect = fake_results
+
+        slices = funda.plan_query_slices({"postal_code4": 1000, "km_radius": 50})
+
+        self.assertEqual(len(slices), 6)
+        self.assertEqual(
+            {(q["availability"][0], q["zoning"][0]) for q, _ in slices},
+            {(a, z) for a in funda.AVAILABILITY for z in funda.ZONING},
+        )
+        self.assertTrue(all(q["km_radius"] == 50 for q, _ in slices))
+
+    @patch("fundatracker.funda.get_results")
+    def test_plan_query_slices_small_query(self, mock_results):
+        """Test searches within the result window are not split."""
+        first_page = {"responses": [{"hits": {"total": {"value": 50}, "hits": []}}]}
+
+        slices = funda.plan_query_slices({"postal_code4": 1000}, first_page=first_page)
+
+        self.assertEqual(slices, [({"postal_code4": 1000}, first_page)])
+        mock_results.assert_not_called()
+
+    @patch("fundatracker.funda.get_results")
+    def test_iter_search_pages_truncated(self, mock_results):
+        """Test results of a slice past the result window are counted."""
+        # Every slice still has 10,050 results, even split on all dimensions
+        mock_results.return_value = {
+            "responses": [{"hits": {"total": {"value": 10050}, "hits": [{}] * 100}}]
+        }
+        truncated = {}
+
+        pages = list(
+            funda.iter_search_pages(
+                1000,
+                50,
+                "no_preference",
+                filters={"availability": ["available"], "zoning": ["residential"]},
+                truncated=truncated,
+            )
+        )
+
+        self.assertEqual(len(pages), 2 * 100)
+        self.assertEqual(
+            truncated,
+            {
+                "availability=available;zoning=residential;listing_type=single": 50,
+                "availability=available;zoning=residential;listing_type=group": 50,
+            },
+        )
+
+    def test_drop_seen_hits(self):
+        """Test hits seen in an earlier slice or page are dropped."""
+        seen_ids = {"6965113"}
+        res = funda.drop_seen_hits(self.sample_response, seen_ids)
+        self.assertEqual(res["responses"][0]["hits"]["hits"], [])
+
+        seen_ids = set()
+        res = funda.drop_seen_hits(self.sample_response, seen_ids)
+        self.assertEqual(len(res["responses"][0]["hits"]["hits"]), 1)
+        self.assertEqual(seen_ids, {"6965113"})
+
+    def test_get_content_hash(self):
+        """Test the content hash ignores attributes the parser doesn't use."""
+        source = self.sample_response["responses"][0]["hits"]["hits"][0]["_source"]
+
+        content_hash = funda.get_content_hash(source)
+
+        self.assertEqual(
+            content_hash, funda.get_content_hash({**source, "thumbnail_id": [1]})
+        )
+        self.assertNotEqual(
+            content_hash, funda.get_content_hash({**source, "status": "sold"})
+        )
+
+    def test_drop_unchanged_hits(self):
+        """Test hits matching their stored content hash are dropped."""
+        hit = self.sample_response["responses"][0]["hits"]["hits"][0]
+        known_hashes = {"6965113": funda.get_content_hash(hit["_source"])}
+
+        res = funda.drop_unchanged_hits(self.sample_response, known_hashes)
+        self.assertEqual(res["responses"][0]["hits"]["hits"], [])
+
+        res = funda.drop_unchanged_hits(self.sample_response, {"6965113": "old"})
+        self.assertEqual(len(res["responses"][0]["hits"]["hits"]), 1)
+
+    def test_load_known_hashes(self):
+        """Test the latest hashes are loaded for the search query."""
+        conn = Mock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [("1", "abc"), ("2", "def")]
+
+        known_hashes = funda.load_known_hashes(conn, "funda", "1000~5~now-1d")
+
+        self.assertEqual(known_hashes, {"1": "abc", "2": "def"})
+        query, params = cursor.execute.call_args[0]
+        self.assertIn("DISTINCT ON (listing_id)", query)
+        self.assertEqual(params, ("1000~5~now-1d",))
+
     @patch("fundatracker.funda.get_neighbourhood_insights")
     def test_parse_funda_results(self, mock_neighbourhood_insights):
         """Test parse_funda_results with the new API format."""
@@ -214,7 +402,7 @@ class TestFundaFunctions(unittest.TestCase):
 
         self.assertIn("Failed to parse results", str(context.exception))
 
-    @patch("fundatracker.funda.requests.get")
+    @patch("fundatracker.funda.insights_client.get")
     def test_get_listing_insights_success(self, mock_get):
         """Test get_listing_insights with successful response."""
         mock_response = Mock()
@@ -230,10 +418,10 @@ class TestFundaFunctions(unittest.TestCase):
 
         # Check URL construction
         call_args = mock_get.call_args
-        expected_url = "https://marketinsights.funda.io/v1/objectinsights/12345"
+        expected_url = "/v1/objectinsights/12345"
         self.assertEqual(call_args[0][0], expected_url)
 
-    @patch("fundatracker.funda.requests.get")
+    @patch("fundatracker.funda.insights_client.get")
     def test_get_listing_insights_no_content(self, mock_get):
         """Test get_listing_insights with 204 response."""
         mock_response = Mock()
@@ -244,7 +432,7 @@ class TestFundaFunctions(unittest.TestCase):
 
         self.assertEqual(result, {})
 
-    @patch("fundatracker.funda.requests.get")
+    @patch("fundatracker.funda.insights_client.get")
     def test_get_listing_insights_error(self, mock_get):
         """Test get_listing_insights with error response."""
         mock_response = Mock()
@@ -257,7 +445,43 @@ class TestFundaFunctions(unittest.TestCase):
         # Should return empty dict on error
         self.assertEqual(result, {})
 
-    @patch("fundatracker.funda.requests.get")
+    @patch("fundatracker.funda.insights_client.get")
+    def test_get_listing_insights_cached(self, mock_get):
+        """Test successful insights are cached and errors are not."""
+        error_response = Mock(status_code=500, text="Internal Server Error")
+        ok_response = Mock(status_code=200)
+        ok_response.json.return_value = {"nrOfViews": 150, "nrOfSaves": 25}
+        mock_get.side_effect = [error_response, ok_response]
+
+        self.assertEqual(funda.get_listing_insights("12345"), {})
+        self.assertEqual(funda.get_listing_insights("12345")["nrOfViews"], 150)
+        self.assertEqual(funda.get_listing_insights("12345")["nrOfViews"], 150)
+
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("fundatracker.funda.insights_client.get")
+    def test_get_listing_insights_metrics(self, mock_get):
+        """Test requests and cache lookups are counted per endpoint."""
+        error_response = Mock(status_code=500, text="Internal Server Error")
+        ok_response = Mock(status_code=200)
+        ok_response.json.return_value = {"nrOfViews": 150}
+        mock_get.side_effect = [error_response, ok_response]
+
+        for _ in range(3):
+            funda.get_listing_insights("12345")
+
+        def get(name, **labels):
+            return funda.metrics.get(name, **labels)
+
+        endpoint = {"endpoint": "listing_insights"}
+        self.assertEqual(get("http_requests_total", status=500, **endpoint), 1)
+        self.assertEqual(get("http_requests_total", status=200, **endpoint), 1)
+        self.assertEqual(get("http_request_seconds", **endpoint).count, 2)
+        namespace = {"namespace": "listing_insights"}
+        self.assertEqual(get("cache_lookups_total", result="miss", **namespace), 2)
+        self.assertEqual(get("cache_lookups_total", result="hit", **namespace), 1)
+
+    @patch("fundatracker.funda.insights_client.get")
     @patch("fundatracker.funda.xxhash.xxh64")
     def test_get_neighbourhood_insights_success(self, mock_xxhash, mock_get):
         """Test get_neighbourhood_insights with successful response."""
@@ -283,7 +507,7 @@ class TestFundaFunctions(unittest.TestCase):
 
         # Check URL construction
         call_args = mock_get.call_args
-        expected_url = "https://marketinsights.funda.io/v2/LocalInsights/preview/Amsterdam/Landlust"
+        expected_url = "/v2/LocalInsights/preview/Amsterdam/Landlust"
         self.assertEqual(call_args[0][0], expected_url)
 
     @patch("fundatracker.funda.get_neighbourhood_insights")
@@ -327,7 +551,44 @@ class TestFundaFunctions(unittest.TestCase):
         self.assertEqual(parsed_listing["listing_nr_of_saves"], 20)
 
         # Verify the insights function was called with correct ID
-        mock_listing_insights.assert_called_once_with("6965113")
+        mock_listing_insights.assert_called_once_with("6965113", use_cache=True)
+
+    @patch("fundatracker.funda.get_neighbourhood_insights")
+    @patch("fundatracker.funda.get_listing_insights")
+    def test_parse_funda_results_concurrent_insights(
+        self, mock_listing_insights, mock_neighbourhood_insights
+    ):
+        """Test that concurrent insight fetching yields the same rows."""
+        mock_neighbourhood_insights.return_value = {"inhabitants": 50000}
+        mock_listing_insights.side_effect = lambda listing_id, use_cache: {
+            "nrOfViews": 100,
+            "nrOfSaves": 20,
+        }
+
+        sequential = funda.parse_funda_results(self.sample_response)
+        concurrent = funda.parse_funda_results(
+            self.sample_response, insights_concurrency=4
+        )
+
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual(concurrent[0]["listing_nr_of_views"], 100)
+
+    @patch("fundatracker.funda.get_listing_insights")
+    def test_prefetch_listing_insights(self, mock_listing_insights):
+        """Test prefetching deduplicates ids and captures exceptions."""
+
+        def fake_insights(listing_id, use_cache=True):
+            if listing_id == "bad":
+                raise ValueError("boom")
+            return {"nrOfViews": 1, "nrOfSaves": 2}
+
+        mock_listing_insights.side_effect = fake_insights
+
+        result = funda.prefetch_listing_insights(["a", "a", "bad"], max_workers=2)
+
+        self.assertEqual(mock_listing_insights.call_count, 2)
+        self.assertEqual(result["a"], {"nrOfViews": 1, "nrOfSaves": 2})
+        self.assertIsInstance(result["bad"], ValueError)
 
     def test_parse_funda_results_edge_cases(self):
         """Test parse_funda_results with edge cases and unusual data structures."""
@@ -354,6 +615,123 @@ class TestFundaFunctions(unittest.TestCase):
         self.assertEqual(parsed["construction_date_range"], "1980~1990")
         self.assertEqual(parsed["description"], "Mooie woning")
 
+    def test_store_results_counts(self):
+        """Test store_results reports inserted and skipped rows."""
+        conn = Mock()
+        cursor = conn.cursor.return_value
+        type(cursor).rowcount = property(lambda _: next(rowcounts))
+        rowcounts = iter([1, 0])
+
+        counts = funda.store_results(
+            [{"listing_id": "1"}, {"listing_id": "2"}], "funda", conn
+        )
+
+        self.assertEqual(counts, {"inserted": 1, "skipped": 1, "failed": 0})
+        self.assertEqual(cursor.execute.call_count, 2)
+
+    def test_store_results_batch(self):
+        """Test batched store_results writes a page in one executemany."""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.rowcount = 1
+
+        counts = funda.store_results(
+            [{"listing_id": "1"}, {"listing_id": "2", "listing_nr_of_views": 5}],
+            "funda",
+            conn,
+            batch=True,
+        )
+
+        self.assertEqual(counts, {"inserted": 1, "skipped": 1, "failed": 0})
+        conn.transaction.assert_called_once()
+        cursor.executemany.assert_called_once()
+
+        query, params = cursor.executemany.call_args[0]
+        self.assertIn("ON CONFLICT (id) DO NOTHING", query)
+        columns = list(funda.get_funda_schema().keys())
+        self.assertEqual(len(params), 2)
+        self.assertTrue(all(len(row) == len(columns) for row in params))
+        self.assertEqual(params[1][columns.index("listing_nr_of_views")], 5)
+        self.assertIsNone(params[0][columns.index("listing_nr_of_views")])
+
+    def test_store_results_partitioned(self):
+        """Test rows for a partitioned table are checked against all partitions."""
+        conn = MagicMock()
+
+        funda.store_results(
+            [{"listing_id": "1"}], "funda", conn, batch=True, partitioned=True
+        )
+
+        cursor = conn.cursor.return_value
+        lock_query, (ids,) = cursor.execute.call_args[0]
+        self.assertIn("pg_advisory_xact_lock", lock_query)
+        self.assertEqual(len(ids), 1)
+
+        query, params = cursor.executemany.call_args[0]
+        self.assertEqual(params[0][0], ids[0])
+        self.assertIn("WHERE funda.id = new.id", query)
+        self.assertIn("ON CONFLICT DO NOTHING", query)
+        self.assertIn("%s::INTEGER", query)
+        self.assertNotIn("VARCHAR(", query)
+        self.assertEqual(query.count("%s"), len(funda.get_funda_schema()))
+
+    def test_store_results_batch_failure(self):
+        """Test a failing batch is reported as failed rows."""
+        conn = MagicMock()
+        conn.cursor.return_value.executemany.side_effect = Exception("db down")
+
+        counts = funda.store_results([{"listing_id": "1"}], "funda", conn, batch=True)
+
+        self.assertEqual(counts, {"inserted": 0, "skipped": 0, "failed": 1})
+
+    def test_listing_record(self):
+        """Test the listing record behaves like the dict rows it replaces."""
+        record = funda.ListingRecord(listing_id="1", price=375000)
+
+        self.assertEqual(record["price"], 375000)
+        self.assertIsNone(record["listing_nr_of_views"])
+        self.assertEqual(list(record.keys()), list(funda.get_funda_schema().keys()))
+        self.assertEqual({**record}["listing_id"], "1")
+
+        record["search_query"] = "1000~5~now-1d"
+        self.assertEqual(record.search_query, "1000~5~now-1d")
+        self.assertFalse(hasattr(record, "__dict__"))
+
+        with self.assertRaises(KeyError):
+            record["unknown"] = 1
+        with self.assertRaises(KeyError):
+            funda.ListingRecord(unknown=1)
+
+    def test_prepare_row_in_place(self):
+        """Test storing metadata is set on the record without copying it."""
+        record = funda.ListingRecord(listing_id="1")
+        data_values = record.data_values()
+
+        row = funda.prepare_row(record)
+
+        self.assertIs(row, record)
+        self.assertEqual(
+            row.id, funda.xxhash.xxh64("~~".join(map(str, data_values))).hexdigest()
+        )
+        self.assertEqual(row._run_id, funda.get_run_id())
+
+    @patch("fundatracker.funda.get_neighbourhood_insights")
+    def test_parse_funda_results_sample_formats(self, mock_insights):
+        """Test both the old and new format samples are parsed."""
+        mock_insights.return_value = {}
+        samples_dir = os.path.join(os.path.dirname(__file__), "..", "samples")
+
+        for name, expected in [
+            ("full-hit-result-new.json", 1),
+            ("full-hit-result-old.json", 100),
+        ]:
+            with open(os.path.join(samples_dir, name)) as f:
+                result = funda.parse_funda_results(
+                    json.load(f), use_listing_insights=False
+                )
+            self.assertEqual(len(result), expected)
+            self.assertTrue(all(r["address_postal_code"] for r in result))
+
 
 if __name__ == "__main__":
     # Run tests with more verbose output
@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fundatracker import funda
+from fundatracker.metrics import Metrics
+from tests.test_checkpoint import ListSink, make_page
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counters_and_gauges(self):
+        """Test counters accumulate per label set and gauges are replaced."""
+        metrics = Metrics("run-1")
+        metrics.inc("rows_total", 3, result="inserted")
+        metrics.inc("rows_total", 2, result="inserted")
+        metrics.inc("rows_total", result="skipped")
+        metrics.set("run_duration_seconds", 1.5)
+        metrics.set("run_duration_seconds", 2.5)
+
+        self.assertEqual(metrics.get("rows_total", result="inserted"), 5)
+        self.assertEqual(metrics.get("rows_total", result="skipped"), 1)
+        self.assertEqual(metrics.get("run_duration_seconds"), 2.5)
+
+    def test_type_conflict(self):
+        """Test a metric name can't be used as two different types."""
+        metrics = Metrics("run-1")
+        metrics.inc("rows_total")
+
+        with self.assertRaises(ValueError):
+            metrics.set("rows_total", 1)
+
+    def test_to_prometheus(self):
+        """Test the textfile format with run_id labels and cumulative buckets."""
+        metrics = Metrics("run-1")
+        metrics.inc("http_requests_total", endpoint="search", status=200)
+        metrics.observe("http_request_seconds", 0.07, endpoint="search")
+        metrics.observe("http_request_seconds", 0.3, endpoint="search")
+        metrics.observe("http_request_seconds", 60, endpoint="search")
+
+        lines = metrics.to_prometheus().splitlines()
+
+        self.assertIn("# TYPE fundatracker_http_requests_total counter", lines)
+        self.assertIn(
+            'fundatracker_http_requests_total{run_id="run-1",endpoint="search",'
+            'status="200"} 1',
+            lines,
+        )
+        self.assertIn("# TYPE fundatracker_http_request_seconds histogram", lines)
+        labels = 'run_id="run-1",endpoint="search"'
+        self.assertIn(
+            f'fundatracker_http_request_seconds_bucket{{{labels},le="0.1"}} 1', lines
+        )
+        self.assertIn(
+            f'fundatracker_http_request_seconds_bucket{{{labels},le="0.5"}} 2', lines
+        )
+        self.assertIn(
+            f'fundatracker_http_request_seconds_bucket{{{labels},le="+Inf"}} 3', lines
+        )
+        self.assertIn(f"fundatracker_http_request_seconds_count{{{labels}}} 3", lines)
+
+    def test_timer(self):
+        """Test the timer observes once, also when the block raises."""
+        metrics = Metrics("run-1")
+        with metrics.timer("parse_page_seconds"):
+            pass
+        with self.assertRaises(RuntimeError), metrics.timer("parse_page_seconds"):
+            raise RuntimeError
+
+        self.assertEqual(metrics.get("parse_page_seconds").count, 2)
+
+    def test_write_files(self):
+        """Test the textfile and JSON summary are written."""
+        metrics = Metrics("run-1")
+        metrics.inc("rows_total", 4, result="inserted")
+        metrics.observe("store_page_seconds", 0.2)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            textfile = os.path.join(tmpdir, "metrics", "funda.prom")
+            json_path = os.path.join(tmpdir, "metrics.json")
+            metrics.write_textfile(textfile)
+            metrics.write_json(json_path)
+
+            with open(textfile) as f:
+                self.assertIn("fundatracker_rows_total", f.read())
+            with open(json_path) as f:
+                summary = json.load(f)
+            self.assertFalse(os.path.exists(f"{textfile}.tmp"))
+
+        self.assertEqual(summary["run_id"], "run-1")
+        self.assertEqual(
+            summary["metrics"]["rows_total"],
+            [{"labels": {"result": "inserted"}, "value": 4}],
+        )
+        self.assertEqual(
+            summary["metrics"]["store_page_seconds"][0]["value"]["count"], 1
+        )
+
+
+@patch("fundatracker.funda.get_listing_insights", return_value={})
+@patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+class TestTrackerMetrics(unittest.TestCase):
+    def setUp(self):
+        funda.metrics.reset()
+
+    def test_run_gauges_per_search(self, *mocks):
+        """Test every search of a run keeps its own duration and success."""
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 2),
+        ):
+            funda.tracker(1011, 5, "now-30d", sink=ListSink())
+            funda.tracker(1012, 5, "now-30d", sink=ListSink())
+
+        for search_query in ["1011~5~now-30d", "1012~5~now-30d"]:
+            self.assertEqual(
+                funda.metrics.get("run_success", search_query=search_query), 1
+            )
+            self.assertIsNotNone(
+                funda.metrics.get("run_duration_seconds", search_query=search_query)
+            )
+
+    def test_truncated_results(self, *mocks):
+        """Test results past the result window are counted and returned."""
+        with (
+            patch("fundatracker.funda.ES_MAX_RESULT_WINDOW", 200),
+            patch(
+                "fundatracker.funda.get_results",
+                side_effect=lambda start_index=0, **query: make_page(
+                    start_index, 250, page_size=100
+                ),
+            ),
+        ):
+            truncated = funda.tracker(
+                1011, 5, "now-30d", sink=ListSink(), split_queries=False
+            )
+
+        self.assertEqual(truncated, {"*": 50})
+        self.assertEqual(
+            funda.metrics.get(
+                "results_truncated_total", search_query="1011~5~now-30d", slice="*"
+            ),
+            50,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
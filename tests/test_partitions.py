@@ -0,0 +1,92 @@
+import datetime
+import unittest
+from unittest.mock import MagicMock
+
+from fundatracker import partitions
+
+
+def get_queries(conn):
+    return [call[0][0] for call in conn.cursor.return_value.execute.call_args_list]
+
+
+class TestPartitions(unittest.TestCase):
+    def test_months(self):
+        """Test month arithmetic and partition names."""
+        month = partitions.get_month(datetime.datetime(2024, 12, 31, 23, 59))
+        self.assertEqual(month, datetime.date(2024, 12, 1))
+        self.assertEqual(partitions.add_months(month, 1), datetime.date(2025, 1, 1))
+        self.assertEqual(partitions.add_months(month, -12), datetime.date(2023, 12, 1))
+
+        name = partitions.get_partition_name("funda", month)
+        self.assertEqual(name, "funda_p2024_12")
+        self.assertEqual(partitions.parse_partition_name("funda", name), month)
+        self.assertIsNone(partitions.parse_partition_name("funda", "funda_old"))
+
+    def test_setup_partitioned_table(self):
+        """Test the table, its indexes and the coming partitions are created."""
+        conn = MagicMock()
+        conn.cursor.return_value.fetchone.return_value = None
+
+        partitions.setup_partitioned_table(
+            "funda",
+            {
+                "id": "VARCHAR(100) PRIMARY KEY",
+                "listing_id": "VARCHAR(100)",
+                "_processing_time": "TIMESTAMP",
+            },
+            conn,
+        )
+
+        queries = get_queries(conn)
+        create = queries[1]
+        self.assertIn("id VARCHAR(100),", create)
+        self.assertIn("PRIMARY KEY (id, _processing_time)", create)
+        self.assertIn("PARTITION BY RANGE (_processing_time)", create)
+        self.assertIn(
+            "CREATE INDEX IF NOT EXISTS funda_listing_id_idx ON funda(listing_id)",
+            queries,
+        )
+        partition_queries = [q for q in queries if "PARTITION OF funda" in q]
+        self.assertEqual(len(partition_queries), 2)
+
+    def test_setup_refuses_unpartitioned_table(self):
+        """Test an existing plain table has to be migrated first."""
+        conn = MagicMock()
+        conn.cursor.return_value.fetchone.return_value = ("r",)
+
+        with self.assertRaises(RuntimeError):
+            partitions.setup_partitioned_table("funda", {}, conn)
+
+    def test_ensure_partitions(self):
+        """Test partitions cover the current and next months."""
+        conn = MagicMock()
+
+        names = partitions.ensure_partitions(
+            conn, "funda", now=datetime.datetime(2024, 11, 15), months_ahead=2
+        )
+
+        self.assertEqual(names, ["funda_p2024_11", "funda_p2024_12", "funda_p2025_01"])
+        self.assertIn(
+            "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')", get_queries(conn)[1]
+        )
+
+    def test_drop_old_partitions(self):
+        """Test only partitions before the retention window are dropped."""
+        conn = MagicMock()
+        conn.cursor.return_value.fetchall.return_value = [
+            ("funda_p2024_03",),
+            ("funda_p2024_01",),
+            ("funda_p2024_02",),
+            ("funda_unpartitioned",),
+        ]
+
+        dropped = partitions.drop_old_partitions(
+            conn, "funda", 2, now=datetime.datetime(2024, 3, 10)
+        )
+
+        self.assertEqual(dropped, ["funda_p2024_01"])
+        self.assertEqual(get_queries(conn)[-1], "DROP TABLE funda_p2024_01")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+
+from fundatracker.pipeline import run_pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def test_run_pipeline_order_and_stats(self):
+        """Test items flow through all stages in order and are counted."""
+        stored = []
+
+        stats = run_pipeline(
+            range(10),
+            [("double", lambda x: x * 2), ("store", stored.append)],
+        )
+
+        self.assertEqual(stored, [x * 2 for x in range(10)])
+        self.assertEqual(set(stats), {"fetch", "double", "store"})
+        self.assertTrue(all(stage["items"] == 10 for stage in stats.values()))
+
+    def test_run_pipeline_overlaps_stages(self):
+        """Test stages run concurrently instead of one after the other."""
+        active = set()
+        overlapped = threading.Event()
+
+        def slow_stage(name):
+            def run(x):
+                active.add(name)
+                if len(active) > 1:
+                    overlapped.set()
+                time.sleep(0.02)
+                active.discard(name)
+                return x
+
+            return run
+
+        run_pipeline(
+            range(5), [("parse", slow_stage("parse")), ("store", slow_stage("store"))]
+        )
+
+        self.assertTrue(overlapped.is_set())
+
+    def test_run_pipeline_propagates_errors(self):
+        """Test an exception in a stage stops the pipeline and is re-raised."""
+
+        def fail_on_three(x):
+            if x == 3:
+                raise ValueError("bad page")
+            return x
+
+        def source():
+            yield from range(1000)
+
+        with self.assertRaises(ValueError):
+            run_pipeline(source(), [("parse", fail_on_three), ("store", lambda x: x)])
+
+    def test_run_pipeline_source_error(self):
+        """Test an exception while fetching is re-raised."""
+
+        def source():
+            yield 1
+            raise RuntimeError("fetch failed")
+
+        with self.assertRaises(RuntimeError):
+            run_pipeline(source(), [("store", lambda x: x)])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+
+from fundatracker import planner
+
+
+def make_grid(size=6, spacing_km=1.5, listings=100):
+    """Square grid of postal areas around Utrecht, row by row from 3500."""
+    step = spacing_km / 111.0
+    return [
+        planner.PostalArea(
+            3500 + row * size + col,
+            52.0 + row * step,
+            5.0 + col * step * 1.64,  # ~1 / cos(52°), keeps the grid square
+            province="Utrecht" if row < size // 2 else "Gelderland",
+            listings=listings,
+        )
+        for row in range(size)
+        for col in range(size)
+    ]
+
+
+def covered(searches):
+    return set().union(*(search.covers for search in searches))
+
+
+class TestPlanner(unittest.TestCase):
+    def test_haversine(self):
+        """Test distances between centroids in kilometers."""
+        # Amsterdam Centraal to Utrecht Centraal
+        distance = planner.haversine_km(52.3791, 4.9003, 52.0894, 5.1101)
+        self.assertAlmostEqual(distance, 35.0, delta=1.0)
+
+    def test_plan_covers_targets(self):
+        """Test the plan covers every target without redundant searches."""
+        areas = make_grid()
+        targets = [area for area in areas if area.province == "Utrecht"]
+
+        searches = planner.plan_searches(areas, targets)
+
+        target_codes = {area.postal_code for area in targets}
+        self.assertEqual(covered(searches) & target_codes, target_codes)
+        self.assertLess(len(searches), len(targets))
+        for search in searches:
+            others = [s for s in searches if s is not search]
+            self.assertNotEqual(covered(others), covered(searches))
+
+    def test_plan_fits_result_window(self):
+        """Test searches stay under the maximum number of results."""
+        areas = make_grid()
+
+        searches = planner.plan_searches(areas, areas, max_results=250)
+
+        self.assertTrue(all(s.estimated_results <= 250 for s in searches))
+        self.assertEqual(covered(searches), {area.postal_code for area in areas})
+
+    def test_estimate_cost(self):
+        """Test the cost estimate counts requests, overlap and search time."""
+        targets = make_grid(size=2)
+        searches = [
+            planner.PlannedSearch(3500, 2, [3500, 3501, 3502], 300),
+            planner.PlannedSearch(3503, 1, [3503], 100),
+        ]
+
+        cost = planner.estimate_cost(
+            searches, targets, results_per_page=15, search_rate=0.5
+        )
+
+        self.assertEqual(cost["searches"], 2)
+        self.assertEqual(cost["unique_listings"], 400)
+        self.assertEqual(cost["overlap"], 1.0)
+        # 20 + 7 pages, one request each
+        self.assertEqual(cost["search_requests"], 27)
+        self.assertEqual(cost["search_minutes"], 0.9)
+
+
+class TestPostalAreas(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "areas.csv")
+        with open(self.path, "w") as f:
+            f.write("postal_code,lat,lon,province,listings\n")
+            f.write("3511,52.0907,5.1214,Utrecht,120\n")
+            f.write("1011,52.3730,4.9020,Noord-Holland,\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_and_select(self):
+        """Test areas are read from CSV and selected by code or province."""
+        areas = planner.load_postal_areas(self.path)
+
+        self.assertEqual(areas[0].listings, 120)
+        self.assertIsNone(areas[1].listings)
+        self.assertEqual(
+            [a.postal_code for a in planner.select_targets(areas, province="utrecht")],
+            [3511],
+        )
+        with self.assertRaisesRegex(ValueError, "without a known location"):
+            planner.select_targets(areas, postal_codes=[9999])
+
+
+if __name__ == "__main__":
+    unittest.main()
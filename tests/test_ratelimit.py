@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from fundatracker.client import FundaClient
+from fundatracker.ratelimit import RateLimiter, parse_retry_after
+
+
+class TestRateLimiter(unittest.TestCase):
+    @patch("fundatracker.ratelimit.time.sleep")
+    @patch("fundatracker.ratelimit.time.monotonic", return_value=100.0)
+    def test_acquire_spaces_requests(self, mock_monotonic, mock_sleep):
+        """Test requests beyond the burst wait for the bucket to refill."""
+        limiter = RateLimiter(rate=2.0, burst=1)
+
+        limiter.acquire()
+        mock_sleep.assert_not_called()
+
+        limiter.acquire()
+        mock_sleep.assert_called_once_with(0.5)
+
+    def test_observe_aimd(self):
+        """Test the rate grows additively and shrinks multiplicatively."""
+        limiter = RateLimiter(rate=1.0, increase=0.5, decrease=0.5, max_rate=1.8)
+
+        limiter.observe(200, 0.1)
+        self.assertEqual(limiter.rate, 1.5)
+        limiter.observe(200, 0.1)
+        self.assertEqual(limiter.rate, 1.8)
+
+        limiter.observe(429, 0.1)
+        self.assertEqual(limiter.rate, 0.9)
+        limiter.observe(200, 10.0)
+        self.assertEqual(limiter.rate, 0.45)
+        self.assertEqual(limiter.stats["throttled"], 1)
+        self.assertEqual(limiter.stats["slow"], 1)
+
+    @patch("fundatracker.ratelimit.time.sleep")
+    def test_retry_after_blocks_requests(self, mock_sleep):
+        """Test a Retry-After pauses the following request."""
+        with patch("fundatracker.ratelimit.time.monotonic", return_value=100.0):
+            limiter = RateLimiter(rate=100.0, burst=10)
+            limiter.observe(503, 0.1, retry_after_sec=30)
+            limiter.acquire()
+
+        mock_sleep.assert_called_once_with(30.0)
+
+    def test_parse_retry_after(self):
+        """Test Retry-After headers in seconds and HTTP date format."""
+        self.assertEqual(parse_retry_after("120"), 120.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+class TestClientRetries(unittest.TestCase):
+    @patch("fundatracker.client.requests.Session")
+    def test_retries_throttled_requests(self, mock_session):
+        """Test throttled responses are retried and reported to the limiter."""
+        throttled = Mock(status_code=429, headers={"Retry-After": "1"})
+        ok = Mock(status_code=200, headers={})
+        mock_session.return_value.request.side_effect = [throttled, ok]
+        limiter = Mock()
+
+        client = FundaClient("https://example.com", rate_limiter=limiter)
+        res = client.get("/path")
+
+        self.assertIs(res, ok)
+        self.assertEqual(limiter.acquire.call_count, 2)
+        self.assertEqual(limiter.observe.call_args_list[0][0][0], 429)
+        self.assertEqual(limiter.observe.call_args_list[0][0][2], 1.0)
+        limiter.backoff.assert_not_called()
+
+    @patch("fundatracker.client.requests.Session")
+    def test_gives_up_after_max_retries(self, mock_session):
+        """Test the last failed response is returned once retries run out."""
+        failed = Mock(status_code=503, headers={})
+        mock_session.return_value.request.return_value = failed
+        limiter = Mock()
+
+        client = FundaClient("https://example.com", rate_limiter=limiter, max_retries=2)
+        res = client.get("/path")
+
+        self.assertIs(res, failed)
+        self.assertEqual(mock_session.return_value.request.call_count, 3)
+        self.assertEqual(limiter.backoff.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
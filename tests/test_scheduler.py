@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from fundatracker import scheduler
+from fundatracker.metrics import Metrics
+
+
+class FakeClock:
+    """Clock that moves forward a fixed step every time it is read."""
+
+    def __init__(self, start=0.0, step=1.0):
+        self.now = start
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class TestIntervals(unittest.TestCase):
+    def test_parse_interval(self):
+        """Test intervals are parsed into seconds."""
+        self.assertEqual(scheduler.parse_interval(90), 90.0)
+        self.assertEqual(scheduler.parse_interval("30s"), 30.0)
+        self.assertEqual(scheduler.parse_interval("15m"), 900.0)
+        self.assertEqual(scheduler.parse_interval("6h"), 21600.0)
+        self.assertEqual(scheduler.parse_interval("1d"), 86400.0)
+        with self.assertRaisesRegex(ValueError, "Invalid interval"):
+            scheduler.parse_interval("every day")
+
+    def test_get_next_run(self):
+        """Test runs are aligned to the interval grid shifted by the offset."""
+        day, hour = 86400, 3600
+        self.assertEqual(scheduler.get_next_run(10 * hour, day), day)
+        self.assertEqual(scheduler.get_next_run(5 * hour, day, 6 * hour), 6 * hour)
+        self.assertEqual(
+            scheduler.get_next_run(6 * hour, day, 6 * hour), day + 6 * hour
+        )
+        self.assertEqual(scheduler.get_next_run(7 * hour, 6 * hour), 12 * hour)
+
+
+class TestLoadJobs(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "jobs.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_jobs(self, jobs):
+        with open(self.path, "w") as f:
+            json.dump({"jobs": jobs}, f)
+
+    def test_load_jobs(self):
+        """Test jobs are read from JSON and named after their search."""
+        self.write_jobs(
+            [
+                {"postal_code": 1011, "km_radius": 5, "every": "6h", "jitter": "5m"},
+                {"name": "utrecht", "postal_code": 3511, "km_radius": 2},
+            ]
+        )
+
+        jobs = scheduler.load_jobs(self.path)
+
+        self.assertEqual([job.name for job in jobs], ["1011~5~now-30d", "utrecht"])
+        self.assertEqual(jobs[0].interval_sec, 21600.0)
+        self.assertEqual(jobs[0].jitter_sec, 300.0)
+        self.assertEqual(jobs[1].interval_sec, 86400.0)
+
+    def test_duplicate_names(self):
+        """Test jobs with the same name are rejected."""
+        self.write_jobs([{"postal_code": 1011, "km_radius": 5}] * 2)
+
+        with self.assertRaisesRegex(ValueError, "unique"):
+            scheduler.load_jobs(self.path)
+
+
+class TestScheduler(unittest.TestCase):
+    def test_runs_due_jobs(self):
+        """Test due jobs run until stopped, failures don't stop the scheduler."""
+        stop_event = threading.Event()
+        runs = []
+
+        def run_job(job):
+            runs.append(job.name)
+            if len(runs) == 3:
+                stop_event.set()
+            if job.name == "b":
+                raise ValueError("boom")
+
+        jobs = [
+            scheduler.Job("a", 1011, 5, every=10, run_on_start=True),
+            scheduler.Job("b", 3511, 5, every=10, run_on_start=True),
+        ]
+        metrics = Metrics("run-1")
+        stats = scheduler.Scheduler(
+            jobs,
+            run_job,
+            stop_event=stop_event,
+            metrics=metrics,
+            tick_sec=0,
+            clock=FakeClock(step=5),
+        ).run()
+
+        self.assertEqual(runs[:2], ["a", "b"])
+        self.assertGreaterEqual(stats["started"], 3)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(
+            metrics.get("scheduled_runs_total", job="b", result="failed"), 1
+        )
+
+    def test_skips_overlapping_runs(self):
+        """Test a job still running at its next run time is skipped."""
+        stop_event = threading.Event()
+        job_scheduler = None
+
+        def run_job(job):
+            # Keep running until the scheduler skipped the next run
+            while job_scheduler.stats["skipped"] == 0:
+                stop_event.wait(0.01)
+            stop_event.set()
+
+        jobs = [scheduler.Job("a", 1011, 5, every=1, run_on_start=True)]
+        job_scheduler = scheduler.Scheduler(
+            jobs,
+            run_job,
+            stop_event=stop_event,
+            tick_sec=0.01,
+            clock=FakeClock(step=1),
+        )
+        stats = job_scheduler.run()
+
+        self.assertEqual(stats["started"], 1)
+        self.assertEqual(stats["completed"], 1)
+        self.assertGreaterEqual(stats["skipped"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
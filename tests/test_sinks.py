@@ -0,0 +1,319 @@
+import contextlib
+import datetime
+import glob
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from fundatracker import funda, sinks
+from tests.fixtures import SAMPLE_RESPONSE
+from tests.test_checkpoint import make_page
+
+
+def parse_sample(search_query="1011~5~now-30d"):
+    with patch("fundatracker.funda.get_neighbourhood_insights", return_value={}):
+        records = funda.parse_funda_results(SAMPLE_RESPONSE, use_listing_insights=False)
+    for record in records:
+        record.search_query = search_query
+    return records
+
+
+class TestPostgresSink(unittest.TestCase):
+    def test_write(self):
+        """Test the Postgres sink stores pages with store_results."""
+        conn = Mock()
+        sink = sinks.PostgresSink(conn, "funda", batch=True)
+
+        with patch(
+            "fundatracker.funda.store_results", return_value={"inserted": 1}
+        ) as mock_store:
+            self.assertEqual(sink.write(["listing"]), {"inserted": 1})
+
+        mock_store.assert_called_once_with(
+            ["listing"], "funda", conn, batch=True, partitioned=False
+        )
+
+
+class FakeAsyncCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+
+    async def executemany(self, query, rows):
+        if self.connection.fail:
+            self.connection.broken = True
+            raise sinks.psycopg.OperationalError("server closed the connection")
+        self.connection.executed.append(list(rows))
+        self.rowcount = len(rows)
+
+
+class FakeAsyncConnection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.closed = False
+        self.broken = False
+        self.executed = []
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+    @contextlib.asynccontextmanager
+    async def pipeline(self):
+        yield
+
+    def cursor(self):
+        return FakeAsyncCursor(self)
+
+    async def close(self):
+        self.closed = True
+
+
+class TestAsyncPostgresSink(unittest.TestCase):
+    def test_write(self):
+        """Test pages are written in the background in order with callbacks."""
+        connection = FakeAsyncConnection()
+        stored = []
+
+        with patch(
+            "psycopg.AsyncConnection.connect", AsyncMock(return_value=connection)
+        ):
+            with sinks.AsyncPostgresSink("dbname=funda") as sink:
+                self.assertEqual(sink.write(parse_sample()), {"queued": 1})
+                sink.after_stored(lambda: stored.append(len(connection.executed)))
+                sink.write(parse_sample())
+                sink.flush()
+                self.assertEqual(stored, [1])
+
+        self.assertEqual(len(connection.executed), 2)
+        self.assertEqual(sink.stats["inserted"], 2)
+        self.assertTrue(connection.closed)
+
+    def test_reconnect(self):
+        """Test a page is retried on a new connection after losing one."""
+        lost, connection = FakeAsyncConnection(fail=True), FakeAsyncConnection()
+
+        with patch(
+            "psycopg.AsyncConnection.connect",
+            AsyncMock(side_effect=[lost, connection]),
+        ):
+            with sinks.AsyncPostgresSink("dbname=funda", reconnect_delay_sec=0) as sink:
+                sink.write(parse_sample())
+
+        self.assertEqual(sink.stats["reconnects"], 1)
+        self.assertEqual(sink.stats["inserted"], 1)
+        self.assertEqual(len(connection.executed), 1)
+
+    def test_failed_page_skips_callbacks(self):
+        """Test callbacks after a failed page are skipped and flush raises."""
+        stored = []
+
+        with patch(
+            "psycopg.AsyncConnection.connect",
+            AsyncMock(return_value=FakeAsyncConnection(fail=True)),
+        ):
+            sink = sinks.AsyncPostgresSink("dbname=funda", max_retries=0)
+            sink.write(parse_sample())
+            sink.after_stored(lambda: stored.append(1))
+            with self.assertRaisesRegex(RuntimeError, "1 pages failed"):
+                sink.flush()
+            sink.close()
+
+        self.assertEqual(stored, [])
+        self.assertEqual(sink.stats["failed"], 1)
+
+
+@unittest.skipIf(sinks.pa is None, "pyarrow is not installed")
+class TestParquetSink(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.run_date = datetime.date(2025, 1, 31)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_arrow_schema(self):
+        """Test every schema column gets an Arrow type."""
+        schema = sinks.get_arrow_schema()
+
+        self.assertEqual(schema.names, list(funda.get_funda_schema()))
+        self.assertEqual(str(schema.field("price").type), "int64")
+        self.assertEqual(str(schema.field("publish_date").type), "timestamp[us]")
+        self.assertEqual(str(schema.field("agent_id").type), "string")
+
+    def test_write_partitioned(self):
+        """Test pages are written as row groups of one file per partition."""
+        with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+            counts = sink.write(parse_sample())
+            sink.write(parse_sample())
+            sink.write(parse_sample("1012~5~now-30d"))
+
+        self.assertEqual(counts, {"inserted": 1, "skipped": 0, "failed": 0})
+        paths = glob.glob(
+            os.path.join(
+                self.tmpdir.name,
+                "funda",
+                "run_date=2025-01-31",
+                "search_query=1011~5~now-30d",
+                "*.parquet",
+            )
+        )
+        self.assertEqual(len(paths), 1)
+
+        parquet_file = sinks.pq.ParquetFile(paths[0])
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+        rows = parquet_file.read().to_pylist()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["listing_id"], "6965113")
+        self.assertEqual(rows[0]["price"], 375000)
+        self.assertEqual(rows[0]["_run_id"], funda.get_run_id())
+        self.assertIsInstance(rows[0]["publish_date"], datetime.datetime)
+
+    def test_job_runs_keep_their_files(self):
+        """Test two runs of the same scheduled job on one day both keep their rows."""
+        run_ids = []
+        for _ in range(2):
+            # Like `serve`, every run starts a run and gets its own sink
+            run_ids.append(funda.start_run())
+            with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+                sink.write(parse_sample())
+
+        paths = glob.glob(os.path.join(self.tmpdir.name, "funda", "*", "*", "*"))
+        rows = [row for path in paths for row in sinks.pq.read_table(path).to_pylist()]
+
+        self.assertEqual(len(paths), 2)
+        self.assertNotEqual(run_ids[0], run_ids[1])
+        self.assertEqual(sorted(row["_run_id"] for row in rows), sorted(run_ids))
+
+    @patch("fundatracker.funda.get_listing_insights", return_value={})
+    @patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+    def test_concurrent_runs_keep_their_ids(self, *mocks):
+        """Test jobs running at the same time each write with their own run id."""
+        started = threading.Barrier(2)
+        run_ids = {}
+
+        def run_job(postal_code):
+            run_ids[postal_code] = funda.start_run()
+            started.wait()
+            with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+                # Pages are stored by the pipeline's own threads
+                funda.tracker(postal_code, 5, "now-30d", sink=sink, pipelined=True)
+
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 4),
+        ):
+            threads = [
+                threading.Thread(target=run_job, args=(postal_code,))
+                for postal_code in (1011, 1012)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        for postal_code, run_id in run_ids.items():
+            directory = sinks.ParquetSink(
+                self.tmpdir.name, run_date=self.run_date
+            ).partition_dir(f"{postal_code}~5~now-30d")
+            paths = glob.glob(os.path.join(directory, "*.parquet"))
+            rows = sinks.pq.read_table(paths[0]).to_pylist()
+            self.assertIn(run_id, paths[0])
+            self.assertEqual({row["_run_id"] for row in rows}, {run_id})
+        self.assertNotEqual(run_ids[1011], run_ids[1012])
+
+    def test_load_known_hashes(self):
+        """Test delta mode reads the latest hash per listing from earlier files."""
+        with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+            sink.write(parse_sample())
+
+        sink = sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date)
+        known_hashes = sink.load_known_hashes("1011~5~now-30d")
+
+        records = parse_sample()
+        self.assertEqual(
+            known_hashes,
+            {record.listing_id: record.content_hash for record in records},
+        )
+        self.assertEqual(sink.load_known_hashes("1012~5~now-30d"), {})
+
+    def test_history_days(self):
+        """Test only files of recent run dates are read back."""
+        with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+            sink.write(parse_sample())
+
+        later = self.run_date + datetime.timedelta(days=31)
+        recent = sinks.ParquetSink(self.tmpdir.name, run_date=later, history_days=31)
+        old = sinks.ParquetSink(self.tmpdir.name, run_date=later, history_days=30)
+        everything = sinks.ParquetSink(
+            self.tmpdir.name, run_date=later, history_days=None
+        )
+
+        self.assertEqual(len(recent.load_known_hashes("1011~5~now-30d")), 1)
+        self.assertEqual(old.load_known_hashes("1011~5~now-30d"), {})
+        self.assertEqual(len(everything.load_known_hashes("1011~5~now-30d")), 1)
+
+    def test_write_search_listings(self):
+        """Test links to other searches are written to their own table."""
+        with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+            self.assertEqual(
+                sink.write_search_listings("1012~5~now-30d", ["6965113"]), 1
+            )
+
+        paths = glob.glob(
+            os.path.join(self.tmpdir.name, "funda_search_listings", "*", "*.parquet")
+        )
+        rows = sinks.pq.read_table(paths[0]).to_pylist()
+        self.assertEqual(rows[0]["search_query"], "1012~5~now-30d")
+        self.assertEqual(rows[0]["listing_id"], "6965113")
+
+    def test_listing_insights(self):
+        """Test fetched insights are read back by a later sink."""
+        fetched_at = datetime.datetime(2025, 1, 31, 12, 0)
+        with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+            sink.write_listing_insights([("6965113", 120, 4, fetched_at)])
+
+        sink = sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date)
+        insights = sink.load_listing_insights(["6965113", "1"])
+
+        self.assertEqual(
+            insights,
+            {
+                "6965113": {
+                    "listing_id": "6965113",
+                    "nr_of_views": 120,
+                    "nr_of_saves": 4,
+                    "fetched_at": fetched_at,
+                }
+            },
+        )
+
+    def test_listing_state_and_events(self):
+        """Test listing states are read back by a later sink, events are kept."""
+        updated_at = datetime.datetime(2025, 1, 31, 12, 0)
+        with sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date) as sink:
+            sink.write_listing_state(
+                [("6965113", 450000, "available", "available", "abc", updated_at)]
+            )
+            sink.write_listing_events(
+                [
+                    ("6965113", "listed", None, 450000, None, "available", None)
+                    + ("available", None, "/koop/x", "1011~5~now-30d", updated_at, "r")
+                ]
+            )
+
+        sink = sinks.ParquetSink(self.tmpdir.name, run_date=self.run_date)
+        state = sink.load_listing_state(["6965113"])
+        events = sinks.pq.read_table(
+            os.path.join(self.tmpdir.name, "funda_listing_events")
+        ).to_pylist()
+
+        self.assertEqual(state["6965113"]["price"], 450000)
+        self.assertEqual(state["6965113"]["updated_at"], updated_at)
+        self.assertEqual(events[0]["event"], "listed")
+
+
+if __name__ == "__main__":
+    unittest.main()
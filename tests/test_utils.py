@@ -0,0 +1,28 @@
+import unittest
+from unittest.mock import Mock
+
+from fundatracker import utils
+
+
+class TestUtils(unittest.TestCase):
+    def test_db_setup_adds_new_columns(self):
+        """Test db_setup creates the table and adds missing columns."""
+        conn = Mock()
+        cursor = conn.cursor.return_value
+
+        utils.db_setup(
+            "funda",
+            {"id": "VARCHAR(100) PRIMARY KEY", "content_hash": "VARCHAR(100)"},
+            conn,
+        )
+
+        queries = [call[0][0] for call in cursor.execute.call_args_list]
+        self.assertIn("CREATE TABLE IF NOT EXISTS funda", queries[0])
+        self.assertEqual(
+            queries[1:],
+            ["ALTER TABLE funda ADD COLUMN IF NOT EXISTS content_hash VARCHAR(100)"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
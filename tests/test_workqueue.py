@@ -0,0 +1,137 @@
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from fundatracker import funda, workqueue
+from tests.test_checkpoint import ListSink, make_page
+
+
+def make_task(task_id=1, attempts=1, max_attempts=3, filters=None):
+    return workqueue.Task(task_id, 1011, 5, "now-30d", filters, attempts, max_attempts)
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.conn = Mock()
+        self.cursor = self.conn.cursor.return_value
+        self.queue = workqueue.WorkQueue(self.conn, retry_delay_sec=60)
+
+    def test_claim(self):
+        """Test claiming skips locked tasks and parses the returned row."""
+        self.cursor.fetchone.return_value = (
+            7,
+            1011,
+            5,
+            "now-30d",
+            '{"availability": "sold"}',
+            1,
+            3,
+        )
+
+        task = self.queue.claim("worker-1")
+
+        claim_sql = self.cursor.execute.call_args[0][0]
+        self.assertIn("FOR UPDATE SKIP LOCKED", claim_sql)
+        self.assertEqual(self.cursor.execute.call_args[0][1], ("worker-1", 300))
+        self.assertEqual(task.id, 7)
+        self.assertEqual(task.filters, {"availability": "sold"})
+
+    def test_claim_empty(self):
+        """Test claiming from an empty queue returns None."""
+        self.cursor.fetchone.return_value = None
+
+        self.assertIsNone(self.queue.claim("worker-1"))
+
+    def test_fail(self):
+        """Test failed tasks are retried with backoff until max attempts."""
+        self.assertTrue(self.queue.fail(make_task(attempts=2), "worker-1", "boom"))
+        self.assertEqual(
+            self.cursor.execute.call_args[0][1],
+            ("pending", "boom", 120, 1, "worker-1"),
+        )
+
+        self.assertFalse(self.queue.fail(make_task(attempts=3), "worker-1", "boom"))
+        self.assertEqual(self.cursor.execute.call_args[0][1][0], "failed")
+
+    def test_complete_own_task(self):
+        """Test only the worker still running a task can complete it."""
+        self.cursor.rowcount = 0
+
+        with self.assertLogs(level="WARNING"):
+            self.queue.complete(make_task(), "worker-1")
+
+        query, params = self.cursor.execute.call_args[0]
+        self.assertIn("AND worker_id = %s AND status = 'running'", query)
+        self.assertEqual(params, (1, "worker-1"))
+
+
+class TestRunWorker(unittest.TestCase):
+    def test_run_worker(self):
+        """Test the worker completes and fails tasks until the queue is empty."""
+        queue = Mock()
+        tasks = [make_task(1), make_task(2), None]
+        queue.claim.side_effect = tasks
+        queue.fail.return_value = True
+
+        def run_task(task):
+            if task.id == 2:
+                raise ValueError("boom")
+
+        stats = workqueue.run_worker(
+            queue, run_task, worker_id="worker-1", exit_when_empty=True
+        )
+
+        self.assertEqual(stats, {"completed": 1, "failed": 1})
+        queue.complete.assert_called_once_with(tasks[0], "worker-1")
+        self.assertEqual(queue.fail.call_args[0][:2], (tasks[1], "worker-1"))
+        self.assertIsInstance(queue.fail.call_args[0][2], ValueError)
+
+    @patch("fundatracker.funda.get_listing_insights", return_value={})
+    @patch("fundatracker.funda.get_neighbourhood_insights", return_value={})
+    def test_failed_page_fails_task(self, *mocks):
+        """Test a task with a page that failed to store is retried, not done."""
+        queue = Mock()
+        queue.claim.side_effect = [make_task(1), None]
+        queue.fail.return_value = True
+
+        class FailingSink(ListSink):
+            def write(self, results):
+                counts = super().write(results)
+                if results[0].listing_id == "2":
+                    return {"inserted": 0, "skipped": 0, "failed": len(results)}
+                return counts
+
+        def run_task(task):
+            funda.tracker(
+                task.postal_code,
+                task.km_radius,
+                task.publication_date,
+                sink=FailingSink(),
+            )
+
+        with patch(
+            "fundatracker.funda.get_results",
+            side_effect=lambda start_index=0, **query: make_page(start_index, 6),
+        ):
+            stats = workqueue.run_worker(
+                queue, run_task, worker_id="worker-1", exit_when_empty=True
+            )
+
+        self.assertEqual(stats, {"completed": 0, "failed": 1})
+        queue.complete.assert_not_called()
+        self.assertIsInstance(queue.fail.call_args[0][2], RuntimeError)
+
+    def test_stop_event(self):
+        """Test a stopped worker doesn't claim any more tasks."""
+        queue = Mock()
+        stop_event = threading.Event()
+        stop_event.set()
+
+        stats = workqueue.run_worker(queue, Mock(), stop_event=stop_event)
+
+        self.assertEqual(stats, {"completed": 0, "failed": 0})
+        queue.claim.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()